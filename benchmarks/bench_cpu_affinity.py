@@ -0,0 +1,84 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Compares model server style throughput with and without cpu pinning and thread budgeting.
+
+Starts one process per cpu, like ``SAGEMAKER_MODEL_SERVER_WORKERS`` does by default, and has
+each of them run numpy matrix multiplications (which use the BLAS thread pool) for a fixed
+amount of time. Usage::
+
+    python benchmarks/bench_cpu_affinity.py [--workers N] [--seconds S] [--size N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from container_support import affinity
+
+WORKER = """
+import sys, time
+import numpy as np
+from container_support import affinity
+
+cpus, seconds, size = sys.argv[1], float(sys.argv[2]), int(sys.argv[3])
+if cpus:
+    affinity.pin_to_cpus([int(c) for c in cpus.split(',')])
+a = np.random.rand(size, size)
+ops = 0
+end = time.time() + seconds
+while time.time() < end:
+    a.dot(a)
+    ops += 1
+print(ops)
+"""
+
+
+def run(workers, seconds, size, pinned):
+    env = dict(os.environ)
+    cpu_sets = [[]] * workers
+    if pinned:
+        affinity.set_thread_budget(affinity.threads_per_worker(workers), env)
+        cpu_sets = affinity.partition_cpus(workers)
+    else:
+        for name in affinity.THREAD_ENV_VARS:
+            env.pop(name, None)
+
+    procs = [subprocess.Popen([sys.executable, '-c', WORKER, ','.join(str(c) for c in cpus), str(seconds), str(size)],
+                              stdout=subprocess.PIPE, env=env) for cpus in cpu_sets]
+    return sum(int(p.communicate()[0]) for p in procs) / float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--size', type=int, default=256)
+    args = parser.parse_args()
+
+    print('workers: {}, cpus: {}, numa nodes: {}'.format(args.workers, len(affinity.available_cpus()),
+                                                         len(affinity.numa_nodes())))
+    baseline = run(args.workers, args.seconds, args.size, pinned=False)
+    print('unpinned, default threads: {:10.1f} matmul/s'.format(baseline))
+    pinned = run(args.workers, args.seconds, args.size, pinned=True)
+    print('pinned, thread budget:     {:10.1f} matmul/s ({:+.1f}%)'.format(pinned, 100.0 * (pinned / baseline - 1)))
+
+
+if __name__ == '__main__':
+    start = time.time()
+    main()
+    print('total time: {:.1f}s'.format(time.time() - start))
@@ -0,0 +1,90 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+
+"""Measures the per-call overhead of the ``retry`` decorator on calls that succeed at the first attempt.
+
+Compares an undecorated function, a Retrying object built on every call (what the decorator used to do),
+the decorator, and the decorator on a coroutine function. Usage::
+
+    python benchmarks/bench_retry_overhead.py [--calls N]
+"""
+
+import argparse
+import asyncio
+import timeit
+
+from container_support.retrying import Retrying, retry
+
+RETRY_ARGS = {'stop_max_attempt_number': 5, 'wait_exponential_multiplier': 100, 'wait_exponential_max': 10000}
+
+
+def noop():
+    return 1
+
+
+@retry(**RETRY_ARGS)
+def decorated():
+    return 1
+
+
+async def async_noop():
+    return 1
+
+
+@retry(**RETRY_ARGS)
+async def async_decorated():
+    return 1
+
+
+def per_call():
+    return Retrying(**RETRY_ARGS).call(noop)
+
+
+def measure(fn, calls):
+    return min(timeit.repeat(fn, number=calls, repeat=3)) / calls * 1e9
+
+
+def measure_async(fn, calls):
+    loop = asyncio.new_event_loop()
+
+    async def run():
+        for _ in range(calls):
+            await fn()
+
+    def once():
+        loop.run_until_complete(run())
+
+    try:
+        return min(timeit.repeat(once, number=1, repeat=3)) / calls * 1e9
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=100000)
+    args = parser.parse_args()
+
+    baseline = measure(noop, args.calls)
+    print('undecorated:                {:8.0f} ns/call'.format(baseline))
+    print('Retrying built per call:    {:8.0f} ns/call'.format(measure(per_call, args.calls)))
+    print('@retry:                     {:8.0f} ns/call'.format(measure(decorated, args.calls)))
+    async_baseline = measure_async(async_noop, args.calls)
+    print('undecorated coroutine:      {:8.0f} ns/call'.format(async_baseline))
+    print('@retry coroutine:           {:8.0f} ns/call'.format(measure_async(async_decorated, args.calls)))
+
+
+if __name__ == '__main__':
+    main()
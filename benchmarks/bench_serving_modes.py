@@ -0,0 +1,175 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Compares the latency and throughput of the three ways the model server can listen on port 8080:
+
+- nginx: nginx proxies to the gunicorn workers over a Unix socket (``SAGEMAKER_USE_NGINX=true``)
+- gunicorn: the gunicorn workers accept from a single listener (``SAGEMAKER_USE_NGINX=false``)
+- reuseport: every gunicorn worker binds its own listener with SO_REUSEPORT
+  (``SAGEMAKER_MODEL_SERVER_REUSE_PORT=true``)
+
+Every mode serves an identity transformer with the gevent workers and hooks of the model server, and is
+loaded by client threads sending small /invocations requests on keep-alive connections. Modes whose
+binaries are not installed are skipped. Usage::
+
+    python benchmarks/bench_serving_modes.py [--workers N] [--clients N] [--seconds S] [--size BYTES]
+
+Two runs with the defaults (2 workers, 16 clients, 10s, 64 byte bodies), nginx 1.31.3, on a host with a
+single vCPU shared by nginx, the workers and the clients::
+
+    mode       requests/s         p50            p99
+    nginx       835 /  952   15.5 / 15.9ms  67.5 / 55.0ms
+    gunicorn    962 / 1046    4.1 /  8.8ms  77.6 / 55.8ms
+    reuseport   920 /  920   19.4 / 19.8ms  52.0 / 48.7ms
+
+With one cpu, every mode is bound by the same core and the differences stay close to the run to run
+variation; reuseport has the lowest p99. The modes are expected to separate on hosts with a core per worker,
+where the benchmark should be run before choosing a mode.
+"""
+
+import argparse
+import http.client
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pkg_resources
+
+from container_support.serving import Server, Transformer
+
+app = Server('bench', Transformer()).app
+
+PORT = 8080
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def gunicorn(bind, workers, env):
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'python:container_support.gunicorn_config',
+                             '-k', 'gevent', '-b', bind, '-w', str(workers), '--chdir', BENCH_DIR,
+                             '--log-level', 'warning', 'bench_serving_modes:app'], env=env)
+
+
+def nginx(tmp):
+    conf = pkg_resources.resource_string('container_support', 'etc/nginx.conf').decode('utf-8')
+    conf = conf.replace('/var/log/nginx', tmp).replace('/tmp/nginx.pid', os.path.join(tmp, 'nginx.pid'))
+    if not os.path.exists('/etc/nginx/mime.types'):
+        # e.g. a standalone nginx binary
+        conf = conf.replace('include /etc/nginx/mime.types;', '')
+    path = os.path.join(tmp, 'nginx.conf')
+    with open(path, 'w') as f:
+        f.write(conf)
+    return subprocess.Popen(['nginx', '-c', path])
+
+
+def start(mode, workers, tmp):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in [os.path.join(BENCH_DIR, '..', 'src'), env.get('PYTHONPATH')] if p)
+    if mode == 'nginx':
+        return [nginx(tmp), gunicorn('unix:/tmp/gunicorn.sock', workers, env)]
+    if mode == 'gunicorn':
+        return [gunicorn('0.0.0.0:{}'.format(PORT), workers, env)]
+    env['SAGEMAKER_MODEL_SERVER_REUSE_PORT'] = 'true'
+    return [gunicorn('unix:' + os.path.join(tmp, 'gunicorn-master.sock'), workers, env)]
+
+
+def wait_ready(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=1)
+            connection.request('GET', '/ping')
+            if connection.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('the server did not start')
+
+
+def load(clients, seconds, body):
+    latencies = [[] for _ in range(clients)]
+    errors = [0]
+    deadline = time.time() + seconds
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def client(latency):
+        connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=10)
+        while time.time() < deadline:
+            start = time.time()
+            try:
+                connection.request('POST', '/invocations', body, headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                # nginx closes idle keep-alive connections
+                errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=10)
+                continue
+            latency.append(time.time() - start)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(latency,)) for latency in latencies]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    all_latencies = sorted(l for latency in latencies for l in latency)
+    return all_latencies, errors[0]
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--size', type=int, default=64, help='the size of the /invocations body')
+    parser.add_argument('--modes', default='nginx,gunicorn,reuseport')
+    args = parser.parse_args()
+
+    body = b'[' + b','.join([b'1'] * max(1, args.size // 2)) + b']'
+    for mode in args.modes.split(','):
+        if mode == 'nginx' and not shutil.which('nginx'):
+            print('{:10} skipped: nginx is not installed'.format(mode))
+            continue
+
+        tmp = tempfile.mkdtemp()
+        processes = start(mode, args.workers, tmp)
+        try:
+            wait_ready()
+            latencies, errors = load(args.clients, args.seconds, body)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        print('{:10} {:8.0f} requests/s   p50 {:6.2f}ms   p99 {:6.2f}ms   errors {}'.format(
+            mode, len(latencies) / args.seconds, percentile(latencies, 0.5), percentile(latencies, 0.99), errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Compares untar_directory with tarfile.extractall across compression formats and archive sizes.
+
+Usage::
+
+    python benchmarks/bench_untar.py [--sizes-mb 16 128 1024] [--file-kb 256]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from mock import patch
+
+from container_support import archive, utils
+
+
+def make_tar(size, file_size):
+    out = io.BytesIO()
+    # half random, half zeros: compresses roughly 2:1, like model weights and code
+    chunk = os.urandom(file_size // 2) + b'\0' * (file_size // 2)
+    with tarfile.open(fileobj=out, mode='w') as t:
+        for i in range(max(1, size // file_size)):
+            info = tarfile.TarInfo('dir{}/file{}.bin'.format(i % 16, i))
+            info.size = len(chunk)
+            t.addfile(info, io.BytesIO(chunk))
+    return out.getvalue()
+
+
+def compressors():
+    import bz2
+    import gzip
+    yield archive.GZIP, lambda data: gzip.compress(data, compresslevel=6)
+    yield archive.BZIP2, bz2.compress
+    try:
+        import lzma
+        yield archive.XZ, lambda data: lzma.compress(data, preset=1)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        yield archive.ZSTD, zstandard.ZstdCompressor().compress
+    except ImportError:
+        pass
+    try:
+        import lz4.frame
+        yield archive.LZ4, lz4.frame.compress
+    except ImportError:
+        pass
+    yield archive.TAR, lambda data: data
+
+
+def timed(fn, path):
+    out = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        fn(path, out)
+        return time.time() - start
+    finally:
+        shutil.rmtree(out)
+
+
+def baseline(path, out):
+    with tarfile.open(path, 'r:*') as t:
+        t.extractall(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[16, 128])
+    parser.add_argument('--file-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        print('{:>8} {:>6} {:>10} {:>14} {:>16}'.format('size MB', 'format', 'tarfile s', 'untar_dir s',
+                                                        'untar_dir (py) s'))
+        for size_mb in args.sizes_mb:
+            data = make_tar(size_mb * 1024 * 1024, args.file_kb * 1024)
+            for fmt, compress in compressors():
+                path = os.path.join(tmp, 'archive.' + fmt)
+                with open(path, 'wb') as f:
+                    f.write(compress(data))
+
+                base = timed(baseline, path) if fmt not in (archive.ZSTD, archive.LZ4) else float('nan')
+                fast = timed(utils.untar_directory, path)
+                with patch('container_support.archive.which', return_value=None):
+                    python_only = timed(utils.untar_directory, path)
+                print('{:>8} {:>6} {:>10.2f} {:>14.2f} {:>16.2f}'.format(size_mb, fmt, base, fast, python_only))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Measures the time the model server app takes to handle small requests, with the Flask app and with the
+raw WSGI app (``SAGEMAKER_MODEL_SERVER_RAW_WSGI=true``). The apps are called in process, without a server,
+with an identity transformer, so the difference is the overhead of the app. Usage::
+
+    python benchmarks/bench_wsgi.py [--requests N] [--size BYTES]
+"""
+
+import argparse
+import io
+import timeit
+
+from werkzeug.test import EnvironBuilder
+
+from container_support.serving import RawWsgiApp, Server, Transformer
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def request(app, path, method, body, headers):
+    environ = EnvironBuilder(path=path, method=method, data=body, headers=headers).get_environ()
+
+    def call():
+        env = environ.copy()
+        env['wsgi.input'] = io.BytesIO(body)
+        for _ in app(env, start_response):
+            pass
+
+    return call
+
+
+def measure(fn, requests):
+    return min(timeit.repeat(fn, number=requests, repeat=3)) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--size', type=int, default=64, help='the size of the /invocations body')
+    args = parser.parse_args()
+
+    server = Server('bench', Transformer())
+    body = b'[' + b','.join([b'1'] * max(1, args.size // 2)) + b']'
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    for name, app in (('flask', server.app), ('raw wsgi', RawWsgiApp(server))):
+        ping = measure(request(app, '/ping', 'GET', b'', {}), args.requests)
+        invoke = measure(request(app, '/invocations', 'POST', body, headers), args.requests)
+        print('{:10} /ping {:8.1f} us/request   /invocations {:8.1f} us/request'.format(name, ping, invoke))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,9 @@ from container_support.environment import ContainerEnvironment, TrainingEnvironm
 from container_support.retrying import retry
 from container_support.serving import Server
 from container_support.training import Trainer
-from container_support.utils import parse_s3_url, download_s3_resource, untar_directory
+from container_support.utils import parse_s3_url, download_s3_resource, untar_directory, download_and_extract, \
+    sync_s3_prefix, compile_directory
 
 __all__ = [ContainerEnvironment, TrainingEnvironment, HostingEnvironment, Trainer, Server,
-           retry, parse_s3_url, download_s3_resource, untar_directory, configure_logging]
+           retry, parse_s3_url, download_s3_resource, untar_directory, download_and_extract, sync_s3_prefix,
+           compile_directory, configure_logging]
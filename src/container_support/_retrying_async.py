@@ -0,0 +1,53 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Coroutine support for :mod:`container_support.retrying`, only imported on Python 3."""
+
+import asyncio
+import functools
+import sys
+import time
+
+from container_support.retrying import Attempt
+
+
+async def call_async(retrying, fn, *args, **kwargs):
+    start_time = int(round(time.time() * 1000))
+    attempt_number = 1
+    delay = None
+    while True:
+        retrying.before_attempt()
+        try:
+            attempt = Attempt(await fn(*args, **kwargs), attempt_number, False)
+        except Exception:
+            attempt = Attempt(sys.exc_info(), attempt_number, True)
+        except BaseException:
+            # unlike call(), cancellation is not retried, and says nothing about the outcome of the attempt
+            retrying.abandon_attempt()
+            raise
+
+        delay = retrying.next_delay(attempt, start_time, delay)
+        if delay is None:
+            return attempt.get(retrying._wrap_exception)
+        await (retrying._async_sleep or asyncio.sleep)(delay)
+
+        attempt_number += 1
+
+
+def wrap_coroutine_function(retrying, f):
+    @functools.wraps(f)
+    async def wrapped_f(*args, **kw):
+        return await call_async(retrying, f, *args, **kw)
+
+    return wrapped_f
@@ -0,0 +1,133 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import glob
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+NUMA_NODE_GLOB = '/sys/devices/system/node/node[0-9]*'
+
+# environment variables read by the math libraries commonly linked by deep learning frameworks
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+
+def available_cpus():
+    """ Returns the sorted list of cpu ids the current process is allowed to run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def parse_cpu_list(cpu_list):
+    """ Parses a kernel cpu list (e.g. ``0-3,8,10-11``) into a list of cpu ids.
+    """
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def numa_nodes(node_glob=NUMA_NODE_GLOB):
+    """ Returns a list with the cpu ids of every NUMA node, restricted to the cpus available
+    to the current process. Hosts without NUMA information are reported as a single node.
+    """
+    allowed = set(available_cpus())
+    nodes = []
+    for path in sorted(glob.glob(node_glob), key=lambda p: int(os.path.basename(p)[len('node'):])):
+        try:
+            with open(os.path.join(path, 'cpulist')) as f:
+                cpus = [c for c in parse_cpu_list(f.read()) if c in allowed]
+        except (IOError, OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+
+    return nodes or [sorted(allowed)]
+
+
+def partition_cpus(num_workers, nodes=None):
+    """ Splits the available cpus into ``num_workers`` disjoint cpu sets.
+
+    Workers are distributed over NUMA nodes round robin, so that every cpu set is contained
+    in a single node. When there are more workers than cpus, cpu sets are shared.
+
+    :param num_workers: the number of cpu sets to create
+    :param nodes: list of cpu id lists, one per NUMA node (default: read from sysfs)
+    :return: list with ``num_workers`` cpu id lists
+    """
+    nodes = nodes or numa_nodes()
+    workers_per_node = [0] * len(nodes)
+    for i in range(num_workers):
+        workers_per_node[i % len(nodes)] += 1
+
+    node_sets = []
+    for cpus, count in zip(nodes, workers_per_node):
+        sets = []
+        for i in range(count):
+            if count <= len(cpus):
+                start = i * len(cpus) // count
+                end = (i + 1) * len(cpus) // count
+                sets.append(cpus[start:end])
+            else:
+                sets.append([cpus[i % len(cpus)]])
+        node_sets.append(sets)
+
+    # interleave the nodes so that consecutive workers land on different nodes
+    return [node_sets[i % len(nodes)][i // len(nodes)] for i in range(num_workers)]
+
+
+def threads_per_worker(num_workers, cpus=None):
+    """ Returns the number of intra-op threads each worker can use without oversubscribing the cpus.
+    """
+    cpus = len(available_cpus()) if cpus is None else cpus
+    return max(1, cpus // max(1, num_workers))
+
+
+def set_thread_budget(threads, environ=None):
+    """ Sets the math library thread pool sizes in ``environ``, keeping any value set by the user.
+
+    The environment variables must be set before the libraries are loaded, i.e. before the
+    model server workers import the framework.
+
+    :param threads: the number of threads each process may use
+    :param environ: the environment to update (default: ``os.environ``)
+    :return: dict with the thread settings in effect
+    """
+    environ = os.environ if environ is None else environ
+    for name in THREAD_ENV_VARS:
+        environ.setdefault(name, str(threads))
+    return {name: environ[name] for name in THREAD_ENV_VARS}
+
+
+def pin_to_cpus(cpus, pid=0):
+    """ Restricts process ``pid`` (default: the current process) to the given cpus.
+
+    :return: True if the affinity was changed, False if the platform does not support it
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        logger.warning("cpu affinity is not supported on this platform")
+        return False
+
+    os.sched_setaffinity(pid, cpus)
+    return True
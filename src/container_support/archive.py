@@ -0,0 +1,516 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""Streaming extraction of tar archives compressed with gzip, bzip2, xz, zstd or lz4.
+
+Decompression runs in a separate thread (or a ``pigz``/``zstd``/``lz4`` process when the executable
+is installed), overlapping with tar parsing, and regular files are written to disk by a pool of threads.
+zstd and lz4 support requires the ``zstandard`` and ``lz4`` packages or the command line tools.
+"""
+
+import bz2
+import logging
+import os
+import subprocess
+import tarfile
+import threading
+import zlib
+from multiprocessing.pool import ThreadPool
+
+from six.moves import queue
+
+from container_support import affinity
+
+try:
+    from shutil import which
+except ImportError:  # python 2
+    from distutils.spawn import find_executable as which
+
+logger = logging.getLogger(__name__)
+
+GZIP = 'gz'
+BZIP2 = 'bz2'
+XZ = 'xz'
+ZSTD = 'zst'
+LZ4 = 'lz4'
+TAR = 'tar'
+
+_MAGIC = [(b'\x1f\x8b', GZIP),
+          (b'BZh', BZIP2),
+          (b'\xfd7zXZ\x00', XZ),
+          (b'\x28\xb5\x2f\xfd', ZSTD),
+          (b'\x04\x22\x4d\x18', LZ4)]
+
+# external decompressors, preferred over the python implementations when installed
+_COMMANDS = {GZIP: ['pigz', '-dc'], ZSTD: ['zstd', '-dc'], LZ4: ['lz4', '-dc']}
+
+READ_SIZE = 1024 * 1024
+# files bigger than this are written by the reading thread instead of being buffered for the write pool
+MAX_BUFFERED_FILE_SIZE = 64 * 1024 * 1024
+MAX_BUFFERED_BYTES = 256 * 1024 * 1024
+
+
+def detect_format(header):
+    """Returns the compression format of an archive from its first bytes.
+    """
+    for magic, fmt in _MAGIC:
+        if header.startswith(magic):
+            return fmt
+    return TAR
+
+
+def open_stream(fileobj, use_commands=True):
+    """Returns a tuple (format, file-like object) with the decompressed content of fileobj.
+
+    :param fileobj: file-like object with the compressed archive, read sequentially
+    :param use_commands: use installed command line decompressors when available
+    """
+    header = fileobj.read(8)
+    fmt = detect_format(header)
+    stream = _ReplayReader(header, fileobj)
+
+    if fmt == TAR:
+        return fmt, stream
+
+    command = _COMMANDS.get(fmt) if use_commands else None
+    if command and which(command[0]):
+        return fmt, _ProcessReader(command, stream)
+
+    return fmt, _PrefetchReader(_DecompressingReader(stream, _decompressor_factory(fmt)))
+
+
+def extract(fileobj, path, workers=None):
+    """Extracts the tar archive read from fileobj, in any supported compression format, into path.
+
+    Members that would be written, or would link, outside of path are rejected with ValueError.
+
+    :param fileobj: file-like object with the archive, read sequentially
+    :param path: the directory to extract into
+    :param workers: the number of threads writing files (default: the number of cpus)
+    :return: the format of the archive
+    """
+    fmt, stream = open_stream(fileobj)
+    try:
+        with tarfile.open(mode='r|', fileobj=stream, bufsize=READ_SIZE) as t:
+            _Extractor(path, workers or len(affinity.available_cpus())).extract(t)
+    finally:
+        stream.close()
+    return fmt
+
+
+def safe_members(tar, path):
+    """Yields the members of tar, raising ValueError for any member that would be written,
+    or would link, outside of path. Works on archives opened in stream mode.
+
+    Parent directories are resolved once, against the tree as it is before extraction. This only
+    checks the names: links must be checked again when they are created, as :func:`extract` does.
+    """
+    root = os.path.realpath(path)
+    parents = {}
+
+    def resolve(name):
+        parent, base = os.path.split(os.path.normpath(os.path.join(root, name)))
+        if parent not in parents:
+            parents[parent] = os.path.realpath(parent)
+        return os.path.join(parents[parent], base)
+
+    for member in tar:
+        target = resolve(member.name)
+        if not _is_within(root, target):
+            raise ValueError("illegal path in archive: {}".format(member.name))
+
+        if member.issym():
+            link = os.path.realpath(os.path.join(os.path.dirname(target), member.linkname))
+        elif member.islnk():
+            link = resolve(member.linkname)
+        else:
+            link = target
+        if not _is_within(root, link):
+            raise ValueError("illegal link in archive: {} -> {}".format(member.name, member.linkname))
+
+        if member.isdev():
+            raise ValueError("illegal device file in archive: {}".format(member.name))
+
+        yield member
+
+
+def _is_within(root, path):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _has_symlink(root, name):
+    """Returns True if name, relative to root, is or goes through a symbolic link.
+    """
+    path = root
+    for part in name.split(os.sep):
+        path = os.path.join(path, part)
+        if os.path.islink(path):
+            return True
+    return False
+
+
+def _check_filter(member, path):
+    """Applies tarfile's 'data' extraction filter to member, on the tree extracted so far, when the
+    python version has it.
+    """
+    data_filter = getattr(tarfile, 'data_filter', None)
+    if data_filter is None:
+        return
+    try:
+        data_filter(member, path)
+    except tarfile.FilterError as e:
+        raise ValueError("illegal member in archive: {}".format(e))
+
+
+def _decompressor_factory(fmt):
+    if fmt == GZIP:
+        return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if fmt == BZIP2:
+        return bz2.BZ2Decompressor
+    if fmt == XZ:
+        import lzma
+        return lzma.LZMADecompressor
+    if fmt == ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd archives require the zstandard package or the zstd command")
+        return lambda: zstandard.ZstdDecompressor().decompressobj()
+    if fmt == LZ4:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("lz4 archives require the lz4 package or the lz4 command")
+        return lz4.frame.LZ4FrameDecompressor
+    raise ValueError("unsupported archive format: {}".format(fmt))
+
+
+class _ReplayReader(object):
+    """Returns the already consumed header before reading on from the underlying stream.
+    """
+
+    def __init__(self, header, stream):
+        self._header = header
+        self._stream = stream
+
+    def read(self, size=-1):
+        if self._header:
+            if size is None or size < 0:
+                data, self._header = self._header + self._stream.read(), b''
+                return data
+            data, self._header = self._header[:size], self._header[size:]
+            if len(data) < size:
+                data += self._stream.read(size - len(data))
+            return data
+        return self._stream.read(size) if size is not None and size >= 0 else self._stream.read()
+
+    def close(self):
+        pass
+
+
+class _BufferedReader(object):
+    """Base class of the readers producing data in chunks. Subclasses implement ``_fill``, returning
+    the next chunk or an empty string at the end of the stream.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._position = 0
+        self._eof = False
+
+    def read(self, size=-1):
+        # only the unread tail is copied when refilling, so small reads stay cheap
+        while not self._eof and (size is None or size < 0 or len(self._buffer) - self._position < size):
+            data = self._fill()
+            if not data:
+                self._eof = True
+                break
+            self._buffer = self._buffer[self._position:] + data
+            self._position = 0
+
+        end = len(self._buffer) if size is None or size < 0 else self._position + size
+        data = self._buffer[self._position:end]
+        self._position += len(data)
+        return data
+
+    def _fill(self):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class _DecompressingReader(_BufferedReader):
+    def __init__(self, stream, decompressor_factory):
+        super(_DecompressingReader, self).__init__()
+        self._stream = stream
+        self._factory = decompressor_factory
+        self._decompressor = decompressor_factory()
+
+    def _fill(self):
+        while True:
+            data = self._stream.read(READ_SIZE)
+            if not data:
+                if not getattr(self._decompressor, 'eof', True):
+                    raise IOError("compressed archive is truncated")
+                return b''
+            out = self._decompress(data)
+            if out:
+                return out
+
+    def _decompress(self, data):
+        out = self._decompressor.decompress(data)
+        # concatenated streams (e.g. multi-member gzip) restart the decompressor at every boundary
+        while getattr(self._decompressor, 'eof', False) and getattr(self._decompressor, 'unused_data', b''):
+            unused = self._decompressor.unused_data
+            self._decompressor = self._factory()
+            out += self._decompressor.decompress(unused)
+        return out
+
+
+class _PrefetchReader(_BufferedReader):
+    """Reads from a reader in a background thread, so that decompression (which releases the GIL)
+    runs in parallel with the consumer.
+    """
+
+    def __init__(self, reader, chunk_size=READ_SIZE, depth=16):
+        super(_PrefetchReader, self).__init__()
+        self._queue = queue.Queue(depth)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, args=(reader, chunk_size))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, reader, chunk_size):
+        try:
+            while not self._closed:
+                data = reader.read(chunk_size)
+                self._queue.put(data)
+                if not data:
+                    return
+        except Exception as e:  # noqa
+            self._queue.put(e)
+
+    def _fill(self):
+        data = self._queue.get()
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def close(self):
+        self._closed = True
+        # unblock the producer if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+class _ProcessReader(object):
+    """Decompresses with an external command, fed by a thread copying the compressed stream to its stdin.
+    """
+
+    def __init__(self, command, stream):
+        self._command = command
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._error = None
+        self._feeder = threading.Thread(target=self._feed, args=(stream,))
+        self._feeder.daemon = True
+        self._feeder.start()
+
+    def _feed(self, stream):
+        try:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                self._process.stdin.write(data)
+        except Exception as e:  # noqa
+            self._error = e
+        finally:
+            try:
+                self._process.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def read(self, size=-1):
+        data = self._process.stdout.read(size) if size is not None and size >= 0 else self._process.stdout.read()
+        if not data:
+            self._check()
+        return data
+
+    def _check(self):
+        self._feeder.join()
+        if self._error:
+            raise self._error
+        if self._process.wait() != 0:
+            raise IOError("{} failed with exit code {}".format(' '.join(self._command), self._process.returncode))
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._process.stdout.close()
+        self._feeder.join()
+
+
+class _Extractor(object):
+    """Extracts a tar stream, handing the content of regular files to a pool of writer threads.
+
+    File modes are masked like tarfile's 'data' filter: no setuid/setgid/sticky bits and no write
+    permission for group and others. Like tarfile, the last member of a path wins: a path written again
+    waits for the pending write of its earlier member.
+    """
+
+    def __init__(self, path, workers):
+        self.path = path
+        self.workers = workers
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._errors = []
+        self._dirs = set()
+        self._pending = {}
+
+    def extract(self, tar):
+        pool = ThreadPool(self.workers)
+        links = []
+        try:
+            for member in safe_members(tar, self.path):
+                target = os.path.join(self.path, member.name)
+                if member.isdir():
+                    self._makedirs(target)
+                elif member.isfile():
+                    self._makedirs(os.path.dirname(target))
+                    self._raise_errors()
+                    pending = self._pending.pop(target, None)
+                    if pending is not None:
+                        pending.wait()
+                    if member.size > MAX_BUFFERED_FILE_SIZE:
+                        _write_file(target, tar.extractfile(member), member)
+                    else:
+                        self._submit(pool, target, tar.extractfile(member).read(), member)
+                elif member.issym() or member.islnk():
+                    links.append(member)
+        finally:
+            pool.close()
+            pool.join()
+        self._raise_errors()
+
+        self._create_links(links)
+
+    def _create_links(self, links):
+        """Creates the links once every file they may point to exists: hard links first, while the tree only
+        holds regular files and directories, then symbolic links. Links are resolved again on the final tree,
+        since a symbolic link created later can change where an earlier one points.
+        """
+        root = os.path.realpath(self.path)
+        symlinks = set(os.path.normpath(m.name) for m in links if m.issym())
+        created = []
+        try:
+            for member in sorted(links, key=lambda m: m.issym()):
+                _check_filter(member, self.path)
+                target = os.path.join(self.path, member.name)
+                _makedirs(os.path.dirname(target))
+                if os.path.lexists(target):
+                    os.remove(target)
+                if member.issym():
+                    os.symlink(member.linkname, target)
+                    created.append(member)
+                else:
+                    source = os.path.normpath(member.linkname)
+                    if any(source == name or source.startswith(name + os.sep) for name in symlinks) or \
+                            _has_symlink(root, source):
+                        raise ValueError("illegal hard link through a symbolic link in archive: {} -> {}".format(
+                            member.name, member.linkname))
+                    os.link(os.path.join(self.path, source), target)
+
+            for member in created:
+                if not _is_within(root, os.path.realpath(os.path.join(self.path, member.name))):
+                    raise ValueError("illegal link in archive: {} -> {}".format(member.name, member.linkname))
+        except:  # noqa
+            for member in created:
+                try:
+                    os.remove(os.path.join(self.path, member.name))
+                except OSError:
+                    pass
+            raise
+
+    def _makedirs(self, path):
+        if path not in self._dirs:
+            _makedirs(path)
+            self._dirs.add(path)
+
+    def _submit(self, pool, target, data, member):
+        with self._condition:
+            while self._in_flight and self._in_flight + len(data) > MAX_BUFFERED_BYTES:
+                self._condition.wait()
+            self._in_flight += len(data)
+        self._pending[target] = pool.apply_async(self._write, (target, data, member))
+
+    def _write(self, target, data, member):
+        try:
+            _write_data(target, data, member)
+        except Exception as e:  # noqa
+            self._errors.append(e)
+        finally:
+            with self._condition:
+                self._in_flight -= len(data)
+                self._condition.notify_all()
+
+    def _raise_errors(self):
+        if self._errors:
+            raise self._errors[0]
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+
+def _write_data(target, data, member):
+    with _open_for_write(target) as f:
+        f.write(data)
+    _set_attributes(target, member)
+
+
+def _write_file(target, source, member):
+    with _open_for_write(target) as f:
+        while True:
+            data = source.read(READ_SIZE)
+            if not data:
+                break
+            f.write(data)
+    _set_attributes(target, member)
+
+
+def _open_for_write(target):
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_NOFOLLOW', 0)
+    try:
+        fd = os.open(target, flags, 0o644)
+    except OSError:
+        # never write through an existing link: replace it
+        if not os.path.lexists(target):
+            raise
+        os.remove(target)
+        fd = os.open(target, flags, 0o644)
+    return os.fdopen(fd, 'wb')
+
+
+def _set_attributes(target, member):
+    os.chmod(target, member.mode & 0o755)
+    os.utime(target, (member.mtime, member.mtime))
@@ -0,0 +1,231 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""A background writer for checkpoints and other training artifacts.
+
+The training loop hands serialized artifacts to :meth:`ArtifactWriter.write`, which only blocks when the
+bounded queue is full. A thread writes them to temporary files, throttled to a maximum rate so that it
+does not starve data loading of I/O, and publishes them in batches: the files of a batch are fsynced,
+renamed into place and their directories fsynced, so readers only ever see complete artifacts.
+Published artifacts are optionally uploaded to S3 (or a ``file://`` directory) as they are written.
+
+:func:`flush_all` waits for every writer of the process; :class:`~container_support.Trainer` calls it
+before writing the success file.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from six.moves import queue
+
+from container_support import utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_FSYNC_BATCH = 16
+
+_CHUNK_SIZE = 1024 * 1024
+
+_writers = []
+_writers_lock = threading.Lock()
+
+
+class ArtifactWriter(object):
+    """Writes artifacts under a directory from a background thread.
+    """
+
+    def __init__(self, root, upload_url=None, queue_size=DEFAULT_QUEUE_SIZE, fsync_batch=DEFAULT_FSYNC_BATCH,
+                 max_bytes_per_second=None):
+        """
+        :param root: the directory the artifacts are written to, e.g. ``model_dir``
+        :param upload_url: an ``s3://`` or ``file://`` prefix every published artifact is copied to
+        :param queue_size: the number of artifacts that can be pending before :meth:`write` blocks
+        :param fsync_batch: the maximum number of artifacts published together
+        :param max_bytes_per_second: the maximum write rate, or None for no limit
+        """
+        self.root = root
+        self.upload_url = upload_url
+        self.fsync_batch = fsync_batch
+        self._throttle = _Throttle(max_bytes_per_second)
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self.bytes_written = 0
+        self.artifacts_written = 0
+
+        self._thread = threading.Thread(target=self._run, name='artifact-writer-{}'.format(root))
+        self._thread.daemon = True
+        self._thread.start()
+        with _writers_lock:
+            _writers.append(self)
+
+    def write(self, name, data):
+        """Queues an artifact for writing.
+
+        :param name: the path of the artifact, relative to the root directory
+        :param data: the serialized artifact (bytes)
+        """
+        path = os.path.normpath(os.path.join(self.root, name))
+        if os.path.isabs(name) or not path.startswith(os.path.join(os.path.normpath(self.root), '')):
+            raise ValueError("artifact path {} is outside of {}".format(name, self.root))
+        if not self._thread.is_alive():
+            raise ValueError("artifact writer for {} is closed".format(self.root))
+        self._queue.put((name, path, data))
+
+    def flush(self):
+        """Blocks until every queued artifact is published and uploaded, and raises the first error
+        that occurred since the last flush, if any.
+        """
+        self._queue.join()
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Flushes the writer and stops its thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        with _writers_lock:
+            if self in _writers:
+                _writers.remove(self)
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                # publish as soon as the training loop stops producing artifacts
+                item = self._queue.get(block=not batch)
+            except queue.Empty:
+                self._publish(batch)
+                batch = []
+                continue
+
+            if item is None:
+                self._publish(batch)
+                self._queue.task_done()
+                return
+
+            try:
+                batch.append(self._write_temporary(*item))
+            except Exception as e:  # noqa
+                self._fail(e, item[0])
+                self._queue.task_done()
+                continue
+
+            if len(batch) >= self.fsync_batch:
+                self._publish(batch)
+                batch = []
+
+    def _write_temporary(self, name, path, data):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = os.path.join(directory, '.{}.{}.tmp'.format(os.path.basename(path), uuid.uuid4().hex))
+        view = memoryview(data)
+        with open(tmp, 'wb') as f:
+            for start in range(0, len(view), _CHUNK_SIZE):
+                chunk = view[start:start + _CHUNK_SIZE]
+                self._throttle.consume(len(chunk))
+                f.write(chunk)
+        return name, path, tmp, len(view)
+
+    def _publish(self, batch):
+        if not batch:
+            return
+        try:
+            directories = set()
+            for _, _, tmp, _ in batch:
+                _fsync(tmp, os.O_RDONLY)
+            for _, path, tmp, size in batch:
+                os.rename(tmp, path)
+                directories.add(os.path.dirname(path))
+                self.bytes_written += size
+                self.artifacts_written += 1
+            for directory in directories:
+                _fsync(directory, os.O_RDONLY)
+
+            for name, path, _, _ in batch:
+                if self.upload_url:
+                    _upload(path, self.upload_url.rstrip('/') + '/' + name.replace(os.sep, '/'))
+        except Exception as e:  # noqa
+            self._fail(e, ', '.join(name for name, _, _, _ in batch))
+            for _, _, tmp, _ in batch:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _fail(self, error, name):
+        logger.error("failed to write artifact {} in {}: {}".format(name, self.root, error))
+        if self._error is None:
+            self._error = error
+
+
+def flush_all():
+    """Flushes every open :class:`ArtifactWriter` of the process.
+    """
+    with _writers_lock:
+        writers = list(_writers)
+    for writer in writers:
+        writer.flush()
+
+
+class _Throttle(object):
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._next = time.time()
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        now = time.time()
+        if self._next > now:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + float(size) / self.bytes_per_second
+
+
+def _fsync(path, flags):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _upload(path, url):
+    if url.startswith('file://'):
+        target = utils._local_path(url)
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        shutil.copyfile(path, target)
+    else:
+        bucket, key = utils.parse_s3_url(url)
+        config = utils.transfer_config()
+        utils.s3_client(config.max_concurrency).upload_file(path, bucket, key, Config=config)
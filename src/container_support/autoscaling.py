@@ -0,0 +1,256 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Scales the number of gunicorn workers of the model server with the load.
+
+Every worker counts the requests it is handling in its slot of a small shared memory file
+(:class:`WorkerSlots`), from the gunicorn ``pre_request`` and ``post_request`` hooks. The
+:class:`Autoscaler` thread of the process that started gunicorn samples the slots and the cpu utilization
+of the host, and sends SIGTTIN (one more worker) or SIGTTOU (one less worker) to the gunicorn master.
+
+Decisions have hysteresis: a condition must hold for several consecutive samples, and no decision is
+made during a cooldown after the previous one. A worker is only added if the host has the memory for it:
+``worker_memory`` bytes, or the resident memory of the largest worker if no budget is configured.
+"""
+
+import logging
+import mmap
+import os
+import signal
+import struct
+import threading
+import time
+
+from container_support import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOTS_FILE_ENV = 'SAGEMAKER_MODEL_SERVER_SLOTS_FILE'
+
+# pid, requests in flight, requests handled
+_SLOT = struct.Struct('<qqq')
+
+SCALE_UP = 1
+SCALE_DOWN = -1
+
+
+class WorkerSlots(object):
+    """Per worker request counters in a memory mapped file shared by the gunicorn workers and the autoscaler.
+
+    Every slot has a single writer, the worker it is assigned to (``worker.slot``).
+    """
+
+    def __init__(self, path, count, create=False):
+        """
+        :param path: the file backing the slots
+        :param count: the number of slots
+        :param create: create (or truncate) the file
+        """
+        self.path = path
+        self.count = count
+        size = count * _SLOT.size
+        if create:
+            with open(path, 'wb') as f:
+                f.write(b'\0' * size)
+        with open(path, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), size)
+
+    @classmethod
+    def from_env(cls):
+        """Returns the slots shared through ``SAGEMAKER_MODEL_SERVER_SLOTS_FILE``, or None.
+        """
+        path = os.environ.get(SLOTS_FILE_ENV)
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path, os.path.getsize(path) // _SLOT.size)
+
+    def assign(self, slot, pid):
+        if slot < self.count:
+            _SLOT.pack_into(self._mmap, slot * _SLOT.size, pid, 0, 0)
+
+    def begin_request(self, slot):
+        self._add(slot, 1, 0)
+
+    def end_request(self, slot):
+        self._add(slot, -1, 1)
+
+    def _add(self, slot, in_flight, handled):
+        if slot < self.count:
+            offset = slot * _SLOT.size
+            pid, current, total = _SLOT.unpack_from(self._mmap, offset)
+            _SLOT.pack_into(self._mmap, offset, pid, max(0, current + in_flight), total + handled)
+
+    def read(self):
+        """Returns (pid, requests in flight, requests handled) of the assigned slots.
+        """
+        slots = []
+        for slot in range(self.count):
+            pid, in_flight, handled = _SLOT.unpack_from(self._mmap, slot * _SLOT.size)
+            if pid:
+                slots.append((pid, in_flight, handled))
+        return slots
+
+    def close(self):
+        self._mmap.close()
+
+
+class Autoscaler(object):
+    """Adds and removes gunicorn workers, between ``min_workers`` and ``max_workers``, based on the
+    average number of requests in flight per worker and the cpu utilization of the host.
+    """
+
+    def __init__(self, gunicorn_pid, slots, workers, min_workers, max_workers, worker_memory=0,
+                 interval=1.0, scale_up_depth=2.0, scale_down_depth=0.5, max_cpu=90.0, min_cpu=30.0,
+                 samples=3, cooldown=10.0, proc='/proc', clock=time.time):
+        """
+        :param gunicorn_pid: the pid of the gunicorn master
+        :param slots: the :class:`WorkerSlots` the workers count their requests in
+        :param workers: the number of workers gunicorn was started with
+        :param worker_memory: the memory budget of a worker in bytes, 0 to use the size of the largest worker
+        :param interval: the seconds between samples
+        :param scale_up_depth: add a worker when there are more requests in flight per worker
+        :param scale_down_depth: remove a worker when there are fewer requests in flight per worker
+        :param max_cpu: do not add workers when the cpu utilization (percent) is higher: they would
+                        only compete for the same cpus
+        :param min_cpu: only remove workers when the cpu utilization is lower
+        :param samples: the number of consecutive samples a condition must hold for
+        :param cooldown: the seconds after a decision during which no other is made
+        """
+        self.gunicorn_pid = gunicorn_pid
+        self.slots = slots
+        self.workers = workers
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.worker_memory = worker_memory
+        self.interval = interval
+        self.scale_up_depth = scale_up_depth
+        self.scale_down_depth = scale_down_depth
+        self.max_cpu = max_cpu
+        self.min_cpu = min_cpu
+        self.samples = samples
+        self.cooldown = cooldown
+        self.proc = proc
+        self._clock = clock
+        self._cpu = metrics.CpuCollector(proc)
+        self._streak = 0
+        self._last_decision = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='autoscaler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:  # noqa
+                logger.exception("autoscaler sample failed")
+
+    def tick(self):
+        """Samples the workers and the host and scales if needed.
+
+        :return: SCALE_UP, SCALE_DOWN or 0
+        """
+        live = [(pid, in_flight) for pid, in_flight, _ in self.slots.read() if _alive(pid)]
+        depth = float(sum(in_flight for _, in_flight in live)) / max(1, len(live))
+        cpu = [m.value for m in self._cpu.collect() if m.name == 'cpu_utilization']
+        cpu = cpu[0] if cpu else 0.0
+
+        decision, reason = self.decide(depth, cpu, _available_memory(self.proc),
+                                       max([_resident_bytes(self.proc, pid) for pid, _ in live] or [0]))
+        if decision:
+            self._scale(decision, reason)
+        return decision
+
+    def decide(self, depth, cpu, available_memory, largest_worker):
+        """Returns the decision for a sample and the reason for it, with hysteresis.
+
+        :param depth: the average number of requests in flight per worker
+        :param cpu: the cpu utilization of the host, in percent
+        :param available_memory: the memory available on the host, in bytes
+        :param largest_worker: the resident memory of the largest worker, in bytes
+        :return: tuple (SCALE_UP, SCALE_DOWN or 0, reason)
+        """
+        direction = 0
+        if depth > self.scale_up_depth and self.workers < self.max_workers:
+            direction = SCALE_UP
+        elif depth < self.scale_down_depth and cpu < self.min_cpu and self.workers > self.min_workers:
+            direction = SCALE_DOWN
+
+        # a streak counts consecutive samples in the same direction
+        if direction and (self._streak > 0) == (direction > 0):
+            self._streak += direction
+        else:
+            self._streak = direction
+        if not direction or abs(self._streak) < self.samples:
+            return 0, None
+
+        now = self._clock()
+        if self._last_decision is not None and now - self._last_decision < self.cooldown:
+            return 0, None
+
+        if direction == SCALE_UP:
+            if cpu > self.max_cpu:
+                return 0, None
+            needed = self.worker_memory or largest_worker
+            if needed > available_memory:
+                # the cooldown also limits how often this is logged
+                self._last_decision = now
+                logger.info("not adding a worker: {:.2f} requests in flight per worker, but {} bytes of memory "
+                            "available and a worker needs {}".format(depth, available_memory, needed))
+                return 0, None
+
+        self._streak = 0
+        self._last_decision = now
+        return direction, "{:.2f} requests in flight per worker, cpu {:.1f}%".format(depth, cpu)
+
+    def _scale(self, decision, reason):
+        self.workers += decision
+        logger.info("{} model server worker ({} workers): {}".format(
+            'adding a' if decision == SCALE_UP else 'removing a', self.workers, reason))
+        os.kill(self.gunicorn_pid, signal.SIGTTIN if decision == SCALE_UP else signal.SIGTTOU)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def _available_memory(proc):
+    info = {}
+    with open(os.path.join(proc, 'meminfo')) as f:
+        for line in f:
+            name, value = line.split(':', 1)
+            info[name] = int(value.split()[0]) * 1024
+    return info.get('MemAvailable', info.get('MemFree', 0) + info.get('Cached', 0))
+
+
+def _resident_bytes(proc, pid):
+    try:
+        with open(os.path.join(proc, str(pid), 'statm')) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return 0
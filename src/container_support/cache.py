@@ -0,0 +1,207 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = 'SAGEMAKER_ARTIFACT_CACHE_DIR'
+CACHE_MAX_BYTES_ENV = 'SAGEMAKER_ARTIFACT_CACHE_MAX_BYTES'
+CACHE_REVALIDATE_ENV = 'SAGEMAKER_ARTIFACT_CACHE_REVALIDATE'
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+_ENTRY = 'data'
+_META = 'meta.json'
+
+
+class ArtifactCache(object):
+    """A persistent, size-bounded LRU cache of downloaded artifacts, keyed by url and version (ETag).
+
+    Every entry is a directory holding either a single file or an extracted tree. Entries are built in a
+    temporary directory and published with an atomic rename, so concurrent processes never see partial
+    entries. The least recently used entries are evicted when the cache grows over ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, revalidate=True):
+        """
+        :param root: the directory holding the cache, created if needed
+        :param max_bytes: the size the cache is trimmed to after every publish
+        :param revalidate: check the version of an url with the source before using its cached entry.
+                           When False, the version recorded by the last download is trusted and cache hits
+                           need no network I/O at all.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        for d in ('entries', 'urls', 'tmp'):
+            if not os.path.exists(os.path.join(root, d)):
+                os.makedirs(os.path.join(root, d))
+
+    @classmethod
+    def from_env(cls):
+        """Returns the cache configured with ``SAGEMAKER_ARTIFACT_CACHE_DIR``, or None if caching is disabled.
+        """
+        root = os.environ.get(CACHE_DIR_ENV)
+        if not root:
+            return None
+        return cls(root,
+                   max_bytes=int(os.environ.get(CACHE_MAX_BYTES_ENV, DEFAULT_MAX_BYTES)),
+                   revalidate=os.environ.get(CACHE_REVALIDATE_ENV, 'true').lower() == 'true')
+
+    def get(self, key):
+        """Returns the path of the file or tree cached under key, or None.
+        """
+        entry = self._entry_dir(key)
+        path = os.path.join(entry, _ENTRY)
+        if not os.path.exists(path):
+            return None
+        try:
+            # the entry's mtime is its last use
+            os.utime(entry, None)
+        except OSError:
+            return None
+        return path
+
+    def publish(self, key, build):
+        """Builds and atomically publishes the entry for key.
+
+        :param key: the cache key
+        :param build: function called with the path the file or tree must be written to
+        :return: the path of the published entry
+        """
+        tmp = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        os.makedirs(tmp)
+        try:
+            build(os.path.join(tmp, _ENTRY))
+            size = _size(os.path.join(tmp, _ENTRY))
+            with open(os.path.join(tmp, _META), 'w') as f:
+                json.dump({'key': key, 'size': size, 'created': time.time()}, f)
+
+            entry = self._entry_dir(key)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # another process published the same entry first
+                if not os.path.exists(os.path.join(entry, _ENTRY)):
+                    raise
+                shutil.rmtree(tmp, ignore_errors=True)
+        except:  # noqa
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict(keep=entry)
+        return os.path.join(entry, _ENTRY)
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries until the cache is within ``max_bytes``.
+
+        :param keep: an entry directory that must not be evicted
+        """
+        entries_dir = os.path.join(self.root, 'entries')
+        entries = []
+        for name in os.listdir(entries_dir):
+            entry = os.path.join(entries_dir, name)
+            try:
+                with open(os.path.join(entry, _META)) as f:
+                    size = json.load(f)['size']
+                entries.append((os.path.getmtime(entry), size, entry))
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            # rename first, so that the entry disappears atomically for readers
+            trash = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+            try:
+                os.rename(entry, trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+            logger.info("evicted {} ({} bytes) from the artifact cache".format(entry, size))
+
+    def last_version(self, url):
+        """Returns the version of url recorded by its last download, or None.
+        """
+        try:
+            with open(self._url_file(url)) as f:
+                return f.read() or None
+        except (IOError, OSError):
+            return None
+
+    def record_version(self, url, version):
+        tmp = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            f.write(version)
+        os.rename(tmp, self._url_file(url))
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, 'entries', _digest(key))
+
+    def _url_file(self, url):
+        return os.path.join(self.root, 'urls', _digest(url))
+
+
+def cache_key(url, version, kind):
+    """Returns the cache key of the artifact at url with the given version (ETag).
+
+    :param kind: distinguishes the different entries made from the same object, e.g. 'file' and 'tree'
+    """
+    return json.dumps([url, version, kind])
+
+
+def copy_tree(source, target):
+    """Copies the tree at source into target, merging with any existing content.
+    """
+    for root, dirs, files in os.walk(source):
+        dest = os.path.join(target, os.path.relpath(root, source))
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(dest, name)
+            if os.path.islink(src):
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                os.symlink(os.readlink(src), dst)
+            else:
+                shutil.copy2(src, dst)
+        for name in dirs:
+            src = os.path.join(root, name)
+            if os.path.islink(src):
+                dst = os.path.join(dest, name)
+                if not os.path.lexists(dst):
+                    os.symlink(os.readlink(src), dst)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def _size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files
+               if not os.path.islink(os.path.join(root, name)))
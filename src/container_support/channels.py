@@ -0,0 +1,328 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""Indexes of the files in File mode channels, deterministic sharding of them across hosts and processes,
+and zero-copy access to their content through memory maps.
+"""
+
+import bisect
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import random
+import tempfile
+import uuid
+
+INDEX_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'sagemaker-channel-index')
+
+_READ_SIZE = 4 * 1024 * 1024
+
+
+class ChannelIndex(object):
+    """The files in a channel directory, their sizes and, optionally, the offsets at which their
+    newline delimited records start.
+    """
+
+    def __init__(self, root, files, record_offsets=None):
+        """
+        :param root: the channel directory
+        :param files: list of (path relative to root, size) tuples, sorted by path
+        :param record_offsets: dict of relative path -> list of record start offsets, or None
+        """
+        self.root = root
+        self.files = files
+        self.record_offsets = record_offsets
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, size in self.files)
+
+    @classmethod
+    def build(cls, root, record_offsets=False):
+        """Walks the channel directory once to build its index.
+
+        :param record_offsets: also scan the files for the start offsets of newline delimited records
+        """
+        return cls._from_listing(root, _list_files(root), record_offsets)
+
+    @classmethod
+    def _from_listing(cls, root, listing, record_offsets):
+        files = [(name, size) for name, size, _ in listing]
+        offsets = None
+        if record_offsets:
+            offsets = {name: _newline_record_offsets(os.path.join(root, name)) for name, _ in files}
+        return cls(root, files, offsets)
+
+    @classmethod
+    def load(cls, root, record_offsets=False, cache_dir=INDEX_CACHE_DIR):
+        """Returns the index of the channel directory, from the on-disk cache shared by the processes
+        of the job if possible, building and caching it otherwise.
+
+        Cached indexes are keyed by the names, sizes and modification times of the files in the channel,
+        so a channel whose content changed, e.g. on a host reused by another job, is indexed again.
+        """
+        listing = _list_files(root)
+        key = json.dumps([os.path.abspath(root), record_offsets, listing])
+        path = os.path.join(cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return cls(data['root'], [tuple(entry) for entry in data['files']], data['record_offsets'])
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+        index = cls._from_listing(root, listing, record_offsets)
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                pass
+        tmp = '{}.{}'.format(path, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump({'root': index.root, 'files': index.files, 'record_offsets': index.record_offsets}, f)
+        os.rename(tmp, path)
+        return index
+
+    def shard(self, num_shards, shard_index, split_files=None):
+        """Returns the data assigned to one of ``num_shards`` shards, balancing bytes.
+
+        Files are assigned whole, largest first, to the shard with the fewest bytes so far. When the index
+        has record offsets, files larger than an even share are first split into ranges at record boundaries.
+        The assignment only depends on the index, so every host and process computes the same one.
+
+        :param num_shards: the total number of shards
+        :param shard_index: the shard to return, in ``[0, num_shards)``
+        :param split_files: split large files into record ranges (default: True if the index has record offsets)
+        :return: list of (path, start offset, end offset) tuples, sorted by path and offset
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError("shard index {} out of range for {} shards".format(shard_index, num_shards))
+
+        split_files = self.record_offsets is not None if split_files is None else split_files
+        if split_files and self.record_offsets is None:
+            raise ValueError("splitting files requires an index built with record offsets")
+
+        pieces = []
+        target = -(-self.total_bytes // num_shards)
+        for name, size in self.files:
+            if split_files and size > target:
+                pieces.extend((name, start, end) for start, end in _split(self.record_offsets[name], size, target))
+            else:
+                pieces.append((name, 0, size))
+
+        shards = assign_shards([(piece, piece[2] - piece[1]) for piece in pieces], num_shards)
+        return sorted((os.path.join(self.root, name), start, end) for name, start, end in shards[shard_index])
+
+
+def assign_shards(items, num_shards):
+    """Assigns weighted items to shards, balancing the total weight of every shard.
+
+    Uses the longest processing time first heuristic: items are sorted by decreasing weight (then by item,
+    for determinism) and each is assigned to the lightest shard so far (the lowest index on ties).
+
+    :param items: list of (item, weight) tuples
+    :param num_shards: the number of shards
+    :return: list with the items of every shard
+    """
+    shards = [[] for _ in range(num_shards)]
+    heap = [(0, i) for i in range(num_shards)]
+    for item, weight in sorted(items, key=lambda x: (-x[1], x[0])):
+        load, i = heapq.heappop(heap)
+        shards[i].append(item)
+        heapq.heappush(heap, (load + weight, i))
+    return shards
+
+
+def _split(offsets, size, target):
+    """Splits [0, size) into ranges of about target bytes at the given record offsets.
+    """
+    ranges = []
+    start = 0
+    for offset in offsets:
+        if offset - start >= target:
+            ranges.append((start, offset))
+            start = offset
+    ranges.append((start, size))
+    return [(s, e) for s, e in ranges if e > s]
+
+
+def _list_files(root):
+    """Returns the sorted list of (path relative to root, size, modification time) of the files under root.
+    """
+    files = []
+    for directory, dirs, names in os.walk(root, followlinks=True):
+        dirs.sort()
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((os.path.relpath(path, root), stat.st_size, stat.st_mtime))
+    files.sort()
+    return files
+
+
+def _newline_record_offsets(path):
+    offsets = [0]
+    position = 0
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(_READ_SIZE)
+            if not data:
+                break
+            end = data.find(b'\n')
+            while end >= 0:
+                offsets.append(position + end + 1)
+                end = data.find(b'\n', end + 1)
+            position += len(data)
+    if offsets[-1] >= position:
+        offsets.pop()
+    return offsets
+
+
+class MappedFile(object):
+    """A read-only memory map of a data file, with zero-copy access to its fixed-size records.
+
+    Pages are read by the kernel on access and can be evicted under memory pressure, so files larger
+    than memory can be read, in any order, without loading them. Records are ``memoryview`` slices
+    of the map and :meth:`array` wraps it with ``numpy.frombuffer``; neither copies data.
+    Views and arrays must be released before :meth:`close`, otherwise the map is only unmapped once
+    they are garbage collected.
+    """
+
+    def __init__(self, path, record_size=None, header_size=0, random_access=False):
+        """
+        :param path: the file to map
+        :param record_size: the size in bytes of every record, if the file holds fixed-size records
+        :param header_size: the number of bytes to skip at the start of the file
+        :param random_access: advise the kernel that records will be read in random order (disables read-ahead)
+        """
+        self.path = path
+        self.record_size = record_size
+        self.header_size = header_size
+
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+        if self._mmap is not None and hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_RANDOM if random_access else mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b'')
+        self.size = size
+
+    def __len__(self):
+        if not self.record_size:
+            raise TypeError("{} has no fixed record size".format(self.path))
+        return (self.size - self.header_size) // self.record_size
+
+    def __getitem__(self, index):
+        return self.record(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def data(self):
+        """A ``memoryview`` of the whole file after the header.
+        """
+        return self._view[self.header_size:]
+
+    def record(self, index):
+        """Returns a ``memoryview`` of the record at index.
+        """
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("record index {} out of range".format(index))
+        start = self.header_size + index * self.record_size
+        return self._view[start:start + self.record_size]
+
+    def records(self, order=None):
+        """Yields the records in file order, or in the given order of record indices.
+        """
+        for index in (range(len(self)) if order is None else order):
+            yield self.record(index)
+
+    def array(self, dtype, shape=None):
+        """Returns a numpy array backed by the map (read-only, no copy).
+
+        :param dtype: the numpy dtype of the elements
+        :param shape: the shape of every record, e.g. ``(28, 28)``. The array has shape ``(records,) + shape``.
+                      If None, the array is one-dimensional.
+        """
+        import numpy as np
+
+        dtype = np.dtype(dtype)
+        count = (self.size - self.header_size) // dtype.itemsize
+        if not count:
+            return np.empty(0, dtype)
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self.header_size)
+        return array if shape is None else array.reshape((-1,) + tuple(shape))
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # arrays or records still reference the map, it is unmapped when they are collected
+                pass
+
+
+class MappedDataset(object):
+    """Fixed-size records across several memory mapped files, addressed by a global index.
+    """
+
+    def __init__(self, paths, record_size, header_size=0, random_access=False):
+        self.files = [MappedFile(path, record_size, header_size, random_access) for path in paths]
+        self._starts = []
+        count = 0
+        for f in self.files:
+            self._starts.append(count)
+            count += len(f)
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("record index {} out of range".format(index))
+        i = bisect.bisect_right(self._starts, index) - 1
+        return self.files[i].record(index - self._starts[i])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def records(self, shuffle=False, seed=None):
+        """Yields every record, in order or shuffled. Shuffling only permutes indices, no data is loaded.
+        """
+        order = list(range(self._count))
+        if shuffle:
+            random.Random(seed).shuffle(order)
+        for index in order:
+            yield self[index]
+
+    def close(self):
+        for f in self.files:
+            f.close()
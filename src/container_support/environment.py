@@ -11,17 +11,27 @@
 #  express or implied. See the License for the specific language governing 
 #  permissions and limitations under the License.
 
+import collections
 import importlib
 import json
 import logging
-import multiprocessing
 import os
+import re
 import subprocess
 import sys
 import tempfile
+import time
 import pkg_resources
+import six
+
+try:
+    from importlib.util import find_spec
+except ImportError:  # python 2
+    from pkgutil import find_loader as find_spec
 
 import container_support as cs
+from container_support import affinity, artifacts, channels, logs, metrics, parsing, pipe, pipeline, rendezvous
+from container_support import staging, telemetry
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +52,11 @@ class ContainerEnvironment(object):
     JOB_NAME_ENV = "JOB_NAME"
     USE_NGINX_ENV = "SAGEMAKER_USE_NGINX"
     SAGEMAKER_REGION_PARAM_NAME = 'sagemaker_region'
+    FRAMEWORK_MODULE_ENV = "SAGEMAKER_FRAMEWORK_MODULE"
+    FRAMEWORK_ENTRY_POINT_GROUP = "sagemaker_container_support.frameworks"
+    LEGACY_FRAMEWORK_MODULES = ["mxnet_container", "tf_container"]
+
+    _framework = None
 
     def __init__(self, base_dir=BASE_DIRECTORY):
         self.base_dir = base_dir
@@ -74,6 +89,9 @@ class ContainerEnvironment(object):
         self.enable_cloudwatch_metrics = False
         "Report system metrics to CloudWatch? (default = False)"
 
+        self.metrics_agent = None
+        "The running :class:`~container_support.metrics.MetricsAgent`, if the agent is enabled."
+
         # subclasses will override
         self.container_log_level = None
         "The logging level for the root logger."
@@ -83,11 +101,34 @@ class ContainerEnvironment(object):
         "The current AWS region."
 
     def download_user_module(self):
-        """Download user-supplied python archive from S3.
+        """Download user-supplied python archive from S3, extracting it into ``code_dir`` as it streams in.
         """
-        tmp = os.path.join(tempfile.gettempdir(), "script.tar.gz")
-        cs.download_s3_resource(self.user_script_archive, tmp)
-        cs.untar_directory(tmp, self.code_dir)
+        cs.download_and_extract(self.user_script_archive, self.code_dir)
+        self.precompile_user_module()
+
+    def precompile_user_module(self):
+        """Compile the user-supplied python code to bytecode, in parallel.
+
+        Every process that imports the user module (one per model server worker) would otherwise compile
+        the sources on first import, racing the others to write ``__pycache__``. When ``code_dir`` is not
+        writable, e.g. code mounted read-only in the container, the bytecode is written to a cache directory
+        under the temp dir instead, which the current process and its children use through
+        ``PYTHONPYCACHEPREFIX`` (python 3.8+).
+        """
+        if not os.path.isdir(self.code_dir):
+            return
+
+        if not os.access(self.code_dir, os.W_OK):
+            if not hasattr(sys, 'pycache_prefix'):
+                logger.info("{} is read-only, skipping bytecode precompilation".format(self.code_dir))
+                return
+            sys.pycache_prefix = os.path.join(tempfile.gettempdir(), 'pycache')
+            os.environ['PYTHONPYCACHEPREFIX'] = sys.pycache_prefix
+
+        start = time.time()
+        files, compile_time = cs.compile_directory(self.code_dir)
+        logger.info("precompiled {} files in {:.2f}s, saving {:.2f}s of compilation in every process "
+                    "importing the user module".format(files, time.time() - start, compile_time))
 
     def import_user_module(self):
         """Import user-supplied python module.
@@ -116,24 +157,59 @@ class ContainerEnvironment(object):
             logger.info(output)
 
     def start_metrics_if_enabled(self):
+        """Starts telegraf if CloudWatch metrics are enabled, or the in-process host metrics agent instead
+        when ``SAGEMAKER_METRICS_FORMAT`` is set. See :mod:`container_support.metrics` for its settings.
+        """
         if self.enable_cloudwatch_metrics:
             logger.info("starting metrics service")
-            telegraf_conf = pkg_resources.resource_filename('container_support', 'etc/telegraf.conf')
-            subprocess.Popen(['telegraf', '--config', telegraf_conf])
+            if metrics.enabled():
+                self.metrics_agent = metrics.MetricsAgent.from_env().start()
+            else:
+                telegraf_conf = pkg_resources.resource_filename('container_support', 'etc/telegraf.conf')
+                subprocess.Popen(['telegraf', '--config', telegraf_conf])
 
     @staticmethod
     def load_framework():
-        """Import the deep learning framework needed for the current training job.
+        """Import the deep learning framework needed for the current job.
+
+        The framework module is resolved once per process, in order, from:
+
+        - the ``SAGEMAKER_FRAMEWORK_MODULE`` environment variable
+        - the ``sagemaker_container_support.frameworks`` setuptools entry point group
+        - the first installed legacy framework module (``mxnet_container``, ``tf_container``)
+
+        Only the resolved module is imported.
         """
-        # TODO less atrocious implementation -- perhaps set in env or hyperparameters?
-        try:
-            return importlib.import_module('mxnet_container')
-        except ImportError:
-            return importlib.import_module('tf_container')
+        if ContainerEnvironment._framework is None:
+            name = ContainerEnvironment._resolve_framework_module()
+            logger.info("loading framework module {}".format(name))
+            ContainerEnvironment._framework = importlib.import_module(name)
+        return ContainerEnvironment._framework
+
+    @staticmethod
+    def _resolve_framework_module():
+        name = os.environ.get(ContainerEnvironment.FRAMEWORK_MODULE_ENV)
+        if name:
+            return name
+
+        entry_points = list(pkg_resources.iter_entry_points(ContainerEnvironment.FRAMEWORK_ENTRY_POINT_GROUP))
+        if len(entry_points) > 1:
+            raise ValueError("multiple frameworks registered: {}. Set {} to choose one.".format(
+                ', '.join(str(ep) for ep in entry_points), ContainerEnvironment.FRAMEWORK_MODULE_ENV))
+        if entry_points:
+            return entry_points[0].module_name
+
+        for name in ContainerEnvironment.LEGACY_FRAMEWORK_MODULES:
+            if find_spec(name) is not None:
+                return name
+
+        raise ImportError("no framework module found. Set {} or register a {} entry point.".format(
+            ContainerEnvironment.FRAMEWORK_MODULE_ENV, ContainerEnvironment.FRAMEWORK_ENTRY_POINT_GROUP))
 
     @staticmethod
     def _get_available_cpus():
-        return multiprocessing.cpu_count()
+        # the cpus this process may run on, which cgroup cpusets and affinity masks can restrict
+        return len(affinity.available_cpus())
 
     @staticmethod
     def _get_available_gpus():
@@ -159,6 +235,15 @@ class TrainingEnvironment(ContainerEnvironment):
     RESOURCE_CONFIG_FILE = "resourceconfig.json"
     INPUT_DATA_CONFIG_FILE = "inputdataconfig.json"
     S3_URI_PARAM = 'sagemaker_s3_uri'
+    NUM_PROCESSES_PARAM = 'sagemaker_num_processes'
+    LOCAL_RANK_ENV = 'SAGEMAKER_LOCAL_RANK'
+    NUM_LOCAL_PROCESSES_ENV = 'SAGEMAKER_NUM_LOCAL_PROCESSES'
+    RANK_ENV = 'SAGEMAKER_RANK'
+    WORLD_SIZE_ENV = 'SAGEMAKER_WORLD_SIZE'
+    PROCESS_CPUS_ENV = 'SAGEMAKER_PROCESS_CPUS'
+    STAGE_CHANNELS_PARAM = 'sagemaker_stage_channels'
+    STAGED_CHANNEL_ENV = 'SAGEMAKER_STAGED_CHANNEL_{}'
+    TELEMETRY_INTERVAL_PARAM = 'sagemaker_telemetry_interval'
 
     def __init__(self, base_dir=ContainerEnvironment.BASE_DIRECTORY):
         super(TrainingEnvironment, self).__init__(base_dir)
@@ -197,7 +282,25 @@ class TrainingEnvironment(ContainerEnvironment):
         "dict of training input data channel name to directory with the input files for that channel."
 
         # TODO validate docstring
-        self.channel_dirs = {channel: self._get_channel_dir(channel) for channel in self.channels}
+        self.channel_dirs = {channel: os.environ.get(self._staged_channel_env(channel)) or
+                             self._get_channel_dir(channel) for channel in self.channels}
+
+        self._channel_indexes = {}
+
+        self.num_processes = self.hyperparameters.get(TrainingEnvironment.NUM_PROCESSES_PARAM, 1)
+        "The number of training processes to run on every host, or 'numa' for one per NUMA node."
+
+        self.stage_channels_param = self.hyperparameters.get(TrainingEnvironment.STAGE_CHANNELS_PARAM)
+        "The channels to stage on local scratch storage before training: a list of names, or 'all'."
+
+        self.telemetry_interval = self.hyperparameters.get(TrainingEnvironment.TELEMETRY_INTERVAL_PARAM)
+        "The interval in seconds at which training telemetry is sampled, or None to disable the time series."
+
+        self.local_rank = int(os.environ.get(TrainingEnvironment.LOCAL_RANK_ENV, 0))
+        "The index of the current training process on this host."
+
+        self.num_local_processes = int(os.environ.get(TrainingEnvironment.NUM_LOCAL_PROCESSES_ENV, 1))
+        "The number of training processes on this host."
 
         self.user_script_name = self.hyperparameters.get(ContainerEnvironment.USER_SCRIPT_NAME_PARAM, '')
         self.user_requirements_file = self.hyperparameters.get(ContainerEnvironment.USER_REQUIREMENTS_FILE_PARAM, None)
@@ -235,11 +338,198 @@ class TrainingEnvironment(ContainerEnvironment):
         with open(os.path.join(output_dir, 'failure'), 'a') as fd:
             fd.write(message)
 
+    def artifact_writer(self, root=None, upload_url=None, max_bytes_per_second=None):
+        """Returns an :class:`~container_support.artifacts.ArtifactWriter` that writes checkpoints and other
+        artifacts in a background thread. Pending artifacts are flushed before the success file is written.
+
+        :param root: the directory to write to (default: ``model_dir``), e.g. ``output_data_dir``
+        :param upload_url: an ``s3://`` or ``file://`` prefix every artifact is also uploaded to
+        :param max_bytes_per_second: the maximum write rate, or None for no limit
+        """
+        return artifacts.ArtifactWriter(root or self.model_dir, upload_url,
+                                        max_bytes_per_second=max_bytes_per_second)
+
     @staticmethod
     def ensure_directory(dir):
         if not os.path.exists(dir):
             os.makedirs(dir)
 
+    def rendezvous(self, metadata=None, port=None, timeout=rendezvous.DEFAULT_TIMEOUT):
+        """Waits for every host of the job to start and exchanges startup metadata with them over TCP.
+
+        The port defaults to ``SAGEMAKER_RENDEZVOUS_PORT`` or 7777. See :mod:`container_support.rendezvous`.
+
+        :param metadata: JSON serializable metadata of this host, e.g. the ports of its processes
+        :param timeout: the number of seconds to wait for the other hosts
+        :return: the joined :class:`~container_support.rendezvous.Rendezvous`, which has the ``metadata``
+                 and ``join_times`` of every host and can be used for further barriers
+        """
+        port = port or int(os.environ.get(rendezvous.PORT_ENV, rendezvous.DEFAULT_PORT))
+        joined = rendezvous.Rendezvous(self.hosts or [self.current_host], self.current_host, port, timeout)
+        joined.join(metadata)
+        return joined
+
+    def stage_channels(self, channels=None, target_dir=None, max_bytes=None, wait=True):
+        """Copies File mode channels to fast local storage in parallel and points ``channel_dirs`` at the copies.
+
+        Channels are staged in order until the space budget is used up, see :mod:`container_support.staging`.
+        Staged directories are exported as ``SAGEMAKER_STAGED_CHANNEL_<NAME>`` environment variables, so
+        processes started afterwards use them too.
+
+        :param channels: the channel names (default: the ``sagemaker_stage_channels`` hyperparameter,
+                         'all' for every File mode channel)
+        :param target_dir: the staging directory (default: ``SAGEMAKER_STAGING_DIR``)
+        :param max_bytes: the space budget (default: ``SAGEMAKER_STAGING_MAX_BYTES`` or 90% of the free space)
+        :param wait: if False, stage in the background and return the
+                     :class:`~container_support.staging.Stager` at once. Training can start on the source
+                     directories, ``channel_dirs`` is updated when staging completes.
+        :return: list of :class:`~container_support.staging.StagingReport`, or the Stager if wait is False
+        """
+        channels = self.stage_channels_param if channels is None else channels
+        if channels in ('all', True):
+            channels = sorted(self.channels)
+        elif isinstance(channels, six.string_types):
+            channels = [c.strip() for c in channels.split(',') if c.strip()]
+        channel_dirs = collections.OrderedDict(
+            (channel, self.channel_dirs[channel]) for channel in channels or [] if not self.is_pipe_mode(channel))
+
+        stager = staging.Stager(channel_dirs, target_dir, max_bytes, callback=self._use_staged_channels)
+        return stager.run() if wait else stager.start()
+
+    def _use_staged_channels(self, reports):
+        for report in reports:
+            if report.staged:
+                self.channel_dirs[report.channel] = report.path
+                os.environ[self._staged_channel_env(report.channel)] = report.path
+                for key in [key for key in self._channel_indexes if key[0] == report.channel]:
+                    del self._channel_indexes[key]
+
+    @staticmethod
+    def _staged_channel_env(channel):
+        return TrainingEnvironment.STAGED_CHANNEL_ENV.format(re.sub('[^A-Z0-9]', '_', channel.upper()))
+
+    def channel_index(self, channel, record_offsets=False):
+        """Returns the :class:`~container_support.channels.ChannelIndex` of a File mode channel.
+
+        The index is built once per channel and shared with the other processes of the job through
+        an on-disk cache.
+
+        :param record_offsets: also index the start offsets of the newline delimited records of every file
+        """
+        key = (channel, record_offsets)
+        if key not in self._channel_indexes:
+            self._channel_indexes[key] = channels.ChannelIndex.load(self.channel_dirs[channel], record_offsets)
+        return self._channel_indexes[key]
+
+    def channel_shard(self, channel, num_local_workers=None, local_rank=None, record_offsets=False):
+        """Returns the part of a File mode channel that the current process should read.
+
+        The channel is split into one shard per process over all hosts (``len(hosts) * num_local_workers``),
+        balancing bytes rather than files. Every host and process computes the same assignment.
+
+        :param channel: the channel name
+        :param num_local_workers: the number of processes reading the channel on every host
+                                  (default: ``num_local_processes``)
+        :param local_rank: the index of the current process on this host (default: ``local_rank``)
+        :param record_offsets: split large files into ranges at newline record boundaries
+        :return: list of (path, start offset, end offset) tuples
+        """
+        num_local_workers = self.num_local_processes if num_local_workers is None else num_local_workers
+        local_rank = self.local_rank if local_rank is None else local_rank
+        hosts = sorted(self.hosts) or [self.current_host]
+        shard_index = hosts.index(self.current_host) * num_local_workers + local_rank
+        index = self.channel_index(channel, record_offsets)
+        return index.shard(len(hosts) * num_local_workers, shard_index)
+
+    def channel_dataset(self, channel, record_size, header_size=0, paths=None, random_access=False):
+        """Memory maps the files of a File mode channel as a :class:`~container_support.channels.MappedDataset`
+        of fixed-size records, for zero-copy and random access without loading the files.
+
+        :param channel: the channel name
+        :param record_size: the size in bytes of every record
+        :param header_size: the number of bytes to skip at the start of every file
+        :param paths: the files to map (default: every file in the channel), e.g. from :meth:`channel_shard`
+        :param random_access: disable kernel read-ahead, for shuffled access
+        """
+        dataset = channels.MappedDataset(self._channel_paths(channel, paths), record_size, header_size, random_access)
+        return telemetry.InstrumentedDataset(dataset, telemetry.channel(channel))
+
+    def channel_csv(self, channel, delimiter=',', dtype='float32', skip_header=False, paths=None, cache=True):
+        """Parses the dense, numeric CSV files of a File mode channel into a 2-dimensional numpy array,
+        in parallel. See :func:`container_support.parsing.load_csv`.
+
+        :param channel: the channel name
+        :param delimiter: the field delimiter
+        :param dtype: the numpy dtype of the result
+        :param skip_header: skip the first line of every file
+        :param paths: the files to parse (default: every file in the channel)
+        :param cache: save the result and memory map it on later calls, from this or another process
+        """
+        paths = self._channel_paths(channel, paths)
+        start = time.time()
+        array = parsing.load_csv(paths, delimiter, dtype, skip_header, cache_dir=parsing.CACHE_DIR if cache else None)
+        _count_parsed(channel, paths, len(array), start)
+        return array
+
+    def channel_libsvm(self, channel, dtype='float32', zero_based=True, paths=None, cache=True):
+        """Parses the libsvm files of a File mode channel into the components of a CSR matrix, in parallel.
+        See :func:`container_support.parsing.load_libsvm`.
+
+        :param channel: the channel name
+        :param dtype: the numpy dtype of labels and values
+        :param zero_based: False if feature indices in the files start at 1
+        :param paths: the files to parse (default: every file in the channel)
+        :param cache: save the result and memory map it on later calls, from this or another process
+        :return: tuple (labels, indptr, indices, values) of numpy arrays
+        """
+        paths = self._channel_paths(channel, paths)
+        start = time.time()
+        result = parsing.load_libsvm(paths, dtype, zero_based, cache_dir=parsing.CACHE_DIR if cache else None)
+        _count_parsed(channel, paths, len(result[0]), start)
+        return result
+
+    def _channel_paths(self, channel, paths):
+        if paths is not None:
+            return paths
+        index = self.channel_index(channel)
+        return [os.path.join(index.root, name) for name, _ in index.files]
+
+    def is_pipe_mode(self, channel):
+        """Returns True if the data of the channel is streamed through named pipes (Pipe mode).
+        """
+        return self.channels.get(channel, {}).get('TrainingInputMode', 'File').lower() == 'pipe'
+
+    def channel_pipe(self, channel, epoch=0):
+        """Returns the path of the named pipe streaming the data of the channel for an epoch in Pipe mode.
+        """
+        return os.path.join(self.input_dir, 'data', '{}_{}'.format(channel, epoch))
+
+    def channel_records(self, channel, epoch=0, record_format=pipe.NEWLINE,
+                        buffer_size=pipe.DEFAULT_BUFFER_SIZE, prefetch=pipe.DEFAULT_PREFETCH):
+        """Streams the records of a Pipe mode channel for an epoch.
+
+        The pipe is read with large reads in a background thread, ``prefetch`` buffers ahead of
+        the training code. See :mod:`container_support.pipe`.
+
+        :param channel: the channel name
+        :param epoch: the epoch, i.e. the index of the pipe to read
+        :param record_format: 'newline', 'recordio' (MXNet) or 'tfrecord'
+        :param buffer_size: the size in bytes of each read
+        :param prefetch: the number of buffers to read ahead
+        :return: generator of ``memoryview`` records, which are valid as long as they are referenced
+        """
+        records = pipe.read_records(self.channel_pipe(channel, epoch), record_format, buffer_size, prefetch)
+        return telemetry.instrument_records(records, telemetry.channel(channel))
+
+    def open_channel_file(self, channel, path):
+        """Opens a file of a File mode channel for binary reading. Reads are counted in the channel's telemetry.
+
+        :param channel: the channel name
+        :param path: the path of the file, relative to the channel directory (or absolute)
+        """
+        f = open(os.path.join(self.channel_dirs[channel], path), 'rb')
+        return telemetry.InstrumentedFile(f, telemetry.channel(channel))
+
     def _get_channel_dir(self, channel):
         """ Returns the directory containing the channel data file(s).
 
@@ -255,7 +545,8 @@ class TrainingEnvironment(ContainerEnvironment):
         self.hyperparmeters. Otherwise, the second option is returned.
 
         TODO: Refactor once EASE downloads directly into /opt/ml/input/data/<channel>
-        TODO: Adapt for Pipe Mode
+
+        Channels in Pipe mode have no directory, see :meth:`channel_records` instead.
 
         Returns:
             (str) The input data directory for the specified channel.
@@ -275,6 +566,16 @@ class HostingEnvironment(ContainerEnvironment):
 
     MODEL_SERVER_WORKERS_PARAM = 'SAGEMAKER_MODEL_SERVER_WORKERS'
     MODEL_SERVER_TIMEOUT_PARAM = "SAGEMAKER_MODEL_SERVER_TIMEOUT"
+    MODEL_SERVER_CPU_AFFINITY_PARAM = "SAGEMAKER_MODEL_SERVER_CPU_AFFINITY"
+    MODEL_SERVER_WORKER_THREADS_PARAM = "SAGEMAKER_MODEL_SERVER_WORKER_THREADS"
+    PRELOAD_FRAMEWORK_PARAM = "SAGEMAKER_PRELOAD_FRAMEWORK"
+    RAW_WSGI_PARAM = "SAGEMAKER_MODEL_SERVER_RAW_WSGI"
+    MODEL_SERVER_MIN_WORKERS_PARAM = "SAGEMAKER_MODEL_SERVER_MIN_WORKERS"
+    MODEL_SERVER_MAX_WORKERS_PARAM = "SAGEMAKER_MODEL_SERVER_MAX_WORKERS"
+    MODEL_SERVER_WORKER_MEMORY_PARAM = "SAGEMAKER_MODEL_SERVER_WORKER_MEMORY"
+    PIPELINE_PARAM = "SAGEMAKER_MODEL_SERVER_PIPELINE"
+    PIPELINE_WORKERS_PARAM = "SAGEMAKER_MODEL_SERVER_PIPELINE_WORKERS"
+    REUSE_PORT_PARAM = "SAGEMAKER_MODEL_SERVER_REUSE_PORT"
 
     def __init__(self, base_dir=ContainerEnvironment.BASE_DIRECTORY):
         super(HostingEnvironment, self).__init__(base_dir)
@@ -289,11 +590,45 @@ class HostingEnvironment(ContainerEnvironment):
         self.use_nginx = os.environ.get(ContainerEnvironment.USE_NGINX_ENV, 'true') == 'true'
         "Use nginx as front-end HTTP server instead of gunicorn."
 
+        self.model_server_reuse_port = os.environ.get(HostingEnvironment.REUSE_PORT_PARAM, 'false').lower() == 'true'
+        "Model server processes listen on 8080 with SO_REUSEPORT, without nginx or autoscaling (default = False)."
+
         self.model_server_workers = int(os.environ.get(
             HostingEnvironment.MODEL_SERVER_WORKERS_PARAM,
             self.available_cpus))
         "The number of model server processes to run concurrently."
 
+        self.model_server_min_workers = int(os.environ.get(
+            HostingEnvironment.MODEL_SERVER_MIN_WORKERS_PARAM, self.model_server_workers))
+        self.model_server_max_workers = int(os.environ.get(
+            HostingEnvironment.MODEL_SERVER_MAX_WORKERS_PARAM, self.model_server_workers))
+        "Bounds of the number of model server processes, scaled with the load when they differ (default = workers)."
+
+        self.model_server_worker_memory = int(os.environ.get(HostingEnvironment.MODEL_SERVER_WORKER_MEMORY_PARAM, 0))
+        "Memory, in bytes, that must be available to add a model server process (default = largest process size)."
+
+        self.model_server_cpu_affinity = os.environ.get(
+            HostingEnvironment.MODEL_SERVER_CPU_AFFINITY_PARAM, 'false').lower() == 'true'
+        "Pin each model server process to its own set of cpus, NUMA node aware (default = False)."
+
+        self.model_server_worker_threads = int(os.environ.get(
+            HostingEnvironment.MODEL_SERVER_WORKER_THREADS_PARAM,
+            affinity.threads_per_worker(self.model_server_max_workers, self.available_cpus)))
+        "The number of intra-op (OpenMP/MKL/OpenBLAS) threads per model server process, sized for max workers."
+
+        self.preload_framework = os.environ.get(HostingEnvironment.PRELOAD_FRAMEWORK_PARAM, 'false').lower() == 'true'
+        "Import the framework in the gunicorn master so that forked workers inherit it (default = False)."
+
+        self.model_server_raw_wsgi = os.environ.get(HostingEnvironment.RAW_WSGI_PARAM, 'false').lower() == 'true'
+        "Serve requests with the minimal WSGI application instead of the Flask app (default = False)."
+
+        self.model_server_pipeline = os.environ.get(HostingEnvironment.PIPELINE_PARAM, 'false').lower() == 'true'
+        "Run the input, predict and output stages of invocations in separate thread pools (default = False)."
+
+        self.model_server_pipeline_workers = pipeline.parse_workers(os.environ.get(
+            HostingEnvironment.PIPELINE_WORKERS_PARAM, ','.join(str(n) for n in pipeline.DEFAULT_WORKERS)))
+        "The number of threads of the input, predict and output stages of the pipeline (default = 2,1,2)."
+
         self.container_log_level = int(os.environ[ContainerEnvironment.CONTAINER_LOG_LEVEL_PARAM.upper()])
 
         self.sagemaker_region = os.environ[ContainerEnvironment.SAGEMAKER_REGION_PARAM_NAME.upper()]
@@ -303,8 +638,15 @@ class HostingEnvironment(ContainerEnvironment):
             ContainerEnvironment.JOB_NAME_PARAM.upper(), '')
 
 
+def _count_parsed(channel, paths, rows, start):
+    telemetry.channel(channel).add(sum(os.path.getsize(path) for path in paths), rows, time.time() - start)
+
+
 def configure_logging():
-    format = '%(asctime)s %(levelname)s - %(name)s - %(message)s'
+    """Configures the root logger with the container log level. Records are written to stdout by a
+    background thread, as text or JSON (``SAGEMAKER_LOG_FORMAT``), and dropped rather than blocking the
+    caller when more than ``SAGEMAKER_LOG_QUEUE_SIZE`` are waiting (0 writes synchronously).
+    """
     default_level = logging.INFO
 
     level = None
@@ -316,7 +658,9 @@ def configure_logging():
         except:  # noqa
             pass
 
-    logging.basicConfig(format=format, level=level or default_level)
+    logs.install(level=level or default_level,
+                 log_format=os.environ.get(logs.FORMAT_ENV, logs.TEXT).lower(),
+                 queue_size=int(os.environ.get(logs.QUEUE_SIZE_ENV, logs.DEFAULT_QUEUE_SIZE)))
 
     if not level:
         logging.warn("error reading log_level, using INFO")
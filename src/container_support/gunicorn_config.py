@@ -0,0 +1,124 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""Gunicorn server hooks used by the model server, loaded with ``-c python:container_support.gunicorn_config``.
+"""
+
+import os
+import socket
+
+from container_support import affinity, autoscaling
+from container_support.environment import ContainerEnvironment, HostingEnvironment
+
+# the address every worker listens on in SO_REUSEPORT mode
+REUSE_PORT_ADDRESS = ('0.0.0.0', 8080)
+
+_cpu_sets = {}
+_slots = []
+
+
+def on_starting(server):
+    """Runs in the gunicorn master before any worker is forked.
+    """
+    if os.environ.get(HostingEnvironment.PRELOAD_FRAMEWORK_PARAM, 'false').lower() == 'true':
+        framework = ContainerEnvironment.load_framework()
+        server.log.info("preloaded framework %s", framework.__name__)
+
+
+def pre_fork(server, worker):
+    """Runs in the gunicorn master. Assigns the new worker the lowest slot not used by a live worker,
+    so that replacement workers take over the cpu set of the worker they replace.
+    """
+    used = set(getattr(w, 'slot', None) for w in server.WORKERS.values())
+    slot = 0
+    while slot in used:
+        slot += 1
+    worker.slot = slot
+
+
+def post_fork(server, worker):
+    """Runs in the new worker before the application is loaded.
+    """
+    slots = _worker_slots()
+    if slots is not None:
+        slots.assign(worker.slot, worker.pid)
+
+    if os.environ.get(HostingEnvironment.REUSE_PORT_PARAM, 'false').lower() == 'true':
+        worker.sockets = [_reuse_port_listener(worker, REUSE_PORT_ADDRESS)]
+        server.log.info("worker %s listening on %s:%s with SO_REUSEPORT", worker.pid, *REUSE_PORT_ADDRESS)
+
+    if os.environ.get(HostingEnvironment.MODEL_SERVER_CPU_AFFINITY_PARAM, 'false').lower() == 'true':
+        cpus = _cpu_set(worker.slot, _max_workers(server))
+        if affinity.pin_to_cpus(cpus):
+            server.log.info("worker %s (slot %s) pinned to cpus %s", worker.pid, worker.slot, cpus)
+
+
+def pre_request(worker, req):
+    slots = _worker_slots()
+    if slots is not None:
+        slots.begin_request(worker.slot)
+
+
+def post_request(worker, req, environ, resp):
+    slots = _worker_slots()
+    if slots is not None:
+        slots.end_request(worker.slot)
+
+
+def child_exit(server, worker):
+    """Runs in the gunicorn master after a worker exited. Frees its slot for the autoscaler.
+    """
+    slots = _worker_slots()
+    if slots is not None:
+        slots.assign(worker.slot, 0)
+
+
+def _reuse_port_listener(worker, address):
+    """Binds a listener of the worker's own, replacing the listeners inherited from the master.
+    The kernel balances the connections across all the sockets bound to the address.
+    """
+    from gunicorn.sock import TCPSocket
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        # gunicorn sets the options of the listener and listens with the configured backlog
+        listener = TCPSocket(address, worker.cfg, worker.log, fd=os.dup(sock.fileno()))
+    finally:
+        sock.close()
+
+    for inherited in worker.sockets:
+        inherited.sock.close()
+    return listener
+
+
+def _worker_slots():
+    # opened once per process: workers map the file after the fork
+    if not _slots or _slots[0][0] != os.getpid():
+        _slots[:] = [(os.getpid(), autoscaling.WorkerSlots.from_env())]
+    return _slots[0][1]
+
+
+def _max_workers(server):
+    # when the autoscaler adds workers, the cpu sets of the running workers must stay disjoint from theirs,
+    # so the cpus are partitioned for the largest number of workers
+    return max(server.num_workers, int(os.environ.get(HostingEnvironment.MODEL_SERVER_MAX_WORKERS_PARAM, 0)))
+
+
+def _cpu_set(slot, num_workers):
+    if num_workers not in _cpu_sets:
+        _cpu_sets[num_workers] = affinity.partition_cpus(num_workers)
+    cpu_sets = _cpu_sets[num_workers]
+    return cpu_sets[slot % len(cpu_sets)]
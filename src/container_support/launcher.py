@@ -0,0 +1,173 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Runs the training of a host in several local processes.
+
+Each process gets its local and global rank, a disjoint cpu set (within a single NUMA node when possible)
+and a matching thread budget through environment variables, which :class:`~container_support.TrainingEnvironment`
+reads to shard channels between the processes. The processes are supervised: when one fails, the others are
+terminated and the failure is raised with the exit code of the failed process.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+
+from six.moves import queue
+
+from container_support import affinity, artifacts, logs, telemetry
+from container_support.environment import TrainingEnvironment
+
+logger = logging.getLogger(__name__)
+
+NUMA = 'numa'
+
+POLL_INTERVAL = 0.1
+TERMINATE_TIMEOUT = 10
+
+
+class WorkerError(Exception):
+    """A training process failed. ``errno`` is the exit code of the process.
+    """
+
+    def __init__(self, message, errno):
+        super(WorkerError, self).__init__(message)
+        self.errno = errno
+
+
+def num_processes(value, nodes=None):
+    """Returns the number of local processes for the ``sagemaker_num_processes`` hyperparameter:
+    a number, or 'numa' for one process per NUMA node.
+    """
+    if str(value).lower() == NUMA:
+        return len(nodes or affinity.numa_nodes())
+    count = int(value)
+    if count < 1:
+        raise ValueError("invalid number of processes: {}".format(value))
+    return count
+
+
+def launch(env, count, target=None):
+    """Runs target in count local processes and waits for all of them to finish.
+
+    :param env: the :class:`~container_support.TrainingEnvironment` of the job
+    :param count: the number of processes
+    :param target: the function run by every process (default: load the framework and train)
+    :raises WorkerError: if a process fails
+    """
+    hosts = sorted(env.hosts) or [env.current_host]
+    host_rank = hosts.index(env.current_host) if env.current_host in hosts else 0
+    errors = multiprocessing.Queue()
+
+    processes = []
+    for local_rank, cpus in enumerate(affinity.partition_cpus(count)):
+        environ = {
+            TrainingEnvironment.LOCAL_RANK_ENV: str(local_rank),
+            TrainingEnvironment.NUM_LOCAL_PROCESSES_ENV: str(count),
+            TrainingEnvironment.RANK_ENV: str(host_rank * count + local_rank),
+            TrainingEnvironment.WORLD_SIZE_ENV: str(len(hosts) * count),
+            TrainingEnvironment.PROCESS_CPUS_ENV: ','.join(str(cpu) for cpu in cpus),
+        }
+        process = multiprocessing.Process(target=_run_worker, args=(target or _train, environ, cpus, errors),
+                                          name='training-process-{}'.format(local_rank))
+        process.start()
+        logger.info("started training process {} (pid {}) on cpus {}".format(local_rank, process.pid, cpus))
+        processes.append(process)
+
+    _supervise(processes, errors)
+
+
+def _train():
+    TrainingEnvironment.load_framework().train()
+
+
+def _run_worker(target, environ, cpus, errors):
+    os.environ.update(environ)
+    # before the framework loads its math libraries
+    affinity.set_thread_budget(len(cpus))
+    affinity.pin_to_cpus(cpus)
+    session = telemetry.active()
+    if session is not None:
+        # the sampler thread of the launcher does not survive the fork
+        telemetry.start(session.output_dir, session.interval,
+                        'process-{}'.format(environ[TrainingEnvironment.LOCAL_RANK_ENV]))
+    try:
+        target()
+        artifacts.flush_all()
+        telemetry.finish()
+    except Exception as e:
+        message = 'uncaught exception in training process {}: {}\n{}\n'.format(
+            environ[TrainingEnvironment.LOCAL_RANK_ENV], e, traceback.format_exc())
+        logger.error(message)
+        errors.put((int(environ[TrainingEnvironment.LOCAL_RANK_ENV]), message))
+        errors.close()
+        errors.join_thread()
+        sys.exit(getattr(e, 'errno', None) or 1)
+    finally:
+        # forked processes exit without running the atexit handlers
+        logs.shutdown()
+
+
+def _supervise(processes, errors):
+    """Waits for the processes, stopping all of them when one fails.
+
+    :param processes: the processes, by local rank
+    :param errors: the queue the processes put (local rank, error message) on
+    """
+    failed = None
+    deadline = None
+    messages = {}
+    while any(p.is_alive() for p in processes):
+        # read while the processes run: a process putting a message larger than the pipe buffer
+        # only exits once it has been read
+        _drain(errors, messages)
+        if failed is None:
+            failed = next((p for p in processes if p.exitcode not in (None, 0)), None)
+            if failed is not None:
+                logger.error("{} exited with code {}, stopping the other processes".format(failed.name,
+                                                                                          failed.exitcode))
+                for p in processes:
+                    if p.is_alive():
+                        p.terminate()
+                deadline = time.time() + TERMINATE_TIMEOUT
+        elif time.time() > deadline:
+            for p in processes:
+                if p.is_alive():
+                    os.kill(p.pid, signal.SIGKILL)
+        time.sleep(POLL_INTERVAL)
+
+    for p in processes:
+        p.join()
+    _drain(errors, messages)
+    failed = failed or next((p for p in processes if p.exitcode != 0), None)
+    if failed is None:
+        return
+
+    # processes killed by a signal exit like a shell reports them
+    code = failed.exitcode if failed.exitcode > 0 else 128 - failed.exitcode
+    message = messages.get(processes.index(failed)) or '{} exited with code {}\n'.format(failed.name, code)
+    raise WorkerError(message, code)
+
+
+def _drain(errors, messages):
+    while True:
+        try:
+            rank, message = errors.get_nowait()
+        except queue.Empty:
+            return
+        messages[rank] = message
@@ -0,0 +1,321 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Non-blocking, optionally JSON formatted, logging.
+
+:func:`install` replaces the handlers of the root logger with a :class:`QueueHandler`: records are
+formatted on the calling thread and put on a bounded queue, and a single daemon thread writes them to
+the stream. The writer is an OS thread even when gevent patched ``threading``, so that a stalled stream
+does not block the greenlets of a gevent worker. When the queue is full, records are dropped and counted
+instead of blocking the caller; the number of dropped records is logged as soon as the writer catches up.
+
+:class:`RequestLog` logs one line per request, sampled and rate limited, with the id of the request.
+"""
+
+import atexit
+import collections
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import six
+from six.moves import queue
+
+FORMAT_ENV = 'SAGEMAKER_LOG_FORMAT'
+QUEUE_SIZE_ENV = 'SAGEMAKER_LOG_QUEUE_SIZE'
+REQUEST_LOG_SAMPLE_RATE_ENV = 'SAGEMAKER_REQUEST_LOG_SAMPLE_RATE'
+REQUEST_LOG_MAX_PER_SECOND_ENV = 'SAGEMAKER_REQUEST_LOG_MAX_PER_SECOND'
+
+TEXT = 'text'
+JSON = 'json'
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s - %(name)s - %(message)s'
+
+DEFAULT_QUEUE_SIZE = 10000
+
+_STOP = object()
+
+
+def _unpatched(name):
+    # the original thread primitives, when gevent patched them to run greenlets
+    module = 'thread' if six.PY2 else '_thread'
+    try:
+        from gevent import monkey
+    except ImportError:
+        return getattr(__import__(module), name)
+    return monkey.get_original(module, name)
+
+
+class _Queue(object):
+    """A bounded queue for a single consumer built on the unpatched thread primitives: the producers never
+    block, and the consumer blocks its OS thread without involving the gevent hub.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = collections.deque()
+        self._ready = _unpatched('allocate_lock')()
+        self._ready.acquire()
+
+    def put_nowait(self, item, force=False):
+        if not force and len(self._items) >= self.maxsize:
+            raise queue.Full
+        self._items.append(item)
+        try:
+            self._ready.release()
+        except Exception:  # noqa: already released, the consumer has not woken up yet
+            pass
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def get(self):
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                self._ready.acquire()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line JSON objects. The ``request_id`` of a record, if any, is included.
+    """
+
+    def format(self, record):
+        entry = {'time': round(record.created, 6),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage(),
+                 'process': record.process}
+        request_id = getattr(record, 'request_id', None)
+        if request_id is not None:
+            entry['request_id'] = request_id
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueHandler(logging.Handler):
+    """Formats records on the calling thread and writes them to a stream on a background thread.
+
+    ``emit`` never blocks: records that do not fit in the queue are dropped and counted in ``dropped``.
+    The writer thread is started on first use in every process, so handlers installed before a fork keep
+    working in the children.
+    """
+
+    def __init__(self, stream=None, queue_size=DEFAULT_QUEUE_SIZE, level=logging.NOTSET):
+        """
+        :param stream: the stream to write to (default: sys.stdout)
+        :param queue_size: the number of records buffered before records are dropped
+        """
+        super(QueueHandler, self).__init__(level)
+        self.stream = stream
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._reported = 0
+        self._queue = None
+        self._stopped = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:  # noqa
+            self.handleError(record)
+            return
+
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = _Queue(self.queue_size)
+            self._stopped = _unpatched('allocate_lock')()
+            self._stopped.acquire()
+            _unpatched('start_new_thread')(self._run, (self._queue, self._stopped))
+            self._pid = os.getpid()
+
+    def _run(self, messages, stopped):
+        try:
+            while True:
+                message = messages.get()
+                if message is _STOP:
+                    return
+                lines = [message]
+                # write what is already queued with a single call
+                while len(lines) < 1000:
+                    try:
+                        message = messages.get_nowait()
+                    except queue.Empty:
+                        break
+                    if message is _STOP:
+                        self._write(lines)
+                        return
+                    lines.append(message)
+                self._write(lines)
+        finally:
+            stopped.release()
+
+    def _write(self, lines):
+        dropped = self.dropped
+        if dropped > self._reported:
+            lines.append(self.format(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'dropped %d log records, the log writer is falling behind',
+                'args': (dropped - self._reported,)})))
+            self._reported = dropped
+
+        stream = self.stream or sys.stdout
+        try:
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+        except Exception:  # noqa
+            pass
+
+    def flush_and_stop(self):
+        """Writes the queued records and stops the writer thread, which is started again by the next record.
+        """
+        with self._start_lock:
+            if self._pid == os.getpid():
+                # every record queued before is written
+                self._queue.put_nowait(_STOP, force=True)
+                self._stopped.acquire()
+            self._pid = None
+
+    def close(self):
+        """Writes the queued records and stops the writer thread.
+        """
+        self.flush_and_stop()
+        super(QueueHandler, self).close()
+
+
+def install(level=logging.INFO, log_format=TEXT, queue_size=DEFAULT_QUEUE_SIZE, stream=None, force=False):
+    """Configures the root logger to write to stdout, like ``logging.basicConfig``: nothing is done if
+    the root logger already has handlers, unless force is True.
+
+    :param log_format: 'text' or 'json'
+    :param queue_size: the size of the queue of the non-blocking handler, or 0 to write synchronously
+    :param force: replace the handlers of the root logger
+    :return: the handler installed, or None
+    """
+    if log_format not in (TEXT, JSON):
+        raise ValueError("unsupported log format: {}. Supported formats: {}, {}".format(log_format, TEXT, JSON))
+
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return None
+
+    if queue_size:
+        handler = QueueHandler(stream, queue_size)
+        atexit.register(handler.close)
+    else:
+        handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == JSON else logging.Formatter(TEXT_FORMAT))
+
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def shutdown():
+    """Writes the queued records of the non-blocking handlers of the root logger and stops their writer threads.
+
+    Call before ``os._exit`` and at the end of forked processes, which skip the ``atexit`` handlers. Handlers
+    are left installed: records logged afterwards start a new writer thread.
+    """
+    for handler in list(logging.getLogger().handlers):
+        if isinstance(handler, QueueHandler):
+            handler.flush_and_stop()
+
+
+class RequestLog(object):
+    """Logs one record per request, for a random sample of the requests and at most ``max_per_second``
+    records per second. Requests that are not logged are counted in ``suppressed``.
+    """
+
+    def __init__(self, logger, sample_rate=1.0, max_per_second=None, clock=time.time):
+        """
+        :param logger: the logger to log to, at INFO level
+        :param sample_rate: the fraction of the requests logged
+        :param max_per_second: the maximum number of records logged per second, None for no limit
+        """
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.suppressed = 0
+        self._clock = clock
+        self._tokens = max_per_second
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, logger):
+        """Returns the request log configured with ``SAGEMAKER_REQUEST_LOG_*`` environment variables,
+        or None if request logging is disabled (the default).
+        """
+        sample_rate = float(os.environ.get(REQUEST_LOG_SAMPLE_RATE_ENV, 0))
+        if sample_rate <= 0:
+            return None
+        max_per_second = os.environ.get(REQUEST_LOG_MAX_PER_SECOND_ENV)
+        return cls(logger, sample_rate, float(max_per_second) if max_per_second else None)
+
+    def should_log(self):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.suppressed += 1
+            return False
+        if self.max_per_second is None:
+            return True
+
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.max_per_second, self._tokens + (now - self._last) * self.max_per_second)
+            self._last = now
+            if self._tokens < 1:
+                self.suppressed += 1
+                return False
+            self._tokens -= 1
+            return True
+
+    def log(self, request_id, message, **fields):
+        """Logs message for the request if it is sampled and within the rate limit.
+
+        :param fields: extra fields of the record, included in the JSON output
+        :return: True if the record was logged
+        """
+        if not self.should_log():
+            return False
+        self.logger.info('[%s] %s', request_id, message, extra={'request_id': request_id, 'fields': fields})
+        return True
@@ -0,0 +1,465 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""An in-process agent collecting host metrics from /proc and emitting them in StatsD or CloudWatch
+embedded metric format (EMF).
+
+A single daemon thread reads the cpu, memory, disk, disk I/O and network counters of the host from
+``/proc`` (and the disk usage with ``statvfs``) at a fixed interval, and sends every batch over UDP
+(``udp://host:port``, e.g. to the CloudWatch agent) or appends it to a file (``file:///path``).
+GPU utilization is read from NVML when ``pynvml`` is installed, otherwise from a single long-running
+``nvidia-smi`` process if there is one on the ``PATH``.
+
+The agent is opt-in: :meth:`~container_support.ContainerEnvironment.start_metrics_if_enabled` runs it instead
+of telegraf only when ``SAGEMAKER_METRICS_FORMAT`` is set to ``emf`` or ``statsd``.
+
+The time the agent spends collecting and emitting is measured and reported as the ``agent_overhead``
+metric. When it exceeds ``max_overhead`` of the interval, the interval is doubled.
+"""
+
+import collections
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+try:
+    from shutil import which
+except ImportError:  # python 2
+    from distutils.spawn import find_executable as which
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_ENV = 'SAGEMAKER_METRICS_INTERVAL'
+FORMAT_ENV = 'SAGEMAKER_METRICS_FORMAT'
+DESTINATION_ENV = 'SAGEMAKER_METRICS_DESTINATION'
+
+EMF = 'emf'
+STATSD = 'statsd'
+
+DEFAULT_INTERVAL = 60
+DEFAULT_NAMESPACE = 'SageMaker/Container'
+DEFAULT_DESTINATIONS = {EMF: 'udp://127.0.0.1:25888', STATSD: 'udp://127.0.0.1:8125'}
+DEFAULT_MAX_OVERHEAD = 0.01
+
+IGNORED_FILESYSTEMS = {'tmpfs', 'devtmpfs', 'devfs', 'proc', 'sysfs', 'cgroup', 'cgroup2', 'overlay', 'squashfs',
+                       'mqueue', 'devpts', 'securityfs', 'pstore', 'debugfs', 'tracefs', 'configfs', 'fusectl',
+                       'hugetlbfs', 'autofs', 'bpf', 'nsfs', 'binfmt_misc', 'rpc_pipefs'}
+
+# stay under the usual path MTU
+MAX_DATAGRAM_SIZE = 1432
+_EMF_MAX_METRICS = 100
+_SECTOR_SIZE = 512
+
+Metric = collections.namedtuple('Metric', 'name value unit dimensions')
+
+
+def _metric(name, value, unit, **dimensions):
+    return Metric(name, value, unit, dimensions)
+
+
+class CpuCollector(object):
+    """Cpu utilization and I/O wait of the host, in percent, from ``/proc/stat``.
+    """
+
+    def __init__(self, proc='/proc'):
+        self.path = os.path.join(proc, 'stat')
+        self._last = self._read()
+
+    def _read(self):
+        with open(self.path) as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+        # user nice system idle iowait irq softirq steal, guest time is included in user
+        return sum(values[:8]), values[3] + values[4], values[4]
+
+    def collect(self):
+        total, idle, iowait = self._read()
+        last_total, last_idle, last_iowait = self._last
+        self._last = total, idle, iowait
+        elapsed = float(total - last_total)
+        if elapsed <= 0:
+            return []
+        return [_metric('cpu_utilization', round(100 * (1 - (idle - last_idle) / elapsed), 2), 'Percent'),
+                _metric('cpu_iowait', round(100 * (iowait - last_iowait) / elapsed, 2), 'Percent')]
+
+
+class MemoryCollector(object):
+    """Memory usage of the host, from ``/proc/meminfo``.
+    """
+
+    def __init__(self, proc='/proc'):
+        self.path = os.path.join(proc, 'meminfo')
+
+    def collect(self):
+        info = {}
+        with open(self.path) as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                info[name] = int(value.split()[0]) * 1024
+        total = info['MemTotal']
+        available = info.get('MemAvailable', info.get('MemFree', 0) + info.get('Cached', 0))
+        return [_metric('mem_used', total - available, 'Bytes'),
+                _metric('mem_used_percent', round(100.0 * (total - available) / total, 2), 'Percent')]
+
+
+class DiskCollector(object):
+    """Used space of the mounted filesystems, from ``/proc/mounts`` and ``statvfs``.
+    """
+
+    def __init__(self, proc='/proc'):
+        self.path = os.path.join(proc, 'mounts')
+
+    def collect(self):
+        metrics = []
+        seen = set()
+        with open(self.path) as f:
+            mounts = [line.split() for line in f]
+        for fields in mounts:
+            device, path, fs_type = fields[0], fields[1], fields[2]
+            if fs_type in IGNORED_FILESYSTEMS or device in seen:
+                continue
+            seen.add(device)
+            try:
+                stat = os.statvfs(path)
+            except OSError:
+                continue
+            if not stat.f_blocks:
+                continue
+            used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+            usable = used + stat.f_bavail * stat.f_frsize
+            metrics.append(_metric('disk_used_percent', round(100.0 * used / usable, 2), 'Percent', path=path))
+        return metrics
+
+
+class _RateCollector(object):
+    """Turns the cumulative counters read by ``_read`` into per second rates.
+    """
+
+    def __init__(self):
+        self._last = self._read(), time.time()
+
+    def collect(self):
+        counters, now = self._read(), time.time()
+        last, last_time = self._last
+        self._last = counters, now
+        elapsed = now - last_time
+        if elapsed <= 0:
+            return []
+        metrics = []
+        for (name, unit, dimensions), value in sorted(counters.items()):
+            if (name, unit, dimensions) in last:
+                rate = max(0, value - last[(name, unit, dimensions)]) / elapsed
+                metrics.append(Metric(name, round(rate, 2), unit, dict(dimensions)))
+        return metrics
+
+
+class DiskIOCollector(_RateCollector):
+    """Bytes read and written per second by every block device, from ``/proc/diskstats``.
+    """
+
+    def __init__(self, proc='/proc'):
+        self.path = os.path.join(proc, 'diskstats')
+        super(DiskIOCollector, self).__init__()
+
+    def _read(self):
+        counters = {}
+        with open(self.path) as f:
+            for line in f:
+                fields = line.split()
+                device = fields[2]
+                if device.startswith(('loop', 'ram')):
+                    continue
+                dimensions = (('device', device),)
+                counters[('diskio_read_bytes', 'Bytes/Second', dimensions)] = int(fields[5]) * _SECTOR_SIZE
+                counters[('diskio_write_bytes', 'Bytes/Second', dimensions)] = int(fields[9]) * _SECTOR_SIZE
+        return counters
+
+
+class NetworkCollector(_RateCollector):
+    """Bytes received and sent per second by every network interface but the loopback, from ``/proc/net/dev``.
+    """
+
+    def __init__(self, proc='/proc'):
+        self.path = os.path.join(proc, 'net', 'dev')
+        super(NetworkCollector, self).__init__()
+
+    def _read(self):
+        counters = {}
+        with open(self.path) as f:
+            for line in f.readlines()[2:]:
+                interface, values = line.split(':', 1)
+                interface = interface.strip()
+                if interface == 'lo':
+                    continue
+                values = values.split()
+                dimensions = (('interface', interface),)
+                counters[('net_bytes_recv', 'Bytes/Second', dimensions)] = int(values[0])
+                counters[('net_bytes_sent', 'Bytes/Second', dimensions)] = int(values[8])
+        return counters
+
+
+class GpuCollector(object):
+    """GPU utilization and memory, from NVML or a single ``nvidia-smi`` process started in loop mode.
+    """
+
+    def __init__(self, interval):
+        self._nvml = None
+        self._process = None
+        self._latest = {}
+        try:
+            import pynvml
+            pynvml.nvmlInit()
+            self._nvml = pynvml
+        except Exception:  # noqa
+            if not which('nvidia-smi'):
+                raise RuntimeError("no NVML and no nvidia-smi")
+            self._process = subprocess.Popen(
+                ['nvidia-smi', '--query-gpu=index,utilization.gpu,memory.used', '--format=csv,noheader,nounits',
+                 '-lms', str(int(interval * 1000))], stdout=subprocess.PIPE, universal_newlines=True)
+            thread = threading.Thread(target=self._read_process, name='metrics-nvidia-smi')
+            thread.daemon = True
+            thread.start()
+
+    def _read_process(self):
+        for line in self._process.stdout:
+            try:
+                index, utilization, memory = [v.strip() for v in line.split(',')]
+                self._latest[index] = float(utilization), float(memory) * 1024 ** 2
+            except ValueError:
+                continue
+
+    def collect(self):
+        if self._nvml is not None:
+            metrics = []
+            for i in range(self._nvml.nvmlDeviceGetCount()):
+                handle = self._nvml.nvmlDeviceGetHandleByIndex(i)
+                utilization = self._nvml.nvmlDeviceGetUtilizationRates(handle)
+                memory = self._nvml.nvmlDeviceGetMemoryInfo(handle)
+                metrics.append(_metric('gpu_utilization', utilization.gpu, 'Percent', gpu=str(i)))
+                metrics.append(_metric('gpu_memory_used', memory.used, 'Bytes', gpu=str(i)))
+            return metrics
+        return [metric for index, (utilization, memory) in sorted(self._latest.items())
+                for metric in (_metric('gpu_utilization', utilization, 'Percent', gpu=index),
+                               _metric('gpu_memory_used', memory, 'Bytes', gpu=index))]
+
+    def close(self):
+        if self._process is not None:
+            self._process.terminate()
+
+
+def format_statsd(metrics, prefix='sagemaker', dimensions=None):
+    """Formats metrics as StatsD gauges, with DogStatsD style tags.
+    """
+    lines = []
+    for m in metrics:
+        tags = dict(dimensions or {}, **m.dimensions)
+        line = '{}.{}:{}|g'.format(prefix, m.name, m.value)
+        if tags:
+            line += '|#' + ','.join('{}:{}'.format(k, v) for k, v in sorted(tags.items()))
+        lines.append(line)
+    return lines
+
+
+def format_emf(metrics, namespace=DEFAULT_NAMESPACE, dimensions=None, timestamp=None):
+    """Formats metrics as CloudWatch embedded metric format documents, one per set of dimensions.
+    """
+    timestamp = int((timestamp or time.time()) * 1000)
+    groups = collections.OrderedDict()
+    for m in metrics:
+        key = tuple(sorted(m.dimensions.items()))
+        groups.setdefault(key, []).append(m)
+
+    documents = []
+    for key, group in groups.items():
+        for start in range(0, len(group), _EMF_MAX_METRICS):
+            chunk = group[start:start + _EMF_MAX_METRICS]
+            document = dict(dimensions or {}, **dict(key))
+            document['_aws'] = {'Timestamp': timestamp,
+                                'CloudWatchMetrics': [{'Namespace': namespace,
+                                                       'Dimensions': [sorted(k for k in document if k != '_aws')],
+                                                       'Metrics': [{'Name': m.name, 'Unit': m.unit} for m in chunk]}]}
+            for m in chunk:
+                document[m.name] = m.value
+            documents.append(json.dumps(document, sort_keys=True, separators=(',', ':')))
+    return documents
+
+
+class UdpSink(object):
+    """Sends lines over UDP, packing several lines per datagram if ``pack`` is True.
+    """
+
+    def __init__(self, host, port, pack=False):
+        self.address = (host, port)
+        self.pack = pack
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, lines):
+        datagrams = []
+        for line in lines:
+            data = line.encode('utf-8')
+            if self.pack and datagrams and len(datagrams[-1]) + 1 + len(data) <= MAX_DATAGRAM_SIZE:
+                datagrams[-1] += b'\n' + data
+            else:
+                datagrams.append(data)
+        for datagram in datagrams:
+            try:
+                self._socket.sendto(datagram, self.address)
+            except socket.error as e:
+                logger.debug("failed to send metrics to {}: {}".format(self.address, e))
+
+    def close(self):
+        self._socket.close()
+
+
+class FileSink(object):
+    """Appends lines to a file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, lines):
+        with open(self.path, 'a') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def close(self):
+        pass
+
+
+def sink(destination, pack=False):
+    """Returns the sink of an ``udp://host:port`` or ``file:///path`` destination.
+    """
+    url = urlparse(destination)
+    if url.scheme == 'udp':
+        return UdpSink(url.hostname, url.port, pack)
+    if url.scheme == 'file':
+        return FileSink(url.path)
+    raise ValueError("unsupported metrics destination: {}".format(destination))
+
+
+def enabled():
+    """Returns True if the metrics agent is selected with ``SAGEMAKER_METRICS_FORMAT``.
+    """
+    return bool(os.environ.get(FORMAT_ENV))
+
+
+class MetricsAgent(object):
+    """Collects host metrics and emits them from a daemon thread.
+    """
+
+    def __init__(self, destination=None, metrics_format=EMF, interval=DEFAULT_INTERVAL, namespace=DEFAULT_NAMESPACE,
+                 dimensions=None, collectors=None, max_overhead=DEFAULT_MAX_OVERHEAD, proc='/proc'):
+        """
+        :param destination: ``udp://host:port`` or ``file:///path`` (default: the CloudWatch agent or StatsD port)
+        :param metrics_format: 'emf' or 'statsd'
+        :param interval: the collection interval, in seconds
+        :param namespace: the CloudWatch namespace of EMF metrics, also the StatsD prefix
+        :param dimensions: dict of dimensions (StatsD tags) of every metric
+        :param collectors: the collectors (default: cpu, memory, disk, disk I/O, network and, if available, GPU)
+        :param max_overhead: the fraction of the interval the agent may spend collecting and emitting
+        """
+        if metrics_format not in (EMF, STATSD):
+            raise ValueError("unsupported metrics format: {}".format(metrics_format))
+        self.metrics_format = metrics_format
+        self.interval = interval
+        self.namespace = namespace
+        self.dimensions = dimensions or {}
+        self.max_overhead = max_overhead
+        self.sink = sink(destination or DEFAULT_DESTINATIONS[metrics_format], pack=metrics_format == STATSD)
+        self.collectors = default_collectors(interval, proc) if collectors is None else collectors
+        self.last_overhead = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        """Returns the agent configured with ``SAGEMAKER_METRICS_*`` environment variables, with the job name
+        and current host as dimensions.
+        """
+        dimensions = {name: os.environ[env] for name, env in (('host', 'CURRENT_HOST'), ('job', 'JOB_NAME'))
+                      if os.environ.get(env)}
+        return cls(destination=os.environ.get(DESTINATION_ENV),
+                   metrics_format=os.environ.get(FORMAT_ENV, EMF).lower(),
+                   interval=float(os.environ.get(INTERVAL_ENV, DEFAULT_INTERVAL)),
+                   dimensions=dimensions)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-agent')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for collector in self.collectors:
+            if hasattr(collector, 'close'):
+                collector.close()
+        self.sink.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:  # noqa
+                logger.exception("failed to collect metrics")
+
+    def collect(self):
+        metrics = []
+        for collector in self.collectors:
+            try:
+                metrics.extend(collector.collect())
+            except (IOError, OSError, ValueError, IndexError, KeyError) as e:
+                logger.debug("{} failed: {}".format(type(collector).__name__, e))
+        return metrics
+
+    def tick(self):
+        """Collects and emits one batch of metrics, returning them.
+        """
+        start = time.time()
+        metrics = self.collect()
+        if self.last_overhead is not None:
+            metrics.append(_metric('agent_overhead', round(100 * self.last_overhead, 3), 'Percent'))
+        if self.metrics_format == EMF:
+            lines = format_emf(metrics, self.namespace, self.dimensions, start)
+        else:
+            lines = format_statsd(metrics, self.namespace.replace('/', '.').lower(), self.dimensions)
+        self.sink.send(lines)
+
+        self.last_overhead = (time.time() - start) / self.interval
+        if self.last_overhead > self.max_overhead:
+            self.interval *= 2
+            logger.warning("collecting metrics took {:.1%} of the interval, increasing it to {}s".format(
+                self.last_overhead, self.interval))
+        return metrics
+
+
+def default_collectors(interval, proc='/proc'):
+    collectors = []
+    for collector in (CpuCollector, MemoryCollector, DiskCollector, DiskIOCollector, NetworkCollector):
+        try:
+            collectors.append(collector(proc))
+        except (IOError, OSError) as e:
+            logger.debug("{} unavailable: {}".format(collector.__name__, e))
+    try:
+        collectors.append(GpuCollector(interval))
+    except Exception:  # noqa
+        pass
+    return collectors
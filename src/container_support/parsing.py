@@ -0,0 +1,230 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""Parallel parsing of dense CSV and libsvm files into numpy arrays, with an optional on-disk cache.
+
+Files are split into chunks at line boundaries and the chunks are parsed by a pool of processes.
+Parsed results can be saved as ``.npy`` files keyed by a hash of the input files and options, so that
+later epochs and jobs memory map them instead of parsing again. Requires numpy.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from container_support import affinity
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'sagemaker-parsed-data')
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+_LIBSVM_ARRAYS = ('labels', 'indptr', 'indices', 'values')
+
+
+def chunk_ranges(path, chunk_size=DEFAULT_CHUNK_SIZE, skip_header=False):
+    """Splits a file into byte ranges of about chunk_size that start and end at line boundaries.
+
+    :param skip_header: exclude the first line of the file
+    :return: list of (start, end) offsets
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = len(f.readline()) if skip_header else 0
+        while start < size:
+            # a chunk ends with the line holding its last byte
+            f.seek(min(start + max(chunk_size, 1) - 1, size))
+            if f.tell() < size:
+                f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def load_csv(paths, delimiter=',', dtype='float32', skip_header=False, workers=None,
+             chunk_size=DEFAULT_CHUNK_SIZE, cache_dir=None):
+    """Parses dense, numeric CSV files into a single 2-dimensional numpy array, rows in file order.
+
+    :param paths: the files to parse
+    :param delimiter: the field delimiter
+    :param dtype: the numpy dtype of the result
+    :param skip_header: skip the first line of every file
+    :param workers: the number of parsing processes (default: the number of cpus)
+    :param chunk_size: the approximate size in bytes of the parts parsed by each task
+    :param cache_dir: a directory to save the result to and load it from on later calls, memory mapped
+    """
+    import numpy as np
+
+    options = {'format': 'csv', 'delimiter': delimiter, 'dtype': str(np.dtype(dtype)), 'skip_header': skip_header}
+    cached = _load_cached(cache_dir, paths, options, ('data',))
+    if cached is not None:
+        return cached['data']
+
+    start = time.time()
+    tasks = [(path, s, e, delimiter, options['dtype'])
+             for path in paths for s, e in chunk_ranges(path, chunk_size, skip_header)]
+    chunks = [c for c in _map(_parse_csv_chunk, tasks, workers) if c.size]
+    data = np.concatenate(chunks) if chunks else np.empty((0, 0), dtype)
+    logger.info("parsed {} rows from {} files in {:.2f}s".format(len(data), len(paths), time.time() - start))
+
+    _save_cached(cache_dir, paths, options, {'data': data})
+    return data
+
+
+def load_libsvm(paths, dtype='float32', zero_based=True, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                cache_dir=None):
+    """Parses libsvm files (``label index:value ...``) into the components of a CSR matrix.
+
+    ``scipy.sparse.csr_matrix((values, indices, indptr))`` builds the matrix from the result.
+
+    :param paths: the files to parse
+    :param dtype: the numpy dtype of labels and values
+    :param zero_based: False if feature indices in the files start at 1
+    :param workers: the number of parsing processes (default: the number of cpus)
+    :param chunk_size: the approximate size in bytes of the parts parsed by each task
+    :param cache_dir: a directory to save the result to and load it from on later calls, memory mapped
+    :return: tuple (labels, indptr, indices, values) of numpy arrays
+    """
+    import numpy as np
+
+    options = {'format': 'libsvm', 'dtype': str(np.dtype(dtype)), 'zero_based': zero_based}
+    cached = _load_cached(cache_dir, paths, options, _LIBSVM_ARRAYS)
+    if cached is not None:
+        return tuple(cached[name] for name in _LIBSVM_ARRAYS)
+
+    start = time.time()
+    tasks = [(path, s, e, options['dtype'], zero_based) for path in paths for s, e in chunk_ranges(path, chunk_size)]
+    chunks = _map(_parse_libsvm_chunk, tasks, workers)
+
+    labels = np.concatenate([c[0] for c in chunks] or [np.empty(0, dtype)])
+    lengths = np.concatenate([c[1] for c in chunks] or [np.empty(0, np.int64)])
+    indices = np.concatenate([c[2] for c in chunks] or [np.empty(0, np.int32)])
+    values = np.concatenate([c[3] for c in chunks] or [np.empty(0, dtype)])
+    indptr = np.zeros(len(lengths) + 1, np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    logger.info("parsed {} rows from {} files in {:.2f}s".format(len(labels), len(paths), time.time() - start))
+
+    result = {'labels': labels, 'indptr': indptr, 'indices': indices, 'values': values}
+    _save_cached(cache_dir, paths, options, result)
+    return tuple(result[name] for name in _LIBSVM_ARRAYS)
+
+
+def _map(fn, tasks, workers):
+    workers = min(workers or len(affinity.available_cpus()), len(tasks))
+    if workers <= 1:
+        return [fn(task) for task in tasks]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(fn, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _parse_csv_chunk(task):
+    import numpy as np
+
+    path, start, end, delimiter, dtype = task
+    lines = [line for line in _read_range(path, start, end).splitlines() if line.strip()]
+    if not lines:
+        return np.empty((0, 0), dtype)
+
+    columns = lines[0].count(delimiter.encode('utf-8')) + 1
+    separator = delimiter.encode('utf-8')
+    # numpy parses the whole chunk in C once the line breaks are turned into delimiters
+    data = np.fromstring(separator.join(lines), dtype=dtype, sep=delimiter)
+    if data.size != len(lines) * columns:
+        raise ValueError("{} bytes {}-{}: expected {} rows of {} numeric columns".format(
+            path, start, end, len(lines), columns))
+    return data.reshape(len(lines), columns)
+
+
+def _parse_libsvm_chunk(task):
+    import numpy as np
+
+    path, start, end, dtype, zero_based = task
+    labels, lengths, indices, values = [], [], [], []
+    offset = 0 if zero_based else 1
+    for line in _read_range(path, start, end).splitlines():
+        parts = line.split(b'#', 1)[0].split()
+        if not parts:
+            continue
+        labels.append(float(parts[0]))
+        lengths.append(len(parts) - 1)
+        for feature in parts[1:]:
+            index, value = feature.split(b':')
+            indices.append(int(index) - offset)
+            values.append(float(value))
+
+    return (np.array(labels, dtype), np.array(lengths, np.int64),
+            np.array(indices, np.int32), np.array(values, dtype))
+
+
+def _cache_path(cache_dir, paths, options):
+    inputs = []
+    for path in paths:
+        stat = os.stat(path)
+        inputs.append([os.path.abspath(path), stat.st_size, stat.st_mtime])
+    key = json.dumps([inputs, options], sort_keys=True)
+    return os.path.join(cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def _load_cached(cache_dir, paths, options, names):
+    if not cache_dir:
+        return None
+
+    import numpy as np
+
+    path = _cache_path(cache_dir, paths, options)
+    if not os.path.isdir(path):
+        return None
+    start = time.time()
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+    logger.info("loaded parsed {} data from {} in {:.2f}s".format(options['format'], path, time.time() - start))
+    return arrays
+
+
+def _save_cached(cache_dir, paths, options, arrays):
+    if not cache_dir:
+        return
+
+    import numpy as np
+
+    path = _cache_path(cache_dir, paths, options)
+    tmp = os.path.join(cache_dir, '.tmp-' + uuid.uuid4().hex)
+    os.makedirs(tmp)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), array)
+        os.rename(tmp, path)
+    except OSError:
+        # published concurrently by another process
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
@@ -0,0 +1,233 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""Streaming readers for Pipe mode channels.
+
+In Pipe mode, SageMaker streams the data of every channel epoch through a named pipe
+``/opt/ml/input/data/<channel>_<epoch>`` instead of copying it to disk first. The readers here
+read the pipe with large unbuffered reads in a background thread, so the next buffer is being
+filled while the training code consumes the current one, and split the buffers into records.
+
+Records are returned as ``memoryview`` slices of the read buffers. A record spanning several reads
+is copied once, when its last piece has been read.
+"""
+
+import struct
+import threading
+
+from six.moves import queue
+
+NEWLINE = 'newline'
+RECORDIO = 'recordio'
+TFRECORD = 'tfrecord'
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+DEFAULT_PREFETCH = 4
+
+_RECORDIO_MAGIC = 0xced7230a
+_RECORDIO_HEADER = struct.Struct('<II')
+_TFRECORD_HEADER = struct.Struct('<QI')
+_TFRECORD_FOOTER_SIZE = 4
+_MAX_HEADER_SIZE = max(_RECORDIO_HEADER.size, _TFRECORD_HEADER.size)
+
+
+class PrefetchReader(object):
+    """Reads a file or named pipe in a background thread, ``prefetch`` buffers ahead of the consumer.
+    """
+
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE, prefetch=DEFAULT_PREFETCH):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._queue = queue.Queue(prefetch)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='prefetch-{}'.format(path))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            # unbuffered: every read goes straight from the pipe into a fresh buffer
+            with open(self.path, 'rb', 0) as f:
+                while not self._closed:
+                    data = f.read(self.buffer_size)
+                    self._queue.put(data)
+                    if not data:
+                        return
+        except Exception as e:  # noqa
+            self._queue.put(e)
+
+    def __iter__(self):
+        """Yields the buffers read, in order, until the end of the file.
+        """
+        try:
+            while True:
+                data = self._queue.get()
+                if isinstance(data, Exception):
+                    raise data
+                if not data:
+                    return
+                yield data
+        finally:
+            self.close()
+
+    def close(self):
+        self._closed = True
+        # unblock the reader thread if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def split_lines(buffers):
+    """Yields the lines (without the line terminator) in a sequence of buffers.
+    """
+    pending = []
+    for data in buffers:
+        view = memoryview(data)
+        start = 0
+        end = data.find(b'\n')
+        if pending:
+            if end < 0:
+                pending.append(view)
+                continue
+            # the line started in earlier buffers: its pieces are joined once, when it is complete
+            pending.append(view[:end])
+            yield memoryview(b''.join(pending))
+            pending = []
+            start = end + 1
+            end = data.find(b'\n', start)
+        while end >= 0:
+            yield view[start:end]
+            start = end + 1
+            end = data.find(b'\n', start)
+        if start < len(data):
+            pending.append(view[start:])
+    if pending:
+        yield memoryview(b''.join(pending))
+
+
+def split_recordio(buffers):
+    """Yields the records of an MXNet RecordIO stream in a sequence of buffers.
+    Records split in parts by the writer (continuation flags) are joined.
+    """
+    parts = []
+    for cflag, record in _split_framed(buffers, _recordio_frame):
+        if cflag == 0:
+            yield record
+        elif cflag == 1:
+            parts = [record.tobytes()]
+        elif cflag == 2:
+            parts.append(record.tobytes())
+        else:
+            parts.append(record.tobytes())
+            yield memoryview(b''.join(parts))
+            parts = []
+
+
+def split_tfrecord(buffers):
+    """Yields the records of a TFRecord stream in a sequence of buffers. Checksums are not verified.
+    """
+    for _, record in _split_framed(buffers, _tfrecord_frame):
+        yield record
+
+
+def _recordio_frame(data, start):
+    """Returns (header size, payload size, frame size, cflag) of the RecordIO frame at start,
+    or None if the buffer does not hold the full header.
+    """
+    if len(data) - start < _RECORDIO_HEADER.size:
+        return None
+    magic, lrecord = _RECORDIO_HEADER.unpack_from(data, start)
+    if magic != _RECORDIO_MAGIC:
+        raise ValueError("invalid RecordIO magic number at offset {}".format(start))
+    length = lrecord & ((1 << 29) - 1)
+    padded = (length + 3) & ~3
+    return _RECORDIO_HEADER.size, length, _RECORDIO_HEADER.size + padded, lrecord >> 29
+
+
+def _tfrecord_frame(data, start):
+    if len(data) - start < _TFRECORD_HEADER.size:
+        return None
+    length, _ = _TFRECORD_HEADER.unpack_from(data, start)
+    return _TFRECORD_HEADER.size, length, _TFRECORD_HEADER.size + length + _TFRECORD_FOOTER_SIZE, 0
+
+
+def _split_framed(buffers, frame):
+    # the frame being assembled from several buffers: its pieces, their total size and, once its
+    # header has been read, the frame size
+    pending = []
+    pending_size = 0
+    frame_size = None
+    header = None
+    for data in buffers:
+        view = memoryview(data)
+        start = 0
+        if pending:
+            if header is None:
+                header = frame(_prefix(pending + [view], _MAX_HEADER_SIZE), 0)
+            if header is None or pending_size + len(view) < header[2]:
+                pending.append(view)
+                pending_size += len(view)
+                continue
+            header_size, length, frame_size, flag = header
+            start = frame_size - pending_size
+            pending.append(view[:start])
+            # joined once, when the frame is complete
+            record = memoryview(b''.join(pending))
+            yield flag, record[header_size:header_size + length]
+            pending, pending_size, header = [], 0, None
+
+        while True:
+            header = frame(view, start)
+            if header is None or start + header[2] > len(view):
+                break
+            header_size, length, frame_size, flag = header
+            yield flag, view[start + header_size:start + header_size + length]
+            start += frame_size
+        header = None
+        if start < len(view):
+            pending.append(view[start:])
+            pending_size = len(view) - start
+    if pending:
+        raise ValueError("stream ended in the middle of a record ({} bytes left)".format(pending_size))
+
+
+def _prefix(views, size):
+    """Returns the first size bytes of a list of memoryviews.
+    """
+    parts = []
+    for view in views:
+        parts.append(view[:size - sum(len(p) for p in parts)].tobytes())
+        if sum(len(p) for p in parts) >= size:
+            break
+    return b''.join(parts)
+
+
+_SPLITTERS = {NEWLINE: split_lines, RECORDIO: split_recordio, TFRECORD: split_tfrecord}
+
+
+def read_records(path, record_format=NEWLINE, buffer_size=DEFAULT_BUFFER_SIZE, prefetch=DEFAULT_PREFETCH):
+    """Yields the records read from the file or named pipe at path.
+
+    :param path: the file or named pipe to read
+    :param record_format: 'newline', 'recordio' or 'tfrecord'
+    :param buffer_size: the size of each read
+    :param prefetch: the number of buffers read ahead of the consumer
+    :return: generator of ``memoryview`` records
+    """
+    if record_format not in _SPLITTERS:
+        raise ValueError("unsupported record format: {}. Supported formats: {}".format(
+            record_format, ', '.join(sorted(_SPLITTERS))))
+    return _SPLITTERS[record_format](PrefetchReader(path, buffer_size, prefetch))
@@ -0,0 +1,198 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Runs the decoding, prediction and encoding of invocations in separate thread pools, so that the stages
+of concurrent requests overlap: a request can be decoded while the model predicts on another one and
+the response of a third one is encoded.
+
+The stages are the ``stages`` of transformers built with ``Transformer.from_stages``. Other transformers
+run their ``transform`` method as a single ``transform`` stage, with the threads of all the stages.
+
+Every stage has its own pool of threads and admits at most ``workers + queue_size`` requests at a time:
+requests wait for admission instead of piling up in the stage. In gevent workers, the pools are gevent
+thread pools, which run the stages in real threads while the calling greenlets wait cooperatively.
+
+Stages record how long their threads are busy. :meth:`Pipeline.stats` returns the utilization of every
+stage, which is also logged every ``report_interval`` seconds.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('input', 'predict', 'output')
+
+DEFAULT_WORKERS = (2, 1, 2)
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_REPORT_INTERVAL = 60
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _thread_pool(workers):
+    if _gevent_patched():
+        from gevent.threadpool import ThreadPool
+        return ThreadPool(workers)
+    from multiprocessing.pool import ThreadPool
+    return ThreadPool(workers)
+
+
+def _timed(fn, args):
+    start = time.time()
+    result = fn(*args)
+    return result, time.time() - start
+
+
+class Stage(object):
+    """A function run by a pool of threads, with bounded admission and busy time accounting.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=DEFAULT_QUEUE_SIZE, clock=time.time):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self._pool = _thread_pool(workers)
+        self._admission = threading.BoundedSemaphore(workers + queue_size)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window_start = clock()
+        self._busy = 0.0
+        self._wait = 0.0
+        self._calls = 0
+
+    def __call__(self, *args):
+        """Runs the stage function on a thread of the pool and returns its result. Blocks while the stage is full.
+        """
+        submitted = self._clock()
+        with self._admission:
+            result, busy = self._pool.apply(_timed, (self.fn, args))
+        elapsed = self._clock() - submitted
+        with self._lock:
+            self._busy += busy
+            self._wait += max(0.0, elapsed - busy)
+            self._calls += 1
+        return result
+
+    def stats(self, reset=False):
+        """Returns the stage statistics since the last reset: calls, busy seconds, mean seconds waited in the
+        queue, and utilization, the fraction of the time the threads of the pool were busy.
+        """
+        with self._lock:
+            now = self._clock()
+            elapsed = max(now - self._window_start, 1e-9)
+            stats = {'calls': self._calls,
+                     'busy_seconds': round(self._busy, 6),
+                     'mean_wait_seconds': round(self._wait / self._calls, 6) if self._calls else 0.0,
+                     'utilization': round(min(1.0, self._busy / (elapsed * self.workers)), 4)}
+            if reset:
+                self._window_start = now
+                self._busy = self._wait = 0.0
+                self._calls = 0
+        return stats
+
+    def close(self):
+        if hasattr(self._pool, 'kill'):
+            # gevent
+            self._pool.kill()
+        else:
+            self._pool.terminate()
+
+
+class Pipeline(object):
+    """A transformer running the stages of a ``serving.Transformer`` in separate thread pools.
+    """
+
+    def __init__(self, transformer, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 report_interval=DEFAULT_REPORT_INTERVAL, clock=time.time):
+        """
+        :param transformer: the transformer, see the module documentation for its stages
+        :param workers: the number of threads of the input, predict and output stages
+        :param queue_size: the number of requests that can wait for the threads of a stage
+        :param report_interval: the seconds between logs of the stage statistics, 0 to disable them
+        """
+        if len(workers) != len(STAGES) or min(workers) < 1:
+            raise ValueError("workers must be 3 positive numbers of threads, got {}".format(workers))
+
+        self.transformer = transformer
+        stages = getattr(transformer, 'stages', None)
+        if stages is None:
+            self.stages = [Stage('transform', transformer.transform, sum(workers), queue_size, clock)]
+        else:
+            self.stages = [Stage(name, fn, n, queue_size, clock) for name, fn, n in zip(STAGES, stages, workers)]
+        self.report_interval = report_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_report = clock()
+
+    @property
+    def staged(self):
+        """True if the transformer runs in separate input, predict and output stages.
+        """
+        return len(self.stages) == len(STAGES)
+
+    def transform(self, data, input_content_type, output_content_type):
+        if self.staged:
+            input_stage, predict_stage, output_stage = self.stages
+            result = output_stage(predict_stage(input_stage(data, input_content_type)), output_content_type)
+        else:
+            result = self.stages[0](data, input_content_type, output_content_type)
+
+        if self.report_interval and self._report_due():
+            self.report()
+        return result
+
+    def _report_due(self):
+        with self._lock:
+            now = self._clock()
+            if now - self._last_report < self.report_interval:
+                return False
+            self._last_report = now
+            return True
+
+    def stats(self, reset=False):
+        """Returns the statistics of every stage, by stage name.
+        """
+        return {stage.name: stage.stats(reset) for stage in self.stages}
+
+    def report(self):
+        """Logs the statistics of every stage since the last report.
+        """
+        stats = self.stats(reset=True)
+        logger.info("pipeline stage utilization: {}".format(', '.join(
+            '{} {:.1%} ({} calls, {:.1f}ms mean wait)'.format(
+                name, stats[name]['utilization'], stats[name]['calls'], stats[name]['mean_wait_seconds'] * 1000)
+            for name in (stage.name for stage in self.stages))))
+        return stats
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+
+
+def parse_workers(value):
+    """Parses the numbers of threads of the stages, e.g. '2,1,2'.
+    """
+    workers = tuple(int(v) for v in value.split(','))
+    if len(workers) != len(STAGES):
+        raise ValueError("expected the numbers of threads of the input, predict and output stages, got {}"
+                         .format(value))
+    return workers
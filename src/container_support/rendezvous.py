@@ -0,0 +1,237 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Rendezvous of the hosts of a distributed training job over TCP.
+
+The first host (in sorted order) listens on a port and every other host connects to it once its name
+resolves. When all the hosts have joined, the leader sends everyone the metadata of every host (e.g. the
+ports and ranks used by the framework) and the time each host took to join. The connections stay open
+for further barriers until :meth:`Rendezvous.close`.
+"""
+
+import json
+import logging
+import socket
+import struct
+import time
+from multiprocessing.pool import ThreadPool
+
+from container_support.retrying import Retrying
+
+logger = logging.getLogger(__name__)
+
+PORT_ENV = 'SAGEMAKER_RENDEZVOUS_PORT'
+DEFAULT_PORT = 7777
+DEFAULT_TIMEOUT = 600
+
+_LENGTH = struct.Struct('>I')
+_MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# hosts send their hello as soon as they are connected
+_HELLO_TIMEOUT = 10
+
+
+class RendezvousError(Exception):
+    pass
+
+
+def resolve_hosts(hosts, timeout=DEFAULT_TIMEOUT):
+    """Resolves the addresses of hosts in parallel, retrying with exponential backoff until they resolve.
+
+    :param hosts: the host names
+    :param timeout: the number of seconds to keep retrying for
+    :return: dict of host name -> IPv4 address
+    """
+    retrying = Retrying(stop_max_delay=timeout * 1000,
+                        wait_exponential_multiplier=50,
+                        wait_exponential_max=2000,
+                        retry_on_exception=lambda e: isinstance(e, socket.gaierror))
+
+    def resolve(host):
+        start = time.time()
+        address = retrying.call(socket.gethostbyname, host)
+        logger.debug("resolved {} to {} in {:.2f}s".format(host, address, time.time() - start))
+        return address
+
+    pool = ThreadPool(len(hosts) or 1)
+    try:
+        return dict(zip(hosts, pool.map(resolve, hosts, chunksize=1)))
+    finally:
+        pool.close()
+
+
+class Rendezvous(object):
+    """Joins the hosts of a job, exchanging small JSON metadata, and synchronizes them with barriers.
+    """
+
+    def __init__(self, hosts, current_host, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+        """
+        :param hosts: the host names of the job, e.g. ``resource_config['hosts']``
+        :param current_host: the name of this host
+        :param port: the port the leader listens on
+        :param timeout: the number of seconds to wait for the other hosts
+        """
+        self.hosts = sorted(hosts)
+        self.current_host = current_host
+        self.rank = self.hosts.index(current_host)
+        self.leader = self.hosts[0]
+        self.port = port
+        self.timeout = timeout
+        self.metadata = None
+        self.join_times = None
+        self._peers = {}
+
+    @property
+    def is_leader(self):
+        return self.rank == 0
+
+    def join(self, metadata=None):
+        """Waits for every host to join and exchanges metadata with them.
+
+        :param metadata: JSON serializable metadata of this host
+        :return: dict of host name -> metadata, for every host
+        """
+        start = time.time()
+        # every host must resolve before the framework can use them, not only the leader
+        addresses = resolve_hosts(self.hosts, self.timeout) if len(self.hosts) > 1 else {}
+        message = {'host': self.current_host, 'metadata': metadata, 'resolved': time.time() - start}
+
+        if self.is_leader:
+            result = self._lead(message, start)
+        else:
+            self._connect(addresses[self.leader], start)
+            _send(self._peers[self.leader], message)
+            result = self._receive(self._peers[self.leader])
+
+        for peer in self._peers.values():
+            # barriers wait as long as the slowest host takes to reach them
+            peer.settimeout(None)
+        self.metadata = result['metadata']
+        self.join_times = result['join_times']
+        logger.info("{} hosts joined in {:.2f}s: {}".format(len(self.hosts), time.time() - start, ', '.join(
+            '{} {:.2f}s'.format(host, self.join_times[host]) for host in self.hosts)))
+        return self.metadata
+
+    def barrier(self):
+        """Blocks until every host has reached the barrier. Requires :meth:`join` first.
+        """
+        if self.is_leader:
+            for host, peer in self._peers.items():
+                self._receive(peer)
+            for peer in self._peers.values():
+                _send(peer, {})
+        elif self._peers:
+            _send(self._peers[self.leader], {})
+            self._receive(self._peers[self.leader])
+
+    def close(self):
+        for peer in self._peers.values():
+            peer.close()
+        self._peers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _lead(self, message, start):
+        messages = {self.current_host: message}
+        join_times = {self.current_host: message['resolved']}
+        if len(self.hosts) > 1:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                server.bind(('', self.port))
+                server.listen(len(self.hosts))
+                while len(messages) < len(self.hosts):
+                    server.settimeout(self._remaining(start, messages))
+                    try:
+                        peer, _ = server.accept()
+                    except socket.timeout:
+                        continue
+                    peer.settimeout(min(self._remaining(start, messages), _HELLO_TIMEOUT))
+                    try:
+                        hello = _recv(peer)
+                        hello.get('host')
+                    except (RendezvousError, socket.error, ValueError, AttributeError) as e:
+                        # e.g. a port scanner, or a host that restarted: the others can still join
+                        logger.warning("ignoring invalid rendezvous connection: {}".format(e))
+                        peer.close()
+                        continue
+                    peer.settimeout(self._remaining(start, messages))
+                    if hello.get('host') not in self.hosts or hello['host'] == self.current_host:
+                        logger.warning("ignoring rendezvous from unknown host {}".format(hello.get('host')))
+                        peer.close()
+                        continue
+                    if hello['host'] in self._peers:
+                        self._peers[hello['host']].close()
+                    self._peers[hello['host']] = peer
+                    messages[hello['host']] = hello
+                    join_times[hello['host']] = time.time() - start
+            finally:
+                server.close()
+
+        result = {'metadata': {host: m['metadata'] for host, m in messages.items()}, 'join_times': join_times}
+        for peer in self._peers.values():
+            _send(peer, result)
+        return result
+
+    def _remaining(self, start, joined):
+        remaining = self.timeout - (time.time() - start)
+        if remaining <= 0:
+            missing = [host for host in self.hosts if host not in joined]
+            raise RendezvousError("timed out after {}s waiting for hosts: {}".format(
+                self.timeout, ', '.join(missing)))
+        return remaining
+
+    def _connect(self, address, start):
+        def connect():
+            remaining = self._remaining(start, [self.current_host])
+            return socket.create_connection((address, self.port), timeout=remaining)
+
+        # the leader may not be listening yet
+        retrying = Retrying(stop_max_delay=self.timeout * 1000,
+                            wait_exponential_multiplier=10,
+                            wait_exponential_max=1000,
+                            retry_on_exception=lambda e: isinstance(e, socket.error))
+        self._peers[self.leader] = retrying.call(connect)
+
+    def _receive(self, peer):
+        try:
+            return _recv(peer)
+        except socket.timeout:
+            raise RendezvousError("timed out after {}s waiting for the rendezvous".format(self.timeout))
+
+
+def _send(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _recv(sock):
+    size, = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+    if size > _MAX_MESSAGE_SIZE:
+        raise RendezvousError("invalid rendezvous message of {} bytes".format(size))
+    return json.loads(_recv_exactly(sock, size).decode('utf-8'))
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise RendezvousError("connection closed during the rendezvous")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
@@ -25,9 +25,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import multiprocessing
 import random
 import six
 import sys
+import threading
 import time
 import traceback
 
@@ -41,29 +43,38 @@ def retry(*dargs, **dkw):
     Decorator function that instantiates the Retrying object
     @param *dargs: positional arguments passed to Retrying object
     @param **dkw: keyword arguments passed to the Retrying object
+
+    The Retrying object is built once, when the function is decorated. Coroutine functions are
+    retried with non-blocking sleeps, see Retrying.call_async.
     """
     # support both @retry and @retry() as valid syntax
     if len(dargs) == 1 and callable(dargs[0]):
-        def wrap_simple(f):
+        return _wrap(Retrying(), dargs[0])
 
-            @six.wraps(f)
-            def wrapped_f(*args, **kw):
-                return Retrying().call(f, *args, **kw)
+    else:
+        def wrap(f):
+            return _wrap(Retrying(*dargs, **dkw), f)
 
-            return wrapped_f
+        return wrap
 
-        return wrap_simple(dargs[0])
 
-    else:
-        def wrap(f):
+def _wrap(retrying, f):
+    if _is_coroutine_function(f):
+        from container_support._retrying_async import wrap_coroutine_function
+        return wrap_coroutine_function(retrying, f)
 
-            @six.wraps(f)
-            def wrapped_f(*args, **kw):
-                return Retrying(*dargs, **dkw).call(f, *args, **kw)
+    @six.wraps(f)
+    def wrapped_f(*args, **kw):
+        return retrying.call(f, *args, **kw)
 
-            return wrapped_f
+    return wrapped_f
 
-        return wrap
+
+def _is_coroutine_function(f):
+    if six.PY2:
+        return False
+    import inspect
+    return inspect.iscoroutinefunction(f)
 
 
 class Retrying(object):
@@ -81,7 +92,24 @@ class Retrying(object):
                  wrap_exception=False,
                  stop_func=None,
                  wait_func=None,
-                 wait_jitter_max=None):
+                 wait_jitter_max=None,
+                 sleep=None,
+                 async_sleep=None,
+                 wait_jitter=None,
+                 budget=None,
+                 circuit_breaker=None):
+        """
+        @param sleep: function called with the number of seconds to sleep between attempts,
+                      e.g. gevent.sleep (default: time.sleep)
+        @param async_sleep: coroutine function used instead of asyncio.sleep by call_async
+        @param wait_jitter: 'full' to sleep a random time between 0 and the wait, 'decorrelated' to sleep
+                            a random time between the first wait and 3 times the previous sleep (capped at
+                            wait_exponential_max), so that concurrent callers do not retry in lockstep
+        @param budget: a RetryBudget shared with other Retrying objects, retries are given up when it is empty
+        @param circuit_breaker: a CircuitBreaker, attempts fail fast with CircuitOpenError while it is open
+        """
+        if wait_jitter not in (None, 'full', 'decorrelated'):
+            raise ValueError("unsupported wait_jitter: {}".format(wait_jitter))
 
         self._stop_max_attempt_number = 5 if stop_max_attempt_number is None else stop_max_attempt_number
         self._stop_max_delay = 100 if stop_max_delay is None else stop_max_delay
@@ -150,6 +178,12 @@ class Retrying(object):
             self._retry_on_result = retry_on_result
 
         self._wrap_exception = wrap_exception
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._wait_jitter = wait_jitter
+        self._budget = budget
+        self._circuit_breaker = circuit_breaker
+        self.metrics = RetryMetrics()
 
     def stop_after_attempt(self, previous_attempt_number, delay_since_first_attempt_ms):
         """Stop after the previous attempt >= stop_max_attempt_number."""
@@ -208,32 +242,86 @@ class Retrying(object):
     def call(self, fn, *args, **kwargs):
         start_time = int(round(time.time() * 1000))
         attempt_number = 1
+        delay = None
         while True:
+            self.before_attempt()
             try:
                 attempt = Attempt(fn(*args, **kwargs), attempt_number, False)
             except:
                 tb = sys.exc_info()
                 attempt = Attempt(tb, attempt_number, True)
 
-            if not self.should_reject(attempt):
+            delay = self.next_delay(attempt, start_time, delay)
+            if delay is None:
                 return attempt.get(self._wrap_exception)
-
-            delay_since_first_attempt_ms = int(round(time.time() * 1000)) - start_time
-            if self.stop(attempt_number, delay_since_first_attempt_ms):
-                if not self._wrap_exception and attempt.has_exception:
-                    # get() on an attempt with an exception should cause it to be raised, but raise just in case
-                    raise attempt.get()
-                else:
-                    raise RetryError(attempt)
-            else:
-                sleep = self.wait(attempt_number, delay_since_first_attempt_ms)
-                if self._wait_jitter_max:
-                    jitter = random.random() * self._wait_jitter_max
-                    sleep = sleep + max(0, jitter)
-                time.sleep(sleep / 1000.0)
+            # looked up on every call, so that a monkey patched time.sleep is used
+            (self._sleep or time.sleep)(delay)
 
             attempt_number += 1
 
+    def call_async(self, fn, *args, **kwargs):
+        """Returns a coroutine that awaits fn(*args, **kwargs), retrying it without blocking the event loop.
+        """
+        from container_support._retrying_async import call_async
+        return call_async(self, fn, *args, **kwargs)
+
+    def before_attempt(self):
+        """Raises CircuitOpenError if the circuit breaker does not allow an attempt.
+        """
+        self.metrics.add(attempts=1)
+        if self._circuit_breaker is not None and not self._circuit_breaker.allow():
+            self.metrics.add(rejected=1)
+            raise CircuitOpenError(self._circuit_breaker)
+
+    def abandon_attempt(self):
+        """Called instead of next_delay when an attempt ends without an outcome, e.g. when it is cancelled.
+        """
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.abandon()
+
+    def next_delay(self, attempt, start_time, previous_delay=None):
+        """Returns the number of seconds to wait before the next attempt, or None if the attempt is final.
+        Raises the error of the attempt, or RetryError, if no more attempts must be made.
+
+        @param attempt: the Attempt that just completed
+        @param start_time: the time of the first attempt, in milliseconds since the epoch
+        @param previous_delay: the seconds waited before the attempt, None for the first attempt
+        """
+        reject = self.should_reject(attempt)
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.record(not reject)
+        if not reject:
+            return None
+
+        delay_since_first_attempt_ms = int(round(time.time() * 1000)) - start_time
+        if self.stop(attempt.attempt_number, delay_since_first_attempt_ms):
+            self._give_up(attempt)
+
+        if self._budget is not None and not self._budget.acquire():
+            self.metrics.add(budget_exhausted=1)
+            self._give_up(attempt)
+
+        sleep = self.wait(attempt.attempt_number, delay_since_first_attempt_ms)
+        if self._wait_jitter == 'full':
+            sleep = random.uniform(0, sleep)
+        elif self._wait_jitter == 'decorrelated':
+            base = self.wait(1, 0)
+            previous = base if previous_delay is None else previous_delay * 1000.0
+            sleep = min(self._wait_exponential_max, random.uniform(base, max(base, previous * 3)))
+        if self._wait_jitter_max:
+            jitter = random.random() * self._wait_jitter_max
+            sleep = sleep + max(0, jitter)
+        self.metrics.add(retries=1, sleep_seconds=sleep / 1000.0)
+        return sleep / 1000.0
+
+    def _give_up(self, attempt):
+        self.metrics.add(failures=1)
+        if not self._wrap_exception and attempt.has_exception:
+            # get() on an attempt with an exception should cause it to be raised, but raise just in case
+            raise attempt.get()
+        else:
+            raise RetryError(attempt)
+
 
 class Attempt(object):
     """
@@ -278,3 +366,142 @@ class RetryError(Exception):
 
     def __str__(self):
         return "RetryError[{0}]".format(self.last_attempt)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making an attempt while a CircuitBreaker is open.
+    """
+
+    def __init__(self, circuit_breaker):
+        super(CircuitOpenError, self).__init__(
+            "circuit breaker open after {0} consecutive failures".format(circuit_breaker.failure_threshold))
+        self.circuit_breaker = circuit_breaker
+
+
+class RetryMetrics(object):
+    """
+    Counters of a Retrying object: attempts made, retries, calls given up (failures), retries given up
+    because the budget was empty, attempts rejected by the circuit breaker, and seconds spent sleeping.
+    """
+
+    FIELDS = ('attempts', 'retries', 'failures', 'budget_exhausted', 'rejected', 'sleep_seconds')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                self._values[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def __getattr__(self, name):
+        if name in RetryMetrics.FIELDS:
+            return self.snapshot()[name]
+        raise AttributeError(name)
+
+
+class RetryBudget(object):
+    """
+    A token bucket limiting the rate of retries of all the Retrying objects sharing it, so that retries
+    stop amplifying the load on a degraded dependency. Every retry takes a token; tokens are refilled at
+    a fixed rate up to the capacity.
+
+    With shared=True the bucket lives in shared memory and is shared with the processes forked after it
+    was created, e.g. gunicorn workers or training processes.
+    """
+
+    def __init__(self, capacity=10, refill_per_second=1.0, shared=False):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        if shared:
+            self._state = multiprocessing.RawArray('d', [capacity, time.time()])
+            self._lock = multiprocessing.Lock()
+        else:
+            self._state = [capacity, time.time()]
+            self._lock = threading.Lock()
+
+    @property
+    def tokens(self):
+        with self._lock:
+            return self._refill(time.time())
+
+    def acquire(self):
+        """Takes a token and returns True, or returns False if the budget is empty.
+        """
+        with self._lock:
+            tokens = self._refill(time.time())
+            if tokens < 1:
+                return False
+            self._state[0] = tokens - 1
+            return True
+
+    def _refill(self, now):
+        tokens = min(self.capacity, self._state[0] + (now - self._state[1]) * self.refill_per_second)
+        self._state[0] = tokens
+        self._state[1] = now
+        return tokens
+
+
+class CircuitBreaker(object):
+    """
+    Opens after failure_threshold consecutive failed attempts, failing the following attempts fast.
+    After reset_timeout seconds a single trial attempt is allowed (half open): the circuit closes if it
+    succeeds and opens again if it fails.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if self._trial or time.time() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def allow(self):
+        """Returns True if an attempt can be made.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.time() - self._opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, success):
+        """Records the outcome of an attempt.
+        """
+        with self._lock:
+            if success:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._trial or self._failures >= self.failure_threshold:
+                    self._opened_at = time.time()
+            self._trial = False
+
+    def abandon(self):
+        """Records an attempt that ended without an outcome: a half open circuit allows another trial.
+        """
+        with self._lock:
+            self._trial = False
@@ -16,10 +16,18 @@ import logging
 import signal
 import sys
 import json
+import time
+import uuid
 from flask import Flask, request, Response
+import six
+from six.moves import http_client
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import get_content_type
 import container_support as cs
+from container_support import affinity, autoscaling, logs, pipeline
 import subprocess
 import shutil
+import tempfile
 import pkg_resources
 
 logger = logging.getLogger(__name__)
@@ -29,20 +37,27 @@ CSV_CONTENT_TYPE = "text/csv"
 OCTET_STREAM_CONTENT_TYPE = "application/octet-stream"
 ANY_CONTENT_TYPE = '*/*'
 UTF8_CONTENT_TYPES = [JSON_CONTENT_TYPE, CSV_CONTENT_TYPE]
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+# the limits nginx applied when it was the only front end
+MAX_CONTENT_LENGTH = 5 * 1024 * 1024
+NOT_FOUND_BODY = '{}'
 
 
 class Server(object):
     """A simple web service wrapper for custom inference code.
     """
 
-    def __init__(self, name, transformer):
+    def __init__(self, name, transformer, request_log=None):
         """ Initialize the web service instance.
 
         :param name: the name of the service
         :param transformer: a function that transforms incoming request data to
                             an outgoing inference response.
+        :param request_log: a ``logs.RequestLog`` logging the invocations, or None
         """
         self.transformer = transformer
+        self.request_log = request_log
         self.app = self._build_flask_app(name)
         self.log = self.app.logger
 
@@ -59,7 +74,16 @@ class Server(object):
         framework = cs.ContainerEnvironment.load_framework()
         transformer = framework.transformer(user_module)
 
-        server = Server("model server", transformer)
+        if env.model_server_pipeline:
+            transformer = pipeline.Pipeline(transformer, env.model_server_pipeline_workers)
+            if transformer.staged:
+                logger.info("pipelining invocations with %s input, predict and output threads"
+                            % (env.model_server_pipeline_workers,))
+            else:
+                logger.warning("the transformer has no separate stages, running invocations in a pool of %s threads"
+                               % transformer.stages[0].workers)
+
+        server = Server("model server", transformer, logs.RequestLog.from_env(logger))
         logger.info("returning initialized server")
         return server
 
@@ -81,7 +105,12 @@ class Server(object):
 
         nginx_pid = 0
         gunicorn_bind_address = '0.0.0.0:8080'
-        if env.use_nginx:
+        if Server._reuse_port(env):
+            # the workers bind 0.0.0.0:8080 themselves (gunicorn_config.post_fork) and the kernel balances
+            # connections across them. The socket of the gunicorn master is not used.
+            logger.info("model server workers listen with SO_REUSEPORT")
+            gunicorn_bind_address = 'unix:/tmp/gunicorn-master.sock'
+        elif env.use_nginx:
             logger.info("starting nginx")
             nginx_conf = pkg_resources.resource_filename('container_support', 'etc/nginx.conf')
             subprocess.check_call(['ln', '-sf', '/dev/stdout', '/var/log/nginx/access.log'])
@@ -89,18 +118,39 @@ class Server(object):
             gunicorn_bind_address = 'unix:/tmp/gunicorn.sock'
             nginx_pid = subprocess.Popen(['nginx', '-c', nginx_conf]).pid
 
+        # the math libraries size their thread pools when loaded, so the budget has to be in the
+        # environment inherited by the workers before they import the framework
+        threads = affinity.set_thread_budget(env.model_server_worker_threads)
+        logger.info("model server worker thread settings: %s" % threads)
+
+        workers = min(max(env.model_server_workers, env.model_server_min_workers), env.model_server_max_workers)
+        slots = None
+        if env.model_server_max_workers > env.model_server_min_workers:
+            # the workers count their requests in flight in shared slots sampled by the autoscaler
+            slots_file = os.path.join(tempfile.gettempdir(), 'sagemaker-model-server-slots')
+            slots = autoscaling.WorkerSlots(slots_file, env.model_server_max_workers, create=True)
+            os.environ[autoscaling.SLOTS_FILE_ENV] = slots_file
+
         logger.info("starting gunicorn")
         gunicorn_pid = subprocess.Popen(["gunicorn",
+                                         "-c", "python:container_support.gunicorn_config",
                                          "--timeout", str(env.model_server_timeout),
                                          "-k", "gevent",
                                          "-b", gunicorn_bind_address,
-                                         "--worker-connections", str(1000 * env.model_server_workers),
-                                         "-w", str(env.model_server_workers),
-                                         "container_support.wsgi:app"]).pid
+                                         "--worker-connections", str(1000 * workers),
+                                         "-w", str(workers),
+                                         "container_support.wsgi:raw_app" if env.model_server_raw_wsgi
+                                         else "container_support.wsgi:app"]).pid
+
+        if slots is not None:
+            logger.info("scaling model server workers between %s and %s" % (env.model_server_min_workers,
+                                                                             env.model_server_max_workers))
+            autoscaling.Autoscaler(gunicorn_pid, slots, workers, env.model_server_min_workers,
+                                   env.model_server_max_workers, env.model_server_worker_memory).start()
 
         signal.signal(signal.SIGTERM, lambda a, b: Server._sigterm_handler(nginx_pid, gunicorn_pid))
 
-        children = set([nginx_pid, gunicorn_pid]) if nginx_pid else gunicorn_pid
+        children = set([nginx_pid, gunicorn_pid]) if nginx_pid else set([gunicorn_pid])
         logger.info("inference server started. waiting on processes: %s" % children)
 
         while True:
@@ -121,6 +171,8 @@ class Server(object):
     def _download_user_module_internal(cls, env):
         path = os.path.join(env.code_dir, env.user_script_name)
         if os.path.exists(path):
+            # code mounted in the container, possibly read-only
+            env.precompile_user_module()
             return
 
         try:
@@ -156,8 +208,10 @@ class Server(object):
         :return: a Flask app ready to handle requests
         """
         app = Flask(name)
+        app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
         app.add_url_rule('/ping', 'healthcheck', self._healthcheck)
         app.add_url_rule('/invocations', 'invoke', self._invoke, methods=["POST"])
+        app.register_error_handler(HTTPException, self._http_error_handler)
         app.register_error_handler(Exception, self._default_error_handler)
         return app
 
@@ -172,8 +226,30 @@ class Server(object):
         input_content_type = request.headers.get('ContentType', request.headers.get('Content-Type', JSON_CONTENT_TYPE))
         requested_output_content_type = request.headers.get('Accept', JSON_CONTENT_TYPE)
 
+        ret_status, response_data, output_content_type = self.invoke(request.get_data(),
+                                                                     input_content_type,
+                                                                     requested_output_content_type,
+                                                                     request.headers.get(REQUEST_ID_HEADER))
+
+        return Response(response=response_data,
+                        status=ret_status,
+                        mimetype=output_content_type)
+
+    def invoke(self, data, input_content_type, requested_output_content_type, request_id=None):
+        """Runs the transformer on the body of an invocation, independently of the web framework.
+
+        Exceptions that do not map to a client error status are raised.
+
+        :param data: the request body, as bytes
+        :param input_content_type: the content type of the request body
+        :param requested_output_content_type: the content type of the response requested with Accept
+        :param request_id: the id of the request, used by the request log
+        :return: tuple (status, response data, output content type)
+        """
+        start = time.time()
+
         # utf-8 decoding is automatic in Flask if the Content-Type is valid. But that does not happens always.
-        content = request.get_data().decode('utf-8') if input_content_type in UTF8_CONTENT_TYPES else request.get_data()
+        content = data.decode('utf-8') if input_content_type in UTF8_CONTENT_TYPES else data
 
         try:
             response_data, output_content_type = \
@@ -184,9 +260,15 @@ class Server(object):
             ret_status, response_data = self._handle_invoke_exception(e)
             output_content_type = JSON_CONTENT_TYPE
 
-        return Response(response=response_data,
-                        status=ret_status,
-                        mimetype=output_content_type)
+        if self.request_log is not None:
+            # nginx sets the request id, gunicorn alone does not
+            self.request_log.log(request_id or uuid.uuid4().hex, 'invocation returned %d' % ret_status,
+                                 status=ret_status,
+                                 latency_ms=round((time.time() - start) * 1000, 3),
+                                 content_type=input_content_type,
+                                 accept=requested_output_content_type)
+
+        return ret_status, response_data, output_content_type
 
     def _handle_invoke_exception(self, e):
         data = json.dumps(e.message)
@@ -213,6 +295,41 @@ class Server(object):
         """
         return '', 200
 
+    @staticmethod
+    def _reuse_port(env):
+        """Returns True if the workers listen with SO_REUSEPORT. The connections queued on the socket of a worker
+        are reset when it exits, so the mode is refused when gunicorn stops workers while serving: when the
+        autoscaler removes workers or workers are restarted after ``--max-requests``. Worker timeouts reset the
+        queued connections too.
+        """
+        if not env.model_server_reuse_port:
+            return False
+        if env.model_server_max_workers > env.model_server_min_workers or \
+                '--max-requests' in os.environ.get('GUNICORN_CMD_ARGS', ''):
+            logger.warning("SO_REUSEPORT resets the connections queued on workers that exit, "
+                           "not using it with worker autoscaling or --max-requests")
+            # read by the workers in gunicorn_config.post_fork
+            os.environ[cs.HostingEnvironment.REUSE_PORT_PARAM] = 'false'
+            return False
+        return True
+
+    @staticmethod
+    def _http_error_handler(exception):
+        """ Handles the HTTP errors raised by Flask, like unknown paths (404) and request bodies larger
+        than ``MAX_CONTENT_LENGTH`` (413), with their status and headers (e.g. ``Allow``) and no content
+        ("{}" for 404).
+
+        :param exception: the ``HTTPException`` raised
+        :return: the response
+        """
+        response = exception.get_response()
+        if exception.code == 404:
+            response.set_data(NOT_FOUND_BODY)
+            response.mimetype = JSON_CONTENT_TYPE
+        else:
+            response.set_data(b'')
+        return response
+
     def _default_error_handler(self, exception):
         """ Default error handler. Returns 500 status with no content.
 
@@ -224,6 +341,84 @@ class Server(object):
         return '', 500
 
 
+class RawWsgiApp(object):
+    """A minimal WSGI application serving ``/ping`` and ``/invocations`` of a :class:`Server` without going
+    through Flask's routing, request context and response objects. Headers and errors are handled like in
+    the Flask app, including the 404 of unknown paths and the 413 of bodies larger than ``MAX_CONTENT_LENGTH``.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._status_lines = {}
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        method = environ.get('REQUEST_METHOD', 'GET')
+
+        if path == '/invocations':
+            if method != 'POST':
+                return self._respond(start_response, 405, b'', None, [('Allow', 'POST')])
+            try:
+                data = self._read_body(environ)
+            except _RequestTooLarge:
+                return self._respond(start_response, 413, b'', None)
+            try:
+                status, data, content_type = self._invoke(environ, data)
+            except Exception as e:
+                body, status = self.server._default_error_handler(e)
+                return self._respond(start_response, status, body, None)
+            return self._respond(start_response, status, data, content_type)
+
+        if path == '/ping':
+            if method not in ('GET', 'HEAD'):
+                return self._respond(start_response, 405, b'', None, [('Allow', 'GET, HEAD')])
+            return self._respond(start_response, 200, b'', None)
+
+        return self._respond(start_response, 404, NOT_FOUND_BODY, JSON_CONTENT_TYPE)
+
+    @staticmethod
+    def _read_body(environ):
+        length = environ.get('CONTENT_LENGTH')
+        stream = environ['wsgi.input']
+        if length:
+            if int(length) > MAX_CONTENT_LENGTH:
+                raise _RequestTooLarge()
+            return stream.read(int(length))
+        data = stream.read(MAX_CONTENT_LENGTH + 1)
+        if len(data) > MAX_CONTENT_LENGTH:
+            raise _RequestTooLarge()
+        return data
+
+    def _invoke(self, environ, data):
+        # ContentType takes precedence over Content-Type, as in Server._invoke
+        input_content_type = environ.get('HTTP_CONTENTTYPE', environ.get('CONTENT_TYPE') or JSON_CONTENT_TYPE)
+        requested_output_content_type = environ.get('HTTP_ACCEPT', JSON_CONTENT_TYPE)
+        return self.server.invoke(data, input_content_type, requested_output_content_type,
+                                  environ.get('HTTP_X_REQUEST_ID'))
+
+    def _respond(self, start_response, status, data, content_type, headers=()):
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        elif not isinstance(data, six.binary_type):
+            data = b''.join(d.encode('utf-8') if isinstance(d, six.text_type) else d for d in data)
+
+        status_line = self._status_lines.get(status)
+        if status_line is None:
+            status_line = '{} {}'.format(status, http_client.responses.get(status, 'UNKNOWN').upper())
+            self._status_lines[status] = status_line
+
+        # the mimetype handling of flask.Response, which adds the charset to text types
+        response_headers = [('Content-Type', get_content_type(content_type or Response.default_mimetype, 'utf-8')),
+                            ('Content-Length', str(len(data)))]
+        response_headers.extend(headers)
+        start_response(status_line, response_headers)
+        return [data]
+
+
+class _RequestTooLarge(Exception):
+    pass
+
+
 class Transformer(object):
     """A ``Transformer`` encapsulates the function(s) responsible for parsing incoming request data,
     passing it through a prediction function, and converting the result into something
@@ -232,6 +427,21 @@ class Transformer(object):
 
     def __init__(self, transform_fn=lambda x, y, z: (x, z)):
         self.transform_fn = transform_fn
+        self.stages = None
+
+    @classmethod
+    def from_stages(cls, input_fn, predict_fn, output_fn):
+        """Builds a transformer from separate decoding, prediction and encoding functions, which
+        ``pipeline.Pipeline`` can run in separate thread pools.
+
+        :param input_fn: function (data, input content type) -> model input
+        :param predict_fn: function (model input) -> prediction
+        :param output_fn: function (prediction, requested output content type) -> (response data, content type)
+        """
+        transformer = cls(lambda data, content_type, accept: output_fn(predict_fn(input_fn(data, content_type)),
+                                                                       accept))
+        transformer.stages = (input_fn, predict_fn, output_fn)
+        return transformer
 
     def transform(self, data, input_content_type, output_content_type):
         """Transforms input data into a prediction result. The input data must
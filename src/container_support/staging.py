@@ -0,0 +1,261 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Staging of File mode channels from slow (network or EBS) volumes onto fast local scratch storage.
+
+Channels are copied file by file by a pool of threads, within a space budget, into a staging directory
+(e.g. an NVMe instance store or a tmpfs). Every staged channel is published with an atomic rename and a
+manifest of its files, so that later jobs or processes on the same host reuse it while the source holds
+the same files with the same sizes and modification times. Channels that do not fit in the budget are left
+where they are.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing.pool import ThreadPool
+
+from container_support import affinity, channels
+from container_support.channels import ChannelIndex
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR_ENV = 'SAGEMAKER_STAGING_DIR'
+STAGING_MAX_BYTES_ENV = 'SAGEMAKER_STAGING_MAX_BYTES'
+
+DEFAULT_STAGING_DIR = os.path.join(tempfile.gettempdir(), 'sagemaker-staged-channels')
+
+# space left free on the staging volume when the budget is not set
+_RESERVED_FRACTION = 0.1
+_SAMPLE_BYTES = 64 * 1024 * 1024
+_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class StagingReport(object):
+    """The result of staging a channel.
+    """
+
+    def __init__(self, channel, source, path, total_bytes, seconds, reused=False):
+        self.channel = channel
+        self.source = source
+        self.path = path
+        "The staged directory, or None if the channel was not staged."
+        self.total_bytes = total_bytes
+        self.seconds = seconds
+        self.reused = reused
+        self.epoch_seconds_saved = None
+        "The estimated read time saved by every pass over the staged copy, in seconds."
+
+    @property
+    def staged(self):
+        return self.path is not None
+
+    @property
+    def throughput(self):
+        """Staging throughput, in bytes per second.
+        """
+        return self.total_bytes / self.seconds if self.seconds else None
+
+    def __str__(self):
+        if not self.staged:
+            return "channel {} ({} MB) not staged".format(self.channel, self.total_bytes // 1024 ** 2)
+        if self.reused:
+            return "channel {} ({} MB) already staged in {}".format(self.channel, self.total_bytes // 1024 ** 2,
+                                                                 self.path)
+        message = "staged channel {} ({} MB) to {} in {:.1f}s ({:.1f} MB/s)".format(
+            self.channel, self.total_bytes // 1024 ** 2, self.path, self.seconds, (self.throughput or 0) / 1024 ** 2)
+        if self.epoch_seconds_saved is not None:
+            message += ", saving about {:.1f}s per epoch".format(self.epoch_seconds_saved)
+        return message
+
+
+class Stager(object):
+    """Stages channels, optionally in a background thread so that training can start on the source data.
+    """
+
+    def __init__(self, channel_dirs, target_dir=None, max_bytes=None, workers=None, callback=None):
+        """
+        :param channel_dirs: dict of channel name -> directory of the channels to stage, in priority order
+        :param target_dir: the staging directory (default: ``SAGEMAKER_STAGING_DIR`` or a temporary directory)
+        :param max_bytes: the space budget (default: ``SAGEMAKER_STAGING_MAX_BYTES`` or 90% of the free space)
+        :param workers: the number of files copied in parallel
+        :param callback: function called with the reports once staging is done
+        """
+        self.channel_dirs = channel_dirs
+        self.callback = callback
+        self.target_dir = target_dir or os.environ.get(STAGING_DIR_ENV, DEFAULT_STAGING_DIR)
+        self.max_bytes = max_bytes or os.environ.get(STAGING_MAX_BYTES_ENV)
+        self.workers = workers or max(4, 2 * len(affinity.available_cpus()))
+        self.reports = None
+        self._thread = None
+        self._error = None
+
+    def run(self):
+        """Stages the channels and returns a list of :class:`StagingReport`.
+        """
+        if not os.path.isdir(self.target_dir):
+            os.makedirs(self.target_dir)
+        budget = int(self.max_bytes) if self.max_bytes else _free_bytes(self.target_dir, _RESERVED_FRACTION)
+
+        reports = []
+        for channel, source in self.channel_dirs.items():
+            report = self._stage(channel, source, budget)
+            if report.staged and not report.reused:
+                budget -= report.total_bytes
+            logger.info(str(report))
+            reports.append(report)
+        self.reports = reports
+        if self.callback:
+            self.callback(reports)
+        return reports
+
+    def start(self):
+        """Starts staging in a background thread. See :meth:`wait`.
+        """
+        def run():
+            try:
+                self.run()
+            except Exception as e:  # noqa
+                self._error = e
+
+        self._thread = threading.Thread(target=run, name='channel-staging')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Waits for background staging to finish and returns the reports, or None on timeout.
+        """
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return None
+        if self._error is not None:
+            raise self._error
+        return self.reports
+
+    def _stage(self, channel, source, budget):
+        listing = channels._list_files(source)
+        index = ChannelIndex._from_listing(source, listing, False)
+        target = os.path.join(self.target_dir, channel)
+        manifest_path = target + '.json'
+        manifest = {'source': os.path.abspath(source), 'files': [list(f) for f in listing]}
+
+        if _load_json(manifest_path) == manifest and os.path.isdir(target):
+            return StagingReport(channel, source, target, index.total_bytes, 0, reused=True)
+
+        if index.total_bytes > min(budget, _free_bytes(self.target_dir)):
+            logger.warning("channel {} needs {} bytes, over the remaining staging budget of {} bytes".format(
+                channel, index.total_bytes, budget))
+            return StagingReport(channel, source, None, index.total_bytes, 0)
+
+        source_seconds = _estimate_read_seconds(source, index)
+        start = time.time()
+        tmp = os.path.join(self.target_dir, '.{}.{}.tmp'.format(channel, uuid.uuid4().hex))
+        try:
+            _copy_files(source, tmp, [name for name, _ in index.files], self.workers)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.rename(tmp, target)
+        except:  # noqa
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        _write_json(manifest_path, manifest)
+
+        report = StagingReport(channel, source, target, index.total_bytes, time.time() - start)
+        staged_seconds = _estimate_read_seconds(target, index, evict=True)
+        if source_seconds is not None and staged_seconds is not None:
+            report.epoch_seconds_saved = max(0.0, source_seconds - staged_seconds)
+        return report
+
+
+def _copy_files(source, target, names, workers):
+    directories = set(os.path.dirname(os.path.join(target, name)) for name in names) | {target}
+    for directory in sorted(directories):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def copy(name):
+        with open(os.path.join(source, name), 'rb') as src, open(os.path.join(target, name), 'wb') as dst:
+            shutil.copyfileobj(src, dst, _BUFFER_SIZE)
+
+    pool = ThreadPool(min(workers, len(names)) or 1)
+    try:
+        pool.map(copy, names, chunksize=1)
+    finally:
+        pool.close()
+
+
+def _estimate_read_seconds(root, index, evict=False):
+    """Estimates the time to read all the files of the index under root by timing a sample read.
+
+    :param evict: drop the sampled files from the page cache first, so that a copy just written is read
+        from its volume; the estimate is None where this is not supported
+    """
+    if not index.total_bytes:
+        return None
+    names = []
+    sampled = 0
+    for name, size in index.files:
+        if sampled >= _SAMPLE_BYTES:
+            break
+        names.append(name)
+        sampled += size
+    if evict:
+        if not hasattr(os, 'posix_fadvise'):
+            return None
+        for name in names:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+    start = time.time()
+    sampled = 0
+    for name in names:
+        with open(os.path.join(root, name), 'rb') as f:
+            while sampled < _SAMPLE_BYTES:
+                data = f.read(_BUFFER_SIZE)
+                if not data:
+                    break
+                sampled += len(data)
+    return (time.time() - start) * index.total_bytes / sampled if sampled else None
+
+
+def _free_bytes(path, reserved_fraction=0):
+    stat = os.statvfs(path)
+    return int(stat.f_bavail * stat.f_frsize - reserved_fraction * stat.f_blocks * stat.f_frsize)
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp = '{}.{}'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp, path)
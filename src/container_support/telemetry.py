@@ -0,0 +1,298 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+"""Throughput telemetry for the channels read by a training process.
+
+Channel reads made through :class:`InstrumentedFile`, :func:`instrument_records` and
+:class:`InstrumentedDataset` (which :class:`~container_support.TrainingEnvironment` uses for its channel
+readers) count bytes, records and the time the training code spent blocked waiting for them. Records of
+memory mapped datasets are counted when they are handed out: the page faults of reading them are not
+timed. Parsed channels count the bytes of the files and the rows parsed, and the time the parsing took.
+When a session is started with :func:`start`, a thread also samples the cpu usage and resident memory of
+the process at a fixed interval and appends a JSON line per sample to
+``<output_dir>/telemetry/<name>.jsonl``. :func:`finish` writes a summary next to it, from which a job can be
+told apart as I/O bound (channels blocked for most of the time) or compute bound.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_channels = {}
+_channels_lock = threading.Lock()
+_session = None
+
+
+class ChannelStats(object):
+    """Cumulative read counters of a channel.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes = 0
+        self.records = 0
+        self.read_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, size, records, seconds):
+        with self._lock:
+            self.bytes += size
+            self.records += records
+            self.read_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return self.bytes, self.records, self.read_seconds
+
+
+def channel(name):
+    """Returns the :class:`ChannelStats` of a channel, shared by every reader of the process.
+    """
+    with _channels_lock:
+        if name not in _channels:
+            _channels[name] = ChannelStats(name)
+        return _channels[name]
+
+
+class InstrumentedFile(object):
+    """Wraps a binary file, counting the bytes read, the lines read as records and the time spent reading.
+    """
+
+    def __init__(self, f, stats):
+        self._file = f
+        self._stats = stats
+
+    def read(self, size=-1):
+        start = time.time()
+        data = self._file.read(size)
+        self._stats.add(len(data), 0, time.time() - start)
+        return data
+
+    def readinto(self, buffer):
+        start = time.time()
+        size = self._file.readinto(buffer)
+        self._stats.add(size or 0, 0, time.time() - start)
+        return size
+
+    def readline(self, size=-1):
+        start = time.time()
+        line = self._file.readline(size)
+        self._stats.add(len(line), 1 if line else 0, time.time() - start)
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    next = __next__
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._file.close()
+
+
+class InstrumentedDataset(object):
+    """Wraps a dataset of records (e.g. a :class:`~container_support.channels.MappedDataset`), counting the
+    records it hands out by index or through ``records``.
+    """
+
+    def __init__(self, dataset, stats):
+        self._dataset = dataset
+        self._stats = stats
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __getitem__(self, index):
+        start = time.time()
+        record = self._dataset[index]
+        self._stats.add(len(record), 1, time.time() - start)
+        return record
+
+    def records(self, *args, **kwargs):
+        return instrument_records(self._dataset.records(*args, **kwargs), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._dataset, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._dataset.close()
+
+
+def instrument_records(records, stats):
+    """Yields the records of an iterable, counting them, their size and the time spent waiting for them.
+    """
+    iterator = iter(records)
+    while True:
+        start = time.time()
+        try:
+            record = next(iterator)
+        except StopIteration:
+            return
+        stats.add(len(record), 1, time.time() - start)
+        yield record
+
+
+class Session(object):
+    """Samples the process and the channel counters at a fixed interval.
+    """
+
+    def __init__(self, output_dir, interval, name):
+        self.output_dir = output_dir
+        self.directory = os.path.join(output_dir, 'telemetry')
+        self.interval = interval
+        self.name = name
+        self.path = os.path.join(self.directory, name + '.jsonl')
+        self._stop = threading.Event()
+        self._start = time.time()
+        self._last = None
+        self._peak_rss = 0
+        self._thread = None
+
+    def start(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._last = self._measure()
+        self._file = open(self.path, 'a')
+        self._thread = threading.Thread(target=self._run, name='telemetry-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def _measure(self):
+        times = os.times()
+        with _channels_lock:
+            stats = list(_channels.values())
+        return time.time(), times[0] + times[1], {s.name: s.snapshot() for s in stats}
+
+    def sample(self):
+        """Appends the rates since the previous sample to the time series.
+        """
+        now, cpu, channels = self._measure()
+        last_time, last_cpu, last_channels = self._last
+        elapsed = (now - last_time) or 1e-9
+        rss = resident_bytes()
+        self._peak_rss = max(self._peak_rss, rss)
+        sample = {'t': round(now - self._start, 3),
+                  'cpu': round(100 * (cpu - last_cpu) / elapsed, 1),
+                  'rss': rss,
+                  'channels': {}}
+        for name, (size, records, seconds) in channels.items():
+            last_size, last_records, last_seconds = last_channels.get(name, (0, 0, 0.0))
+            sample['channels'][name] = {'bytes_per_second': int((size - last_size) / elapsed),
+                                        'records_per_second': round((records - last_records) / elapsed, 1),
+                                        'blocked': round((seconds - last_seconds) / elapsed, 3)}
+        self._last = now, cpu, channels
+        self._file.write(json.dumps(sample, separators=(',', ':'), sort_keys=True) + '\n')
+        self._file.flush()
+        return sample
+
+    def finish(self):
+        """Stops sampling and writes the summary of the whole session to ``<name>-summary.json``.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        self._file.close()
+
+        summary = summarize(time.time() - self._start, self._peak_rss)
+        with open(os.path.join(self.directory, self.name + '-summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        for name, stats in sorted(summary['channels'].items()):
+            logger.info("channel {}: {} MB, {} records, blocked on reads {:.0%} of the time ({:.1f} MB/s)".format(
+                name, stats['bytes'] // 1024 ** 2, stats['records'], stats['blocked_fraction'],
+                stats['bytes_per_second'] / 1024.0 ** 2))
+        return summary
+
+
+def summarize(wall_seconds, peak_rss=None):
+    """Returns the totals of the process and of every channel read so far.
+    """
+    times = os.times()
+    with _channels_lock:
+        stats = list(_channels.values())
+    summary = {'wall_seconds': round(wall_seconds, 3),
+               'cpu_seconds': round(times[0] + times[1], 3),
+               'peak_rss': max(peak_rss or 0, resident_bytes()),
+               'channels': {}}
+    for s in stats:
+        size, records, seconds = s.snapshot()
+        summary['channels'][s.name] = {'bytes': size,
+                                       'records': records,
+                                       'read_seconds': round(seconds, 3),
+                                       'bytes_per_second': int(size / seconds) if seconds else 0,
+                                       'blocked_fraction': round(seconds / wall_seconds, 3) if wall_seconds else 0}
+    return summary
+
+
+def start(output_dir, interval, name='training'):
+    """Starts the telemetry session of the process, resetting the channel counters.
+
+    :param output_dir: the directory the ``telemetry`` directory is created in, e.g. ``output_data_dir``
+    :param interval: the sampling interval, in seconds
+    :param name: the name of the files of the session, unique per process
+    """
+    global _session
+    with _channels_lock:
+        _channels.clear()
+    _session = Session(output_dir, interval, name).start()
+    return _session
+
+
+def active():
+    """Returns the current session, or None.
+    """
+    return _session
+
+
+def finish():
+    """Finishes the current session, if any, and returns its summary.
+    """
+    global _session
+    session, _session = _session, None
+    return session.finish() if session is not None else None
+
+
+def resident_bytes():
+    """Returns the resident memory of the current process, in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        import resource
+        # peak rather than current, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
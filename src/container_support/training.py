@@ -15,7 +15,7 @@ import container_support as cs
 import logging
 import os
 import traceback
-from container_support import TrainingEnvironment
+from container_support import TrainingEnvironment, artifacts, launcher, logs, telemetry
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +31,20 @@ class Trainer(object):
             env = TrainingEnvironment()
             env.start_metrics_if_enabled()
             base_dir = env.base_dir
+            if env.telemetry_interval:
+                telemetry.start(env.output_data_dir, float(env.telemetry_interval))
 
             env.pip_install_requirements()
+            if env.stage_channels_param:
+                env.stage_channels()
 
-            fw = TrainingEnvironment.load_framework()
-            fw.train()
+            num_processes = launcher.num_processes(env.num_processes)
+            if num_processes > 1:
+                launcher.launch(env, num_processes)
+            else:
+                fw = TrainingEnvironment.load_framework()
+                fw.train()
+            artifacts.flush_all()
             env.write_success_file()
         except Exception as e:
             trc = traceback.format_exc()
@@ -45,6 +54,11 @@ class Trainer(object):
             exit_code = 1 if not hasattr(e, 'errno') else e.errno
             raise e
         finally:
+            try:
+                telemetry.finish()
+            except Exception:  # noqa
+                logger.exception("failed to write the training telemetry")
+            logs.shutdown()
             # Since threads in Python cannot be stopped, this is the only way to stop the application
             # https://stackoverflow.com/questions/9591350/what-is-difference-between-sys-exit0-and-os-exit0
             os._exit(exit_code)
@@ -11,11 +11,38 @@
 #  express or implied. See the License for the specific language governing 
 #  permissions and limitations under the License.
 
-import tarfile
+import json
+import multiprocessing
+import os
+import py_compile
+import shutil
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
 import boto3
+import boto3.session
+import botocore.config
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
 from six.moves.urllib.parse import urlparse
 
+from container_support import affinity, archive
+from container_support.cache import ArtifactCache, cache_key, copy_tree
+from container_support.retrying import Retrying
+
+S3_ENDPOINT_URL_ENV = 'SAGEMAKER_S3_ENDPOINT_URL'
+S3_MAX_CONCURRENCY_ENV = 'SAGEMAKER_S3_MAX_CONCURRENCY'
+S3_CHUNK_SIZE_ENV = 'SAGEMAKER_S3_CHUNK_SIZE'
+
+MB = 1024 * 1024
+DEFAULT_S3_CHUNK_SIZE = 16 * MB
+
+SYNC_MANIFEST = '.sagemaker-sync-manifest.json'
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
 
 def parse_s3_url(url):
     """ Returns an (s3 bucket, key name/prefix) tuple from a url with an s3 scheme
@@ -26,20 +53,449 @@ def parse_s3_url(url):
     return parsed_url.netloc, parsed_url.path.lstrip('/')
 
 
-def download_s3_resource(source, target):
+def s3_client(max_pool_connections=None):
+    """ Returns the S3 client shared by all downloads in the current process with the same pool size.
+
+    The client is thread safe and keeps a connection pool large enough for the transfer concurrency it
+    is used with. Set ``SAGEMAKER_S3_ENDPOINT_URL`` to talk to a local S3 stand-in.
+
+    :param max_pool_connections: the size of the connection pool (default: the configured transfer concurrency)
+    """
+    # clients must not be shared with forked processes
+    key = os.getpid(), max_pool_connections or _s3_max_concurrency()
+    with _s3_clients_lock:
+        if key not in _s3_clients:
+            config = botocore.config.Config(max_pool_connections=key[1])
+            _s3_clients[key] = boto3.session.Session().client(
+                's3', endpoint_url=os.environ.get(S3_ENDPOINT_URL_ENV), config=config)
+        return _s3_clients[key]
+
+
+def transfer_config(max_concurrency=None, chunk_size=None):
+    """ Returns the boto3 TransferConfig used for ranged, concurrent S3 transfers.
+
+    :param max_concurrency: parallel ranged requests per object (default: ``SAGEMAKER_S3_MAX_CONCURRENCY``
+                            or twice the number of cpus, at least 10)
+    :param chunk_size: size in bytes of each ranged request (default: ``SAGEMAKER_S3_CHUNK_SIZE`` or 16 MB)
+    """
+    chunk_size = chunk_size or int(os.environ.get(S3_CHUNK_SIZE_ENV, DEFAULT_S3_CHUNK_SIZE))
+    return TransferConfig(max_concurrency=max_concurrency or _s3_max_concurrency(),
+                          multipart_threshold=chunk_size,
+                          multipart_chunksize=chunk_size)
+
+
+def _s3_max_concurrency():
+    return int(os.environ.get(S3_MAX_CONCURRENCY_ENV, max(10, 2 * len(affinity.available_cpus()))))
+
+
+class TransferProgress(object):
+    """ Transfer callback that counts the bytes transferred and prints the throughput in MB/s
+    at most once every ``interval`` seconds and when the transfer is done.
+    """
+
+    def __init__(self, name, interval=10.0):
+        self.name = name
+        self.interval = interval
+        self.bytes = 0
+        self.start = time.time()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.bytes += bytes_amount
+            now = time.time()
+            report = now - self._last_report >= self.interval
+            if report:
+                self._last_report = now
+        if report:
+            self.report()
+
+    @property
+    def elapsed(self):
+        return max(time.time() - self.start, 1e-6)
+
+    @property
+    def throughput(self):
+        """ The average throughput since the transfer started, in MB/s.
+        """
+        return self.bytes / self.elapsed / MB
+
+    def report(self, done=False):
+        print("{} {}: {:.1f} MB in {:.1f}s ({:.1f} MB/s)".format(
+            'Downloaded' if done else 'Downloading', self.name, self.bytes / MB, self.elapsed, self.throughput))
+
+
+def download_s3_resource(source, target, max_concurrency=None, chunk_size=None, callback=None, cache=None):
     """ Downloads the s3 object source and stores in a new file with path target.
+
+    Large objects are downloaded with concurrent ranged requests over the shared client, see
+    :func:`transfer_config`. ``file://`` urls are copied from the local filesystem.
+
+    :param source: s3:// or file:// url of the object
+    :param target: the path to write the object to
+    :param max_concurrency: parallel ranged requests per object
+    :param chunk_size: size in bytes of each ranged request
+    :param callback: called with the number of bytes transferred since the previous call
+                     (default: a :class:`TransferProgress` printing the throughput)
+    :param cache: the :class:`~container_support.cache.ArtifactCache` to serve unchanged objects from
+                  (default: the cache configured in the environment, if any). False disables caching.
     """
+    cache = ArtifactCache.from_env() if cache is None else cache
+    if not cache:
+        return _download_file(source, target, max_concurrency, chunk_size, callback)
+
+    path = _cached(source, cache, 'file',
+                   lambda tmp, version: _download_file(source, tmp, max_concurrency, chunk_size, callback, version))
+    shutil.copyfile(path, target)
+    return target
+
+
+def object_version(source):
+    """ Returns the version of the object at source: its ETag for s3:// urls, its size and
+    modification time for file:// urls.
+    """
+    if urlparse(source).scheme == 'file':
+        stat = os.stat(_local_path(source))
+        return '{}-{!r}'.format(stat.st_size, stat.st_mtime)
+
+    bucket, key = parse_s3_url(source)
+    return s3_client().head_object(Bucket=bucket, Key=key)['ETag']
+
+
+def _object_version(source, cache):
+    if not cache.revalidate:
+        version = cache.last_version(source)
+        if version:
+            return version
+
+    version = object_version(source)
+    cache.record_version(source, version)
+    return version
+
+
+class _ObjectChanged(Exception):
+    def __init__(self, error):
+        super(_ObjectChanged, self).__init__(str(error))
+        self.error = error
+
+
+def _cached(source, cache, kind, build):
+    """Returns the path of the cache entry of the current version of source, building it with
+    build(path, version) if needed. The object is fetched only if it still has that version, so that the
+    bytes of an object replaced in the meantime are not cached under the previous version.
+    """
+    version = _object_version(source, cache)
+    for attempt in range(2):
+        key = cache_key(source, version, kind)
+        path = cache.get(key)
+        if path is not None:
+            print("Using cached {}".format(source))
+            return path
+        try:
+            return cache.publish(key, lambda tmp: build(tmp, version))
+        except _ObjectChanged as e:
+            if attempt:
+                raise e.error
+            version = object_version(source)
+            cache.record_version(source, version)
+
+
+def _if_match(call, version):
+    # S3 answers 412 when the object no longer has the ETag
+    try:
+        return call({'IfMatch': version} if version else {})
+    except botocore.exceptions.ClientError as e:
+        if version and e.response.get('Error', {}).get('Code') in ('PreconditionFailed', '412'):
+            raise _ObjectChanged(e)
+        raise
+
+
+def _download_file(source, target, max_concurrency, chunk_size, callback, version=None):
     print("Downloading {} to {}".format(source, target))
-    s3 = boto3.resource('s3')
+    progress = callback if callback is not None else TransferProgress(source)
 
-    script_bucket_name, script_key_name = parse_s3_url(source)
-    script_bucket = s3.Bucket(script_bucket_name)
-    script_bucket.download_file(script_key_name, target)
+    if urlparse(source).scheme == 'file':
+        _copy_local_file(_local_path(source), target, progress, chunk_size)
+    else:
+        bucket, key = parse_s3_url(source)
+        config = transfer_config(max_concurrency, chunk_size)
+        _if_match(lambda extra_args: s3_client(config.max_concurrency).download_file(
+            bucket, key, target, ExtraArgs=extra_args, Config=config, Callback=progress), version)
 
+    if isinstance(progress, TransferProgress):
+        progress.report(done=True)
     return target
 
 
-def untar_directory(tar_file_path, extract_dir_path):
+def _local_path(url):
+    # file://data/x is the relative path data/x, file:///data/x the absolute one
+    parsed_url = urlparse(url)
+    return parsed_url.netloc + parsed_url.path
+
+
+def _copy_local_file(source, target, callback, chunk_size=None):
+    chunk_size = chunk_size or DEFAULT_S3_CHUNK_SIZE
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while True:
+            data = src.read(chunk_size)
+            if not data:
+                break
+            dst.write(data)
+            callback(len(data))
+
+
+def sync_s3_prefix(source, target_dir, max_workers=None, delete=False, max_attempts=5):
+    """ Makes target_dir a copy of every object under the s3 prefix source, downloading only new and
+    changed objects.
+
+    The size and ETag of every object downloaded are recorded in a manifest next to target_dir
+    (``.<name of target_dir>`` + :data:`SYNC_MANIFEST`), so that target_dir only holds the objects, and
+    compared with a listing of the prefix on the next sync. Objects are
+    downloaded concurrently by a pool of ``max_workers`` threads, each download retried with exponential
+    backoff. ``file://`` urls sync from a local directory, using size and modification time as ETag.
+
+    :param source: s3:// or file:// url of the prefix
+    :param target_dir: the local directory to sync into
+    :param max_workers: the number of objects downloaded concurrently (default: ``SAGEMAKER_S3_MAX_CONCURRENCY``)
+    :param delete: remove local files whose objects no longer exist under the prefix
+    :param max_attempts: attempts per object before the sync fails
+    :return: dict with the number of objects 'downloaded', 'unchanged' and 'deleted', and the 'bytes' downloaded
+    """
+    start = time.time()
+    objects = _list_prefix(source)
+    manifest_path = _manifest_path(target_dir)
+    legacy_manifest_path = os.path.join(target_dir, SYNC_MANIFEST)
+    if SYNC_MANIFEST not in objects and os.path.isfile(legacy_manifest_path) and not os.path.exists(manifest_path):
+        # written in target_dir by previous versions
+        os.rename(legacy_manifest_path, manifest_path)
+    manifest = _load_manifest(manifest_path)
+
+    changed = []
+    for name, (url, size, etag) in objects.items():
+        path = _sync_target(target_dir, name)
+        entry = manifest.get(name)
+        if not entry or entry != {'size': size, 'etag': etag} or not os.path.isfile(path) \
+                or os.path.getsize(path) != size:
+            changed.append((name, url, path, size, etag))
+
+    # jittered so that the download threads do not retry in lockstep when S3 throttles them
+    retrying = Retrying(stop_max_attempt_number=max_attempts,
+                        wait_exponential_multiplier=100,
+                        wait_exponential_max=10000,
+                        wait_jitter='full')
+    lock = threading.Lock()
+
+    def download(item):
+        name, url, path, size, etag = item
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        tmp = '{}.{}.tmp'.format(path, threading.current_thread().ident)
+        try:
+            retrying.call(_download_file, url, tmp, None, None, lambda _: None)
+            os.rename(tmp, path)
+        except:  # noqa
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with lock:
+            manifest[name] = {'size': size, 'etag': etag}
+
+    print("Syncing {} to {}: {} of {} objects changed".format(source, target_dir, len(changed), len(objects)))
+    pool = ThreadPool(max_workers or _s3_max_concurrency())
+    try:
+        pool.map(download, changed, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        # record what was downloaded even if the sync failed, so the next attempt resumes
+        if changed:
+            _save_manifest(manifest_path, manifest)
+
+    deleted = 0
+    if delete:
+        for name in set(manifest) - set(objects):
+            path = _sync_target(target_dir, name)
+            if os.path.isfile(path):
+                os.remove(path)
+            del manifest[name]
+            deleted += 1
+        if deleted:
+            _save_manifest(manifest_path, manifest)
+
+    downloaded_bytes = sum(item[3] for item in changed)
+    elapsed = max(time.time() - start, 1e-6)
+    print("Synced {} to {}: downloaded {} objects, {:.1f} MB in {:.1f}s ({:.1f} MB/s)".format(
+        source, target_dir, len(changed), downloaded_bytes / MB, elapsed, downloaded_bytes / MB / elapsed))
+    return {'downloaded': len(changed), 'unchanged': len(objects) - len(changed), 'deleted': deleted,
+            'bytes': downloaded_bytes}
+
+
+def _list_prefix(source):
+    """ Returns a dict of object name relative to the prefix -> (url, size, etag).
+    """
+    objects = {}
+    if urlparse(source).scheme == 'file':
+        root = _local_path(source)
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                rel = os.path.relpath(path, root).replace(os.sep, '/')
+                stat = os.stat(path)
+                objects[rel] = ('file://' + path, stat.st_size, '{}-{!r}'.format(stat.st_size, stat.st_mtime))
+        return objects
+
+    bucket, prefix = parse_s3_url(source)
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    paginator = s3_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key.endswith('/'):
+                continue
+            objects[key[len(prefix):]] = ('s3://{}/{}'.format(bucket, key), obj['Size'], obj['ETag'])
+    return objects
+
+
+def _sync_target(target_dir, name):
+    root = os.path.abspath(target_dir)
+    path = os.path.abspath(os.path.join(root, name))
+    if not path.startswith(root + os.sep):
+        raise ValueError("illegal object name under prefix: {}".format(name))
+    return path
+
+
+def _manifest_path(target_dir):
+    root = os.path.abspath(target_dir)
+    return os.path.join(os.path.dirname(root), '.{}{}'.format(os.path.basename(root), SYNC_MANIFEST))
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.rename(tmp, path)
+
+
+def untar_directory(tar_file_path, extract_dir_path, workers=None):
+    """ Extracts the tar archive at tar_file_path into extract_dir_path.
+
+    The compression format (gzip, bzip2, xz, zstd, lz4 or none) is detected from the content.
+    See :mod:`container_support.archive`.
+
+    :param workers: the number of threads writing files (default: the number of cpus)
+    """
     with open(tar_file_path, 'rb') as f:
-        with tarfile.open(mode='r:gz', fileobj=f) as t:
-            t.extractall(path=extract_dir_path)
+        archive.extract(f, extract_dir_path, workers)
+
+
+def download_and_extract(source, extract_dir_path, callback=None, cache=None):
+    """ Streams the tar archive at source into extract_dir_path.
+
+    Members are extracted while the archive downloads, without writing the archive to disk. The compression
+    format is detected like in :func:`untar_directory`. Members that would be written outside of
+    extract_dir_path are rejected.
+
+    :param source: s3:// or file:// url of the archive
+    :param extract_dir_path: the directory to extract the archive into
+    :param callback: called with the number of compressed bytes read since the previous call
+                     (default: a :class:`TransferProgress` printing the throughput)
+    :param cache: the :class:`~container_support.cache.ArtifactCache` to serve unchanged extracted trees from
+                  (default: the cache configured in the environment, if any). False disables caching.
+    """
+    cache = ArtifactCache.from_env() if cache is None else cache
+    if not cache:
+        return _stream_extract(source, extract_dir_path, callback)
+
+    path = _cached(source, cache, 'tree', lambda tmp, version: _stream_extract(source, tmp, callback, version))
+    copy_tree(path, extract_dir_path)
+
+
+def _stream_extract(source, extract_dir_path, callback, version=None):
+    print("Extracting {} to {}".format(source, extract_dir_path))
+    progress = callback if callback is not None else TransferProgress(source)
+
+    stream = _open_stream(source, version)
+    try:
+        archive.extract(_CountingReader(stream, progress), extract_dir_path)
+    finally:
+        stream.close()
+
+    if isinstance(progress, TransferProgress):
+        progress.report(done=True)
+
+
+def _open_stream(source, version=None):
+    if urlparse(source).scheme == 'file':
+        return open(_local_path(source), 'rb')
+
+    bucket, key = parse_s3_url(source)
+    return _if_match(lambda extra_args: s3_client().get_object(Bucket=bucket, Key=key, **extra_args), version)['Body']
+
+
+class _CountingReader(object):
+    def __init__(self, stream, callback):
+        self._stream = stream
+        self._callback = callback
+
+    def read(self, size=-1):
+        data = self._stream.read(size) if size is not None and size >= 0 else self._stream.read()
+        self._callback(len(data))
+        return data
+
+
+def compile_directory(path, workers=None):
+    """ Compiles every python source file under path to bytecode, in parallel.
+
+    The bytecode is written where the import system will look for it, i.e. next to the sources or
+    under ``sys.pycache_prefix`` when one is set.
+
+    :param path: the directory to compile
+    :param workers: the number of processes to use (default: the number of cpus)
+    :return: tuple (number of files compiled, sum of the per file compile times in seconds)
+    """
+    sources = [os.path.join(root, name)
+               for root, _, files in os.walk(path)
+               for name in files if name.endswith('.py')]
+
+    workers = min(workers or len(affinity.available_cpus()), len(sources))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            timings = pool.map(_compile_file, sources)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        timings = [_compile_file(source) for source in sources]
+
+    compiled = [t for t in timings if t is not None]
+    return len(compiled), sum(compiled)
+
+
+def _compile_file(source):
+    start = time.time()
+    try:
+        py_compile.compile(source, doraise=True)
+    except py_compile.PyCompileError as e:
+        # the error will surface with a proper traceback when the module is imported
+        print("Unable to compile {}: {}".format(source, e.msg))
+        return None
+    return time.time() - start
@@ -11,6 +11,8 @@
 #  express or implied. See the License for the specific language governing 
 #  permissions and limitations under the License.
 
-from container_support.serving import Server
+from container_support.serving import RawWsgiApp, Server
 
-app = Server.from_env().app
+server = Server.from_env()
+app = server.app
+raw_app = RawWsgiApp(server)
@@ -0,0 +1,135 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+
+from mock import patch, MagicMock
+
+from container_support import affinity, gunicorn_config
+
+
+def test_parse_cpu_list():
+    assert affinity.parse_cpu_list('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+
+
+def test_parse_cpu_list_empty():
+    assert affinity.parse_cpu_list('') == []
+
+
+def test_numa_nodes(tmpdir):
+    for node, cpus in [('node0', '0-3'), ('node1', '4-7'), ('node10', '')]:
+        tmpdir.mkdir(node).join('cpulist').write(cpus)
+
+    with patch('container_support.affinity.available_cpus', return_value=list(range(6))):
+        assert affinity.numa_nodes(str(tmpdir.join('node[0-9]*'))) == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_numa_nodes_without_sysfs(tmpdir):
+    with patch('container_support.affinity.available_cpus', return_value=[0, 1]):
+        assert affinity.numa_nodes(str(tmpdir.join('node[0-9]*'))) == [[0, 1]]
+
+
+def test_partition_cpus_single_node():
+    assert affinity.partition_cpus(2, nodes=[[0, 1, 2, 3]]) == [[0, 1], [2, 3]]
+
+
+def test_partition_cpus_interleaves_numa_nodes():
+    nodes = [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert affinity.partition_cpus(4, nodes=nodes) == [[0, 1], [4, 5], [2, 3], [6, 7]]
+
+
+def test_partition_cpus_more_workers_than_cpus():
+    assert affinity.partition_cpus(3, nodes=[[0, 1]]) == [[0], [1], [0]]
+
+
+def test_threads_per_worker():
+    assert affinity.threads_per_worker(4, cpus=16) == 4
+    assert affinity.threads_per_worker(16, cpus=4) == 1
+
+
+def test_set_thread_budget_keeps_user_settings():
+    environ = {'OMP_NUM_THREADS': '7'}
+    threads = affinity.set_thread_budget(2, environ)
+
+    assert threads['OMP_NUM_THREADS'] == '7'
+    assert threads['MKL_NUM_THREADS'] == '2'
+    assert environ['OPENBLAS_NUM_THREADS'] == '2'
+
+
+@patch('os.sched_setaffinity', create=True)
+def test_pin_to_cpus(sched_setaffinity):
+    assert affinity.pin_to_cpus([0, 1])
+    sched_setaffinity.assert_called_with(0, [0, 1])
+
+
+def test_pre_fork_assigns_lowest_free_slot():
+    server = MagicMock()
+    server.WORKERS = {1: MagicMock(slot=0), 2: MagicMock(slot=2)}
+    worker = MagicMock()
+
+    gunicorn_config.pre_fork(server, worker)
+
+    assert worker.slot == 1
+
+
+@patch('container_support.affinity.pin_to_cpus')
+@patch('container_support.affinity.partition_cpus', return_value=[[0, 1], [2, 3]])
+def test_post_fork_pins_worker(partition_cpus, pin_to_cpus):
+    server = MagicMock(num_workers=2)
+    worker = MagicMock(slot=1)
+
+    with patch.dict(os.environ, {'SAGEMAKER_MODEL_SERVER_CPU_AFFINITY': 'true'}):
+        gunicorn_config.post_fork(server, worker)
+
+    pin_to_cpus.assert_called_with([2, 3])
+
+
+@patch('container_support.affinity.pin_to_cpus')
+@patch('container_support.affinity.partition_cpus', return_value=[[0], [1], [2], [3]])
+def test_post_fork_pins_worker_autoscaling(partition_cpus, pin_to_cpus):
+    server = MagicMock(num_workers=2)
+    worker = MagicMock(slot=1)
+
+    with patch.dict(os.environ, {'SAGEMAKER_MODEL_SERVER_CPU_AFFINITY': 'true',
+                                 'SAGEMAKER_MODEL_SERVER_MAX_WORKERS': '4'}):
+        gunicorn_config.post_fork(server, worker)
+
+    # the cpu sets stay disjoint from the workers the autoscaler may add
+    partition_cpus.assert_called_with(4)
+    pin_to_cpus.assert_called_with([1])
+
+
+@patch('container_support.affinity.pin_to_cpus')
+def test_post_fork_affinity_disabled(pin_to_cpus):
+    with patch.dict(os.environ, {'SAGEMAKER_MODEL_SERVER_CPU_AFFINITY': 'false'}):
+        gunicorn_config.post_fork(MagicMock(), MagicMock())
+
+    pin_to_cpus.assert_not_called()
+
+
+@patch('container_support.environment.ContainerEnvironment.load_framework')
+def test_on_starting_preloads_framework(load_framework):
+    load_framework.return_value.__name__ = 'my_framework'
+    with patch.dict(os.environ, {'SAGEMAKER_PRELOAD_FRAMEWORK': 'true'}):
+        gunicorn_config.on_starting(MagicMock())
+
+    load_framework.assert_called_with()
+
+
+@patch('container_support.environment.ContainerEnvironment.load_framework')
+def test_on_starting_without_preload(load_framework):
+    with patch.dict(os.environ, {'SAGEMAKER_PRELOAD_FRAMEWORK': 'false'}):
+        gunicorn_config.on_starting(MagicMock())
+
+    load_framework.assert_not_called()
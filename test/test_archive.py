@@ -0,0 +1,222 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import gzip
+import io
+import os
+import stat
+import tarfile
+import time
+
+import pytest
+from mock import patch
+
+from container_support import archive
+
+FILES = {'script.py': b'print(1)\n', 'lib/data.bin': os.urandom(100000), 'lib/empty': b''}
+
+
+def _tar_bytes(files=FILES, extra=()):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode='w') as t:
+        for name, data in sorted(files.items()):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o4777
+            info.mtime = 1000000000
+            t.addfile(info, io.BytesIO(data))
+        for info in extra:
+            t.addfile(info)
+    return out.getvalue()
+
+
+def _compress(data, fmt):
+    if fmt == archive.GZIP:
+        return gzip.compress(data) if hasattr(gzip, 'compress') else _gzip_py2(data)
+    if fmt == archive.BZIP2:
+        import bz2
+        return bz2.compress(data)
+    if fmt == archive.XZ:
+        lzma = pytest.importorskip('lzma')
+        return lzma.compress(data)
+    if fmt == archive.ZSTD:
+        zstandard = pytest.importorskip('zstandard')
+        return zstandard.ZstdCompressor().compress(data)
+    if fmt == archive.LZ4:
+        lz4_frame = pytest.importorskip('lz4.frame')
+        return lz4_frame.compress(data)
+    return data
+
+
+def _gzip_py2(data):
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _assert_extracted(path, files=FILES):
+    for name, data in files.items():
+        with open(os.path.join(path, name), 'rb') as f:
+            assert f.read() == data
+
+
+@pytest.mark.parametrize('fmt', [archive.GZIP, archive.BZIP2, archive.XZ, archive.ZSTD, archive.LZ4, archive.TAR])
+def test_detect_format(fmt):
+    assert archive.detect_format(_compress(b'x' * 100, fmt)[:8]) == fmt
+
+
+@pytest.mark.parametrize('fmt', [archive.GZIP, archive.BZIP2, archive.XZ, archive.ZSTD, archive.LZ4, archive.TAR])
+@pytest.mark.parametrize('use_commands', [True, False])
+def test_extract(fmt, use_commands, tmpdir):
+    data = _compress(_tar_bytes(), fmt)
+
+    with patch('container_support.archive.which', return_value=None if not use_commands else '/bin/cmd'), \
+            patch.dict(archive._COMMANDS, {archive.GZIP: ['gzip', '-dc']}):
+        if use_commands and fmt in (archive.ZSTD, archive.LZ4):
+            pytest.skip('command line tool not installed')
+        assert archive.extract(io.BytesIO(data), str(tmpdir), workers=3) == fmt
+
+    _assert_extracted(str(tmpdir))
+
+
+def test_extract_concatenated_gzip_members(tmpdir):
+    tar = _tar_bytes()
+    data = _compress(tar[:5000], archive.GZIP) + _compress(tar[5000:], archive.GZIP)
+
+    with patch('container_support.archive.which', return_value=None):
+        archive.extract(io.BytesIO(data), str(tmpdir))
+
+    _assert_extracted(str(tmpdir))
+
+
+def test_extract_large_files_are_streamed(tmpdir):
+    with patch('container_support.archive.MAX_BUFFERED_FILE_SIZE', 10), \
+            patch('container_support.archive.MAX_BUFFERED_BYTES', 10):
+        archive.extract(io.BytesIO(_compress(_tar_bytes(), archive.GZIP)), str(tmpdir), workers=2)
+
+    _assert_extracted(str(tmpdir))
+
+
+@pytest.mark.parametrize('first, second, max_buffered_file_size', [
+    (b'first' * 100000, b'second', archive.MAX_BUFFERED_FILE_SIZE),
+    # the second member is written on the reading thread
+    (b'first', b'second' * 100000, 1000),
+], ids=['buffered', 'streamed'])
+def test_extract_duplicate_members_last_wins(first, second, max_buffered_file_size, tmpdir):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode='w') as t:
+        for data in (first, second):
+            info = tarfile.TarInfo('a.txt')
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+
+    write_data = archive._write_data
+
+    def slow_write_data(target, data, member):
+        if data == first:
+            time.sleep(0.2)
+        write_data(target, data, member)
+
+    with patch('container_support.archive._write_data', side_effect=slow_write_data), \
+            patch('container_support.archive.MAX_BUFFERED_FILE_SIZE', max_buffered_file_size):
+        archive.extract(io.BytesIO(out.getvalue()), str(tmpdir), workers=8)
+
+    assert tmpdir.join('a.txt').read_binary() == second
+
+
+def test_extract_masks_file_modes(tmpdir):
+    archive.extract(io.BytesIO(_tar_bytes()), str(tmpdir))
+
+    st = os.stat(str(tmpdir.join('script.py')))
+    assert stat.S_IMODE(st.st_mode) == 0o755
+    assert st.st_mtime == 1000000000
+
+
+def test_extract_links(tmpdir):
+    symlink = tarfile.TarInfo('lib/link.py')
+    symlink.type = tarfile.SYMTYPE
+    symlink.linkname = '../script.py'
+    hardlink = tarfile.TarInfo('hard.py')
+    hardlink.type = tarfile.LNKTYPE
+    hardlink.linkname = 'script.py'
+
+    archive.extract(io.BytesIO(_tar_bytes(extra=[symlink, hardlink])), str(tmpdir))
+
+    assert os.readlink(str(tmpdir.join('lib', 'link.py'))) == '../script.py'
+    assert tmpdir.join('hard.py').read_binary() == FILES['script.py']
+
+
+def test_extract_rejects_hardlink_outside(tmpdir):
+    hardlink = tarfile.TarInfo('passwd')
+    hardlink.type = tarfile.LNKTYPE
+    hardlink.linkname = '../../etc/passwd'
+
+    with pytest.raises(ValueError):
+        archive.extract(io.BytesIO(_tar_bytes(files={}, extra=[hardlink])), str(tmpdir))
+
+
+def _link(name, linkname, link_type):
+    info = tarfile.TarInfo(name)
+    info.type = link_type
+    info.linkname = linkname
+    return info
+
+
+@pytest.mark.parametrize('data_filter', [True, False])
+def test_extract_rejects_hardlink_through_deferred_symlinks(tmpdir, data_filter):
+    # d -> . and e -> d/../victim look harmless when checked before any link exists
+    victim = tmpdir.join('victim')
+    victim.write('secret')
+    out = tmpdir.mkdir('out')
+    members = [_link('d', '.', tarfile.SYMTYPE),
+               _link('e', 'd/../victim', tarfile.SYMTYPE),
+               _link('h', 'e', tarfile.LNKTYPE)]
+
+    with patch.object(tarfile, 'data_filter', getattr(tarfile, 'data_filter', None) if data_filter else None,
+                      create=True), pytest.raises(ValueError):
+        archive.extract(io.BytesIO(_tar_bytes(files={}, extra=members)), str(out))
+
+    assert not out.join('h').check(exists=True)
+    assert victim.read() == 'secret'
+
+
+def test_extract_rejects_symlink_escaping_after_later_links(tmpdir):
+    out = tmpdir.mkdir('out')
+    members = [_link('d', '.', tarfile.SYMTYPE), _link('e', 'd/../victim', tarfile.SYMTYPE)]
+
+    with patch.object(tarfile, 'data_filter', None, create=True), pytest.raises(ValueError):
+        archive.extract(io.BytesIO(_tar_bytes(files={}, extra=members)), str(out))
+
+    assert not os.path.lexists(str(out.join('e')))
+
+
+def test_extract_corrupt_archive(tmpdir):
+    data = _compress(_tar_bytes(), archive.GZIP)[:-100]
+
+    with patch('container_support.archive.which', return_value=None), pytest.raises(Exception):
+        archive.extract(io.BytesIO(data), str(tmpdir))
+
+
+def test_extract_failing_command(tmpdir):
+    data = _compress(_tar_bytes(), archive.GZIP)
+
+    with patch('container_support.archive.which', return_value='/bin/false'), \
+            patch.dict(archive._COMMANDS, {archive.GZIP: ['false']}), pytest.raises(Exception):
+        archive.extract(io.BytesIO(data), str(tmpdir))
+
+
+def test_missing_decompressor():
+    with patch.dict('sys.modules', {'zstandard': None}), pytest.raises(ImportError):
+        archive.open_stream(io.BytesIO(b'\x28\xb5\x2f\xfd' + b'\x00' * 10), use_commands=False)
@@ -0,0 +1,131 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+import threading
+
+import pytest
+from mock import patch
+
+from container_support import artifacts
+from container_support.artifacts import ArtifactWriter
+
+
+def test_write(tmpdir):
+    with ArtifactWriter(str(tmpdir)) as writer:
+        writer.write('model.bin', b'weights')
+        writer.write('checkpoints/epoch-1.bin', bytearray(b'x' * (3 * 1024 * 1024 + 1)))
+        writer.flush()
+
+        assert tmpdir.join('model.bin').read_binary() == b'weights'
+        assert tmpdir.join('checkpoints', 'epoch-1.bin').size() == 3 * 1024 * 1024 + 1
+        assert writer.artifacts_written == 2
+        # no temporary files are left behind
+        assert sorted(os.listdir(str(tmpdir.join('checkpoints')))) == ['epoch-1.bin']
+
+
+def test_write_overwrites(tmpdir):
+    with ArtifactWriter(str(tmpdir)) as writer:
+        for i in range(5):
+            writer.write('latest', str(i).encode('utf-8'))
+    assert tmpdir.join('latest').read_binary() == b'4'
+
+
+def test_write_outside_of_root(tmpdir):
+    with ArtifactWriter(str(tmpdir.join('model'))) as writer:
+        with pytest.raises(ValueError):
+            writer.write('../escape', b'')
+        with pytest.raises(ValueError):
+            writer.write('/abs', b'')
+
+
+def test_write_after_close(tmpdir):
+    writer = ArtifactWriter(str(tmpdir))
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write('model.bin', b'')
+
+
+def test_fsync_batch(tmpdir):
+    gate = threading.Event()
+    write_temporary = ArtifactWriter._write_temporary
+
+    def blocked(writer, *args):
+        # hold the writer back until all artifacts are queued so that they are published together
+        gate.wait()
+        return write_temporary(writer, *args)
+
+    with patch('container_support.artifacts._fsync') as fsync, \
+            patch.object(ArtifactWriter, '_write_temporary', blocked):
+        with ArtifactWriter(str(tmpdir), fsync_batch=3) as writer:
+            for name in 'abc':
+                writer.write(name, name.encode('utf-8'))
+            gate.set()
+            writer.flush()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['a', 'b', 'c']
+    # every file and, once per batch, the directory
+    assert fsync.call_count == 4
+
+
+def test_error_raised_on_flush(tmpdir):
+    tmpdir.join('file').write('')
+    writer = ArtifactWriter(str(tmpdir))
+    writer.write('file/model.bin', b'weights')
+    with pytest.raises(OSError):
+        writer.flush()
+    # the error is only raised once and the writer keeps working
+    writer.write('model.bin', b'weights')
+    writer.close()
+    assert tmpdir.join('model.bin').read_binary() == b'weights'
+
+
+def test_upload_file_url(tmpdir):
+    target = tmpdir.join('upload')
+    with ArtifactWriter(str(tmpdir.join('model')), upload_url='file://' + str(target)) as writer:
+        writer.write('checkpoints/1.bin', b'1')
+    assert target.join('checkpoints', '1.bin').read_binary() == b'1'
+
+
+@patch('container_support.utils.s3_client')
+def test_upload_s3(s3_client, tmpdir):
+    with ArtifactWriter(str(tmpdir), upload_url='s3://bucket/prefix/') as writer:
+        writer.write('model.bin', b'1')
+
+    args, kwargs = s3_client.return_value.upload_file.call_args
+    assert args == (str(tmpdir.join('model.bin')), 'bucket', 'prefix/model.bin')
+
+
+@patch('container_support.artifacts.time.sleep')
+def test_throttle(sleep):
+    with patch('container_support.artifacts.time.time', return_value=100.0):
+        throttle = artifacts._Throttle(1000)
+        throttle.consume(500)
+        assert not sleep.called
+        throttle.consume(500)
+    sleep.assert_called_once_with(0.5)
+
+
+def test_flush_all(tmpdir):
+    first = ArtifactWriter(str(tmpdir.join('a')))
+    second = ArtifactWriter(str(tmpdir.join('b')))
+    first.write('1', b'1')
+    second.write('2', b'2')
+
+    artifacts.flush_all()
+    assert tmpdir.join('a', '1').check() and tmpdir.join('b', '2').check()
+
+    first.close()
+    second.close()
+    assert first not in artifacts._writers and second not in artifacts._writers
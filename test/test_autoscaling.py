@@ -0,0 +1,165 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+import signal
+
+import pytest
+from mock import MagicMock, patch
+
+from container_support import autoscaling, gunicorn_config
+
+GB = 1024 ** 3
+
+
+@pytest.fixture()
+def slots(tmpdir):
+    s = autoscaling.WorkerSlots(str(tmpdir.join('slots')), 4, create=True)
+    yield s
+    s.close()
+
+
+@pytest.fixture()
+def proc(tmpdir):
+    root = tmpdir.mkdir('proc')
+    root.join('stat').write('cpu  100 0 100 800 0 0 0 0 0 0\n')
+    root.join('meminfo').write('MemTotal: 16777216 kB\nMemAvailable: 8388608 kB\n')
+    return root
+
+
+def _autoscaler(slots, proc, now, **kwargs):
+    options = dict(workers=2, min_workers=1, max_workers=4, samples=2, cooldown=10, proc=str(proc),
+                   clock=lambda: now[0])
+    options.update(kwargs)
+    return autoscaling.Autoscaler(12345, slots, **options)
+
+
+def test_worker_slots(slots, tmpdir):
+    slots.assign(0, 100)
+    slots.assign(2, 102)
+    slots.begin_request(0)
+    slots.begin_request(0)
+    slots.end_request(0)
+    slots.begin_request(2)
+    # slots past the end are ignored
+    slots.begin_request(9)
+
+    with patch.dict(os.environ, {autoscaling.SLOTS_FILE_ENV: slots.path}):
+        shared = autoscaling.WorkerSlots.from_env()
+    assert shared.count == 4
+    assert shared.read() == [(100, 1, 1), (102, 1, 0)]
+
+    slots.assign(0, 0)
+    assert shared.read() == [(102, 1, 0)]
+    shared.close()
+
+
+def test_worker_slots_from_env_disabled():
+    with patch.dict(os.environ, {}):
+        os.environ.pop(autoscaling.SLOTS_FILE_ENV, None)
+        assert autoscaling.WorkerSlots.from_env() is None
+
+
+def test_decide_hysteresis_and_cooldown(slots, proc):
+    now = [0.0]
+    scaler = _autoscaler(slots, proc, now)
+
+    assert scaler.decide(3, 50, 8 * GB, GB) == (0, None)
+    assert scaler.decide(3, 50, 8 * GB, GB)[0] == autoscaling.SCALE_UP
+    # cooling down
+    assert scaler.decide(3, 50, 8 * GB, GB)[0] == 0
+    assert scaler.decide(3, 50, 8 * GB, GB)[0] == 0
+    now[0] = 11
+    assert scaler.decide(3, 50, 8 * GB, GB)[0] == autoscaling.SCALE_UP
+
+
+def test_decide_streak_resets_on_direction_change(slots, proc):
+    now = [0.0]
+    scaler = _autoscaler(slots, proc, now)
+
+    assert scaler.decide(3, 50, 8 * GB, GB)[0] == 0
+    assert scaler.decide(0, 10, 8 * GB, GB)[0] == 0
+    assert scaler.decide(1, 10, 8 * GB, GB)[0] == 0
+    assert scaler.decide(0, 10, 8 * GB, GB)[0] == 0
+    assert scaler.decide(0, 10, 8 * GB, GB)[0] == autoscaling.SCALE_DOWN
+
+
+def test_decide_bounds(slots, proc):
+    now = [0.0]
+    at_max = _autoscaler(slots, proc, now, workers=4)
+    at_min = _autoscaler(slots, proc, now, workers=1)
+
+    for _ in range(3):
+        assert at_max.decide(10, 50, 8 * GB, GB)[0] == 0
+        assert at_min.decide(0, 0, 8 * GB, GB)[0] == 0
+
+
+def test_decide_cpu_thresholds(slots, proc):
+    now = [0.0]
+    scaler = _autoscaler(slots, proc, now)
+
+    for _ in range(3):
+        # saturated cpus: more workers would not help
+        assert scaler.decide(3, 95, 8 * GB, GB)[0] == 0
+        # idle queues, but busy cpus
+        assert scaler.decide(0, 50, 8 * GB, GB)[0] == 0
+
+
+def test_decide_memory_budget(slots, proc):
+    now = [0.0]
+    scaler = _autoscaler(slots, proc, now)
+    scaler.decide(3, 50, GB, 2 * GB)
+    assert scaler.decide(3, 50, GB, 2 * GB)[0] == 0
+
+    budget = _autoscaler(slots, proc, now, worker_memory=4 * GB)
+    budget.decide(3, 50, 3 * GB, GB)
+    assert budget.decide(3, 50, 3 * GB, GB)[0] == 0
+
+
+@patch('os.kill')
+def test_tick_signals_gunicorn(kill, slots, proc):
+    now = [0.0]
+    scaler = _autoscaler(slots, proc, now)
+    slots.assign(0, 100)
+    slots.assign(1, 101)
+    for _ in range(6):
+        slots.begin_request(0)
+
+    assert scaler.tick() == 0
+    assert scaler.tick() == autoscaling.SCALE_UP
+    kill.assert_called_with(12345, signal.SIGTTIN)
+    assert scaler.workers == 3
+
+    for _ in range(6):
+        slots.end_request(0)
+    now[0] = 20
+    scaler.tick()
+    assert scaler.tick() == autoscaling.SCALE_DOWN
+    kill.assert_called_with(12345, signal.SIGTTOU)
+    assert scaler.workers == 2
+
+
+def test_gunicorn_hooks(slots):
+    worker = MagicMock(slot=1, pid=4321)
+    with patch.dict(os.environ, {autoscaling.SLOTS_FILE_ENV: slots.path}):
+        del gunicorn_config._slots[:]
+        gunicorn_config.post_fork(MagicMock(), worker)
+        gunicorn_config.pre_request(worker, MagicMock())
+        gunicorn_config.pre_request(worker, MagicMock())
+        gunicorn_config.post_request(worker, MagicMock(), {}, MagicMock())
+        assert slots.read() == [(4321, 1, 1)]
+
+        gunicorn_config.child_exit(MagicMock(), worker)
+        assert slots.read() == []
+    del gunicorn_config._slots[:]
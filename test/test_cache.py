@@ -0,0 +1,137 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+import time
+
+import pytest
+from mock import patch
+
+from container_support.cache import ArtifactCache, cache_key, copy_tree
+
+
+@pytest.fixture()
+def cache(tmpdir):
+    return ArtifactCache(str(tmpdir.join('cache')), max_bytes=100)
+
+
+def _write(content):
+    def build(path):
+        with open(path, 'w') as f:
+            f.write(content)
+    return build
+
+
+def test_get_missing(cache):
+    assert cache.get('key') is None
+
+
+def test_publish_and_get(cache):
+    path = cache.publish('key', _write('abc'))
+
+    assert cache.get('key') == path
+    with open(path) as f:
+        assert f.read() == 'abc'
+    assert os.listdir(os.path.join(cache.root, 'tmp')) == []
+
+
+def test_publish_tree(cache):
+    def build(path):
+        os.makedirs(os.path.join(path, 'sub'))
+        with open(os.path.join(path, 'sub', 'file'), 'w') as f:
+            f.write('abc')
+
+    path = cache.publish('key', build)
+
+    assert os.path.isfile(os.path.join(path, 'sub', 'file'))
+
+
+def test_publish_failure_leaves_no_entry(cache):
+    def build(path):
+        _write('partial')(path)
+        raise IOError('connection reset')
+
+    with pytest.raises(IOError):
+        cache.publish('key', build)
+
+    assert cache.get('key') is None
+    assert os.listdir(os.path.join(cache.root, 'tmp')) == []
+
+
+def test_publish_already_published(cache):
+    first = cache.publish('key', _write('abc'))
+    second = cache.publish('key', _write('abc'))
+
+    assert first == second
+    assert os.listdir(os.path.join(cache.root, 'tmp')) == []
+
+
+def test_evicts_least_recently_used(cache):
+    cache.publish('a', _write('x' * 40))
+    cache.publish('b', _write('x' * 40))
+
+    # make 'a' the most recently used entry
+    past = time.time() - 60
+    os.utime(os.path.join(cache._entry_dir('b')), (past, past))
+    cache.get('a')
+
+    cache.publish('c', _write('x' * 40))
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+
+def test_never_evicts_the_new_entry(cache):
+    cache.publish('big', _write('x' * 200))
+    assert cache.get('big') is not None
+
+
+def test_versions(cache):
+    assert cache.last_version('s3://bucket/key') is None
+    cache.record_version('s3://bucket/key', '"etag"')
+    assert cache.last_version('s3://bucket/key') == '"etag"'
+
+
+def test_from_env_disabled():
+    with patch.dict('os.environ', {}, clear=True):
+        assert ArtifactCache.from_env() is None
+
+
+def test_from_env(tmpdir):
+    with patch.dict('os.environ', {'SAGEMAKER_ARTIFACT_CACHE_DIR': str(tmpdir),
+                                   'SAGEMAKER_ARTIFACT_CACHE_MAX_BYTES': '1000',
+                                   'SAGEMAKER_ARTIFACT_CACHE_REVALIDATE': 'false'}):
+        cache = ArtifactCache.from_env()
+
+    assert cache.root == str(tmpdir)
+    assert cache.max_bytes == 1000
+    assert not cache.revalidate
+
+
+def test_cache_key():
+    assert cache_key('s3://b/k', '"1"', 'file') != cache_key('s3://b/k', '"2"', 'file')
+    assert cache_key('s3://b/k', '"1"', 'file') != cache_key('s3://b/k', '"1"', 'tree')
+
+
+def test_copy_tree_merges(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.mkdir('sub').join('a').write('a')
+    target = tmpdir.mkdir('target')
+    target.join('existing').write('b')
+
+    copy_tree(str(source), str(target))
+
+    assert target.join('sub', 'a').read() == 'a'
+    assert target.join('existing').read() == 'b'
@@ -0,0 +1,197 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+import struct
+
+import pytest
+from mock import patch
+
+from container_support.channels import ChannelIndex, MappedDataset, MappedFile, assign_shards
+
+
+@pytest.fixture()
+def channel(tmpdir):
+    root = tmpdir.mkdir('train')
+    root.join('a.csv').write_binary(b'1\n' * 50)
+    root.mkdir('part').join('b.csv').write_binary(b'22\n' * 10)
+    root.join('c.csv').write_binary(b'333\n' * 5)
+    root.join('empty.csv').write_binary(b'')
+    return str(root)
+
+
+def test_build(channel):
+    index = ChannelIndex.build(channel)
+
+    assert index.files == [('a.csv', 100), ('c.csv', 20), ('empty.csv', 0), (os.path.join('part', 'b.csv'), 30)]
+    assert index.total_bytes == 150
+    assert index.record_offsets is None
+
+
+def test_build_record_offsets(channel):
+    index = ChannelIndex.build(channel, record_offsets=True)
+
+    assert index.record_offsets['c.csv'] == [0, 4, 8, 12, 16]
+    assert index.record_offsets['empty.csv'] == []
+
+
+def test_load_uses_cache(channel, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    first = ChannelIndex.load(channel, record_offsets=True, cache_dir=cache_dir)
+    with patch('container_support.channels._newline_record_offsets') as scan:
+        second = ChannelIndex.load(channel, record_offsets=True, cache_dir=cache_dir)
+
+    scan.assert_not_called()
+    assert second.files == first.files
+    assert second.record_offsets == first.record_offsets
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_load_rebuilds_changed_channel(channel, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    ChannelIndex.load(channel, record_offsets=True, cache_dir=cache_dir)
+
+    os.remove(os.path.join(channel, 'a.csv'))
+    with open(os.path.join(channel, 'c.csv'), 'wb') as f:
+        f.write(b'4444\n' * 2)
+    index = ChannelIndex.load(channel, record_offsets=True, cache_dir=cache_dir)
+
+    assert index.files == ChannelIndex.build(channel).files
+    assert index.record_offsets['c.csv'] == [0, 5]
+
+
+def test_assign_shards_balances_weight():
+    items = [('a', 10), ('b', 9), ('c', 6), ('d', 5), ('e', 4), ('f', 3)]
+    shards = assign_shards(items, 3)
+
+    assert sorted(sum(dict(items)[i] for i in shard) for shard in shards) == [11, 13, 13]
+
+
+def test_assign_shards_is_deterministic():
+    items = [('x%d' % i, i % 7) for i in range(100)]
+    assert assign_shards(items, 4) == assign_shards(list(reversed(items)), 4)
+
+
+def test_shard_covers_every_file_once(channel):
+    index = ChannelIndex.build(channel)
+    shards = [index.shard(3, i) for i in range(3)]
+
+    paths = sorted(path for shard in shards for path, _, _ in shard)
+    assert paths == sorted(os.path.join(channel, name) for name, _ in index.files)
+    assert shards[0] == [(os.path.join(channel, 'a.csv'), 0, 100)]
+
+
+def test_shard_splits_files_at_record_boundaries(channel):
+    index = ChannelIndex.build(channel, record_offsets=True)
+    shards = [index.shard(3, i) for i in range(3)]
+
+    sizes = [sum(end - start for _, start, end in shard) for shard in shards]
+    assert sum(sizes) == 150
+    assert max(sizes) - min(sizes) <= 4
+    for shard in shards:
+        for path, start, end in shard:
+            if path.endswith('a.csv'):
+                assert start % 2 == 0 and end % 2 == 0
+
+
+def test_shard_split_requires_offsets(channel):
+    with pytest.raises(ValueError):
+        ChannelIndex.build(channel).shard(2, 0, split_files=True)
+
+
+def test_shard_index_out_of_range(channel):
+    with pytest.raises(ValueError):
+        ChannelIndex.build(channel).shard(2, 2)
+
+
+@pytest.fixture()
+def records_file(tmpdir):
+    path = tmpdir.join('records.bin')
+    path.write_binary(b'HDR!' + b''.join(struct.pack('<ff', i, -i) for i in range(10)))
+    return str(path)
+
+
+def test_mapped_file_records(records_file):
+    with MappedFile(records_file, record_size=8, header_size=4) as f:
+        assert len(f) == 10
+        assert struct.unpack('<ff', f[3]) == (3.0, -3.0)
+        assert struct.unpack('<ff', f[-1]) == (9.0, -9.0)
+        assert [struct.unpack('<ff', r)[0] for r in f.records(order=[2, 0])] == [2.0, 0.0]
+        with pytest.raises(IndexError):
+            f.record(10)
+
+
+def test_mapped_file_records_are_views(records_file):
+    f = MappedFile(records_file, record_size=8, header_size=4, random_access=True)
+    record = f[0]
+    assert isinstance(record, memoryview)
+    assert record.readonly
+    del record
+    f.close()
+
+
+def test_mapped_file_array(records_file):
+    np = pytest.importorskip('numpy')
+    f = MappedFile(records_file, header_size=4)
+
+    array = f.array(np.float32, shape=(2,))
+
+    assert array.shape == (10, 2)
+    assert array[5].tolist() == [5.0, -5.0]
+    assert not array.flags.writeable
+    assert not array.flags.owndata
+    del array
+    f.close()
+
+
+def test_mapped_file_close_with_live_array(records_file):
+    np = pytest.importorskip('numpy')
+    f = MappedFile(records_file, header_size=4)
+    array = f.array(np.float32)
+
+    f.close()
+
+    assert array[2] == 1.0
+
+
+def test_mapped_file_empty(tmpdir):
+    path = tmpdir.join('empty.bin')
+    path.write_binary(b'')
+
+    with MappedFile(str(path), record_size=4) as f:
+        assert len(f) == 0
+        assert f.data.tobytes() == b''
+
+
+def test_mapped_file_without_record_size(records_file):
+    with MappedFile(records_file) as f:
+        with pytest.raises(TypeError):
+            len(f)
+
+
+def test_mapped_dataset(tmpdir):
+    paths = []
+    for i, count in enumerate([3, 0, 2]):
+        path = tmpdir.join('part%d' % i)
+        path.write_binary(b''.join(struct.pack('<I', 10 * i + j) for j in range(count)))
+        paths.append(str(path))
+
+    with MappedDataset(paths, record_size=4) as dataset:
+        values = [struct.unpack('<I', r)[0] for r in dataset.records()]
+        shuffled = [struct.unpack('<I', r)[0] for r in dataset.records(shuffle=True, seed=1)]
+
+        assert len(dataset) == 5
+        assert values == [0, 1, 2, 20, 21]
+        assert sorted(shuffled) == values
+        assert struct.unpack('<I', dataset[3])[0] == 20
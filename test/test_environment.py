@@ -16,12 +16,15 @@ import logging
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
 
 import pytest
-from mock import patch
+from mock import patch, MagicMock
 
 from container_support import ContainerEnvironment, TrainingEnvironment, HostingEnvironment
+from container_support import telemetry
+from container_support.channels import ChannelIndex
 
 
 INPUT_DATA_CONFIG = {
@@ -76,8 +79,8 @@ def training():
 
 
 def test_available_cpus(hosting):
-    with patch('multiprocessing.cpu_count') as patched:
-        patched.return_value = 16
+    with patch('container_support.affinity.available_cpus') as patched:
+        patched.return_value = list(range(16))
         env = ContainerEnvironment(hosting)
         assert env.available_cpus == 16
 
@@ -115,8 +118,8 @@ def test_available_gpus_nvidia(hosting):
 
 def test_model_server_workers_unset(hosting):
     with patch.dict('os.environ', {'SAGEMAKER_CONTAINER_LOG_LEVEL': '20', 'SAGEMAKER_REGION': 'us-west-2'}):
-        with patch('multiprocessing.cpu_count') as mp:
-            mp.return_value = 13
+        with patch('container_support.affinity.available_cpus') as mp:
+            mp.return_value = list(range(13))
             env = HostingEnvironment(hosting)
             assert env.model_server_workers is 13
 
@@ -129,6 +132,38 @@ def test_model_server_workers(hosting):
         assert env.model_server_workers == 2
 
 
+def test_model_server_worker_threads_unset(hosting):
+    with patch.dict('os.environ', {'SAGEMAKER_MODEL_SERVER_WORKERS': '4',
+                                   'SAGEMAKER_CONTAINER_LOG_LEVEL': '20',
+                                   'SAGEMAKER_REGION': 'us-west-2'}):
+        with patch('container_support.affinity.available_cpus') as mp:
+            mp.return_value = list(range(16))
+            env = HostingEnvironment(hosting)
+            assert env.model_server_worker_threads == 4
+            assert not env.model_server_cpu_affinity
+
+
+def test_model_server_worker_threads_autoscaling(hosting):
+    with patch.dict('os.environ', {'SAGEMAKER_MODEL_SERVER_WORKERS': '2',
+                                   'SAGEMAKER_MODEL_SERVER_MAX_WORKERS': '8',
+                                   'SAGEMAKER_CONTAINER_LOG_LEVEL': '20',
+                                   'SAGEMAKER_REGION': 'us-west-2'}):
+        with patch('container_support.affinity.available_cpus', return_value=list(range(16))):
+            env = HostingEnvironment(hosting)
+            # the workers added by the autoscaler do not oversubscribe the cpus
+            assert env.model_server_worker_threads == 2
+
+
+def test_model_server_worker_threads(hosting):
+    with patch.dict('os.environ', {'SAGEMAKER_MODEL_SERVER_WORKER_THREADS': '3',
+                                   'SAGEMAKER_MODEL_SERVER_CPU_AFFINITY': 'true',
+                                   'SAGEMAKER_CONTAINER_LOG_LEVEL': '20',
+                                   'SAGEMAKER_REGION': 'us-west-2'}):
+        env = HostingEnvironment(hosting)
+        assert env.model_server_worker_threads == 3
+        assert env.model_server_cpu_affinity
+
+
 def test_user_requirements_file(hosting):
     with patch.dict('os.environ', {'SAGEMAKER_CONTAINER_LOG_LEVEL': '20', 'SAGEMAKER_REGION': 'us-west-2'}):
         env = HostingEnvironment(hosting)
@@ -184,6 +219,165 @@ def test_get_channel_dir_no_s3_uri_in_hp(training):
         assert env._get_channel_dir("validation") == os.path.join(training, "input", "data", "validation")
 
 
+def test_is_pipe_mode(training):
+    config = dict(INPUT_DATA_CONFIG, train={"TrainingInputMode": "Pipe"})
+    _write_config_file(training, 'inputdataconfig.json', config)
+    env = TrainingEnvironment(training)
+    assert env.is_pipe_mode('train')
+    assert not env.is_pipe_mode('evaluation')
+
+
+def test_channel_records(training):
+    env = TrainingEnvironment(training)
+    with open(env.channel_pipe('train', 1), 'wb') as f:
+        f.write(b'a,1\nb,2\n')
+
+    assert env.channel_pipe('train', 1) == os.path.join(training, 'input', 'data', 'train_1')
+    assert [r.tobytes() for r in env.channel_records('train', epoch=1)] == [b'a,1', b'b,2']
+    assert telemetry.channel('train').records >= 2
+
+
+def test_open_channel_file(training):
+    _write_config_file(training, 'inputdataconfig.json', {'training': {}})
+    env = TrainingEnvironment(training)
+    stats = telemetry.channel('training')
+    records = stats.records
+
+    with env.open_channel_file('training', 'data.csv') as f:
+        assert f.read() == b'dummy data file'
+    with env.open_channel_file('training', 'data.csv') as f:
+        assert list(f) == [b'dummy data file']
+    assert stats.records == records + 1
+
+
+def test_channel_shard(training):
+    with open(os.path.join(training, 'input/data/training/big.csv'), 'w') as f:
+        f.write('x' * 1000)
+    _write_config_file(training, 'inputdataconfig.json', {'training': {}})
+    _write_resource_config(training, 'algo-2', ['algo-1', 'algo-2'])
+    env = TrainingEnvironment(training)
+
+    with patch('container_support.channels.ChannelIndex.load', side_effect=ChannelIndex.build) as load:
+        first = env.channel_shard('training', num_local_workers=2, local_rank=0)
+        second = env.channel_shard('training', num_local_workers=2, local_rank=1)
+
+    assert load.call_count == 1
+    assert first == []
+    assert second == []
+    host_1 = TrainingEnvironment(training)
+    host_1.current_host = 'algo-1'
+    with patch('container_support.channels.ChannelIndex.load', side_effect=ChannelIndex.build):
+        assert host_1.channel_shard('training', num_local_workers=2, local_rank=0) == \
+            [(os.path.join(env.channel_dirs['training'], 'big.csv'), 0, 1000)]
+        assert host_1.channel_shard('training', num_local_workers=2, local_rank=1) == \
+            [(os.path.join(env.channel_dirs['training'], 'data.csv'), 0, 15)]
+
+
+def test_channel_shard_local_processes(training):
+    _write_config_file(training, 'inputdataconfig.json', {'training': {}})
+    with patch.dict('os.environ', {'SAGEMAKER_LOCAL_RANK': '1', 'SAGEMAKER_NUM_LOCAL_PROCESSES': '2'}):
+        env = TrainingEnvironment(training)
+
+    assert env.local_rank == 1
+    assert env.num_local_processes == 2
+    assert env.num_processes == 1
+    with patch.object(env, 'channel_index') as channel_index:
+        env.channel_shard('training')
+    channel_index.return_value.shard.assert_called_once_with(2, 1)
+
+
+def test_channel_dataset(training):
+    _write_config_file(training, 'inputdataconfig.json', {'training': {}})
+    env = TrainingEnvironment(training)
+    stats = telemetry.channel('training')
+    records, size = stats.records, stats.bytes
+
+    with patch('container_support.channels.ChannelIndex.load', side_effect=ChannelIndex.build):
+        with env.channel_dataset('training', record_size=5) as dataset:
+            assert len(dataset) == 3
+            assert [r.tobytes() for r in dataset.records()] == [b'dummy', b' data', b' file']
+            assert dataset[-1].tobytes() == b' file'
+    assert stats.records == records + 4
+    assert stats.bytes == size + 20
+
+
+def test_channel_csv(training):
+    np = pytest.importorskip('numpy')
+    with open(os.path.join(training, 'input/data/training/data.csv'), 'w') as f:
+        f.write('1,2\n3,4\n')
+    _write_config_file(training, 'inputdataconfig.json', {'training': {}})
+    env = TrainingEnvironment(training)
+    stats = telemetry.channel('training')
+    records, size = stats.records, stats.bytes
+
+    with patch('container_support.channels.ChannelIndex.load', side_effect=ChannelIndex.build):
+        np.testing.assert_array_equal(env.channel_csv('training', cache=False), [[1, 2], [3, 4]])
+    assert stats.records == records + 2
+    assert stats.bytes == size + len('1,2\n3,4\n')
+
+
+def test_rendezvous(training):
+    env = TrainingEnvironment(training)
+    with patch('container_support.rendezvous.Rendezvous.join') as join, \
+            patch.dict('os.environ', {'SAGEMAKER_RENDEZVOUS_PORT': '8000'}):
+        joined = env.rendezvous({'port': 1})
+
+    join.assert_called_once_with({'port': 1})
+    assert joined.hosts == sorted(env.hosts)
+    assert joined.current_host == env.current_host
+    assert joined.port == 8000
+
+
+def test_artifact_writer(training):
+    env = TrainingEnvironment(training)
+    with env.artifact_writer() as writer:
+        writer.write('model.bin', b'weights')
+    with open(os.path.join(env.model_dir, 'model.bin'), 'rb') as f:
+        assert f.read() == b'weights'
+
+
+def test_stage_channels(training, tmpdir):
+    _write_config_file(training, 'inputdataconfig.json', {'training': {}, 'evaluation': {}})
+    _write_config_file(training, 'hyperparameters.json', _serialize_hyperparameters({
+        'sagemaker_region': 'us-west-2', 'sagemaker_stage_channels': 'training'}))
+    env = TrainingEnvironment(training)
+    scratch = str(tmpdir.join('scratch'))
+
+    with patch.dict('os.environ'):
+        report, = env.stage_channels(target_dir=scratch)
+
+        assert report.channel == 'training'
+        assert env.channel_dirs['training'] == os.path.join(scratch, 'training')
+        assert os.environ['SAGEMAKER_STAGED_CHANNEL_TRAINING'] == env.channel_dirs['training']
+        # processes started afterwards read the staged copy
+        assert TrainingEnvironment(training).channel_dirs['training'] == env.channel_dirs['training']
+        assert env.channel_dirs['evaluation'] == os.path.join(training, 'input', 'data', 'evaluation')
+
+
+@patch('subprocess.Popen')
+@patch('container_support.metrics.MetricsAgent.from_env')
+def test_start_metrics_if_enabled(from_env, popen, training):
+    env = TrainingEnvironment(training)
+    popen.reset_mock()
+    env.start_metrics_if_enabled()
+    assert env.metrics_agent is None
+    assert not popen.called
+
+    env.enable_cloudwatch_metrics = True
+    with patch.dict(os.environ, clear=False):
+        os.environ.pop('SAGEMAKER_METRICS_FORMAT', None)
+        env.start_metrics_if_enabled()
+    assert popen.call_args[0][0][:2] == ['telegraf', '--config']
+    assert popen.call_args[0][0][2].endswith('telegraf.conf')
+    assert env.metrics_agent is None
+
+    with patch.dict(os.environ, {'SAGEMAKER_METRICS_FORMAT': 'emf'}):
+        env.start_metrics_if_enabled()
+    from_env.return_value.start.assert_called_once_with()
+    assert env.metrics_agent == from_env.return_value.start.return_value
+    assert popen.call_count == 1
+
+
 def test_channels(training):
     env = TrainingEnvironment(training)
     assert env.channels == INPUT_DATA_CONFIG
@@ -233,18 +427,66 @@ def test_user_requirements_file_training(training):
     assert env.user_requirements_file == 'requirements.txt'
 
 
-@patch('tempfile.gettempdir')
-@patch('container_support.download_s3_resource')
-@patch('container_support.untar_directory')
-def test_download_user_module(untar, download_s3, gettemp, training):
+@patch('container_support.download_and_extract')
+def test_download_user_module(download_and_extract, training):
     env = TrainingEnvironment(training)
-    gettemp.return_value = 'tmp'
     env.user_script_archive = 'test.gz'
 
     env.download_user_module()
 
-    download_s3.assert_called_with('test.gz', 'tmp/script.tar.gz')
-    untar.assert_called_with('tmp/script.tar.gz', os.path.join(training, 'code'))
+    download_and_extract.assert_called_with('test.gz', os.path.join(training, 'code'))
+
+
+@patch('container_support.compile_directory')
+def test_precompile_user_module_missing_code_dir(compile_directory, training):
+    env = TrainingEnvironment(training)
+    env.precompile_user_module()
+    compile_directory.assert_not_called()
+
+
+@patch('container_support.compile_directory', return_value=(1, 0.1))
+def test_precompile_user_module(compile_directory, training):
+    env = TrainingEnvironment(training)
+    os.makedirs(env.code_dir)
+
+    env.precompile_user_module()
+
+    compile_directory.assert_called_with(env.code_dir)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires sys.pycache_prefix")
+@patch('os.access', return_value=False)
+@patch('container_support.compile_directory', return_value=(1, 0.1))
+def test_precompile_user_module_read_only(compile_directory, access, training):
+    env = TrainingEnvironment(training)
+    os.makedirs(env.code_dir)
+
+    with patch.object(sys, 'pycache_prefix', None), patch.dict('os.environ'):
+        env.precompile_user_module()
+
+        assert sys.pycache_prefix == os.path.join(tempfile.gettempdir(), 'pycache')
+        assert os.environ['PYTHONPYCACHEPREFIX'] == sys.pycache_prefix
+    compile_directory.assert_called_with(env.code_dir)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires sys.pycache_prefix")
+@patch('os.access', return_value=False)
+@patch('container_support.download_and_extract')
+@patch('container_support.compile_directory', return_value=(1, 0.1))
+def test_precompile_mounted_read_only_user_module(compile_directory, download_and_extract, access, training):
+    from container_support.serving import Server
+
+    env = TrainingEnvironment(training)
+    os.makedirs(env.code_dir)
+    with open(os.path.join(env.code_dir, env.user_script_name), 'w') as f:
+        f.write('print(1)')
+
+    with patch.object(sys, 'pycache_prefix', None), patch.dict('os.environ'):
+        Server._download_user_module_internal(env)
+
+        assert os.environ['PYTHONPYCACHEPREFIX'] == sys.pycache_prefix
+    download_and_extract.assert_not_called()
+    compile_directory.assert_called_with(env.code_dir)
 
 
 @patch('importlib.import_module')
@@ -272,6 +514,71 @@ def test_import_user_module_without_py(import_module, training):
     import_module.assert_called_with('nopy')
 
 
+@pytest.fixture()
+def framework_cache():
+    ContainerEnvironment._framework = None
+    yield
+    ContainerEnvironment._framework = None
+
+
+@patch('importlib.import_module')
+@patch('pkg_resources.iter_entry_points')
+def test_load_framework_from_env(iter_entry_points, import_module, framework_cache):
+    with patch.dict('os.environ', {'SAGEMAKER_FRAMEWORK_MODULE': 'my_framework'}):
+        assert ContainerEnvironment.load_framework() == import_module.return_value
+
+    import_module.assert_called_once_with('my_framework')
+    iter_entry_points.assert_not_called()
+
+
+@patch('importlib.import_module')
+@patch('pkg_resources.iter_entry_points')
+def test_load_framework_from_entry_point(iter_entry_points, import_module, framework_cache):
+    entry_point = MagicMock(module_name='tf_container')
+    iter_entry_points.return_value = [entry_point]
+
+    ContainerEnvironment.load_framework()
+
+    iter_entry_points.assert_called_with('sagemaker_container_support.frameworks')
+    import_module.assert_called_once_with('tf_container')
+
+
+@patch('pkg_resources.iter_entry_points')
+def test_load_framework_multiple_entry_points(iter_entry_points, framework_cache):
+    iter_entry_points.return_value = [MagicMock(), MagicMock()]
+
+    with pytest.raises(ValueError):
+        ContainerEnvironment.load_framework()
+
+
+@patch('importlib.import_module')
+@patch('container_support.environment.find_spec')
+@patch('pkg_resources.iter_entry_points', return_value=[])
+def test_load_framework_legacy_modules(iter_entry_points, find_spec, import_module, framework_cache):
+    find_spec.side_effect = lambda name: object() if name == 'tf_container' else None
+
+    ContainerEnvironment.load_framework()
+
+    import_module.assert_called_once_with('tf_container')
+
+
+@patch('container_support.environment.find_spec', return_value=None)
+@patch('pkg_resources.iter_entry_points', return_value=[])
+def test_load_framework_not_found(iter_entry_points, find_spec, framework_cache):
+    with pytest.raises(ImportError):
+        ContainerEnvironment.load_framework()
+
+
+@patch('importlib.import_module')
+def test_load_framework_resolves_once(import_module, framework_cache):
+    with patch.dict('os.environ', {'SAGEMAKER_FRAMEWORK_MODULE': 'my_framework'}):
+        first = ContainerEnvironment.load_framework()
+        second = ContainerEnvironment.load_framework()
+
+    assert first is second
+    assert import_module.call_count == 1
+
+
 def _write_config_file(training, filename, data):
     path = os.path.join(training, "input/config/%s" % filename)
     with open(path, 'w') as f:
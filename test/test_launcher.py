@@ -0,0 +1,144 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import json
+import logging
+import os
+import signal
+import time
+
+import pytest
+from mock import MagicMock, patch
+from six.moves import queue
+
+from container_support import launcher, logs
+from container_support.launcher import WorkerError
+
+LAUNCHER_ENV_VARS = ['SAGEMAKER_LOCAL_RANK', 'SAGEMAKER_NUM_LOCAL_PROCESSES', 'SAGEMAKER_RANK', 'SAGEMAKER_WORLD_SIZE',
+                     'SAGEMAKER_PROCESS_CPUS', 'OMP_NUM_THREADS']
+
+
+@pytest.fixture()
+def env():
+    return MagicMock(hosts=['algo-1', 'algo-2'], current_host='algo-2')
+
+
+def test_num_processes():
+    assert launcher.num_processes(1) == 1
+    assert launcher.num_processes('4') == 4
+    assert launcher.num_processes('numa', nodes=[[0, 1], [2, 3]]) == 2
+    assert launcher.num_processes('NUMA', nodes=[[0]]) == 1
+    with pytest.raises(ValueError):
+        launcher.num_processes(0)
+
+
+def test_launch(env, tmpdir):
+    def target():
+        with open(str(tmpdir.join(os.environ['SAGEMAKER_LOCAL_RANK'])), 'w') as f:
+            json.dump({name: os.environ[name] for name in LAUNCHER_ENV_VARS}, f)
+
+    with patch('container_support.affinity.partition_cpus', return_value=[[0], [0]]):
+        launcher.launch(env, 2, target)
+
+    for rank in range(2):
+        with open(str(tmpdir.join(str(rank)))) as f:
+            environ = json.load(f)
+        assert environ == {'SAGEMAKER_LOCAL_RANK': str(rank),
+                           'SAGEMAKER_NUM_LOCAL_PROCESSES': '2',
+                           'SAGEMAKER_RANK': str(2 + rank),
+                           'SAGEMAKER_WORLD_SIZE': '4',
+                           'SAGEMAKER_PROCESS_CPUS': '0',
+                           'OMP_NUM_THREADS': os.environ.get('OMP_NUM_THREADS', '1')}
+
+
+def _fail_or_hang():
+    if os.environ['SAGEMAKER_LOCAL_RANK'] == '1':
+        raise IOError(28, 'No space left on device')
+    time.sleep(60)
+
+
+def test_launch_failure_stops_other_processes(env):
+    start = time.time()
+    with patch('container_support.affinity.partition_cpus', return_value=[[0], [0]]):
+        with pytest.raises(WorkerError) as e:
+            launcher.launch(env, 2, _fail_or_hang)
+
+    assert e.value.errno == 28
+    assert 'training process 1' in str(e.value)
+    assert 'No space left on device' in str(e.value)
+    assert time.time() - start < 30
+
+
+def test_launch_killed_process(env):
+    def target():
+        os.kill(os.getpid(), signal.SIGKILL)
+
+    with patch('container_support.affinity.partition_cpus', return_value=[[0]]):
+        with pytest.raises(WorkerError) as e:
+            launcher.launch(env, 1, target)
+    assert e.value.errno == 128 + signal.SIGKILL
+
+
+def test_launch_writes_queued_logs_before_exit(env, tmpdir):
+    def target():
+        for i in range(1000):
+            logging.getLogger('test_launcher').info('record %d', i)
+
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    path = str(tmpdir.join('log'))
+    with open(path, 'w') as stream:
+        try:
+            logs.install(stream=stream, force=True).setFormatter(logging.Formatter('%(message)s'))
+            with patch('container_support.affinity.partition_cpus', return_value=[[0]]):
+                launcher.launch(env, 1, target)
+            logs.shutdown()
+        finally:
+            root.handlers[:] = saved[0]
+            root.setLevel(saved[1])
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert [line for line in lines if line.startswith('record')] == ['record {}'.format(i) for i in range(1000)]
+
+
+def _fail_with_large_message():
+    if os.environ['SAGEMAKER_LOCAL_RANK'] == '0':
+        raise ValueError('x' * (1 << 20))
+    time.sleep(60)
+
+
+def test_launch_failure_with_message_larger_than_pipe_buffer(env):
+    start = time.time()
+    with patch('container_support.affinity.partition_cpus', return_value=[[0], [0]]):
+        with pytest.raises(WorkerError) as e:
+            launcher.launch(env, 2, _fail_with_large_message)
+
+    assert 'training process 0' in str(e.value)
+    assert 'x' * (1 << 20) in str(e.value)
+    assert time.time() - start < 30
+
+
+def test_supervise_reports_message_of_failed_process():
+    processes = [MagicMock(exitcode=0), MagicMock(exitcode=3)]
+    for p in processes:
+        p.is_alive.return_value = False
+    errors = queue.Queue()
+    errors.put((1, 'failure of process 1'))
+    errors.put((0, 'failure of process 0'))
+
+    with pytest.raises(WorkerError) as e:
+        launcher._supervise(processes, errors)
+    assert str(e.value) == 'failure of process 1'
+    assert e.value.errno == 3
@@ -0,0 +1,227 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+import pytest
+from six import StringIO
+
+from container_support import logs
+
+
+class BlockingStream(object):
+    def __init__(self):
+        self.lines = []
+        self.unblocked = threading.Event()
+
+    def write(self, data):
+        self.unblocked.wait()
+        self.lines.extend(data.splitlines())
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def logger():
+    log = logging.getLogger('test_logs')
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    yield log
+    for h in list(log.handlers):
+        log.removeHandler(h)
+        h.close()
+
+
+def test_json_formatter(logger):
+    stream = StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logs.JsonFormatter())
+    logger.addHandler(handler)
+
+    logger.info('hello %s', 'world', extra={'request_id': 'abc', 'fields': {'status': 200}})
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.exception('failed')
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first['message'] == 'hello world'
+    assert first['level'] == 'INFO'
+    assert first['logger'] == 'test_logs'
+    assert first['request_id'] == 'abc'
+    assert first['status'] == 200
+    assert 'request_id' not in second
+    assert 'ValueError: boom' in second['exception']
+
+
+def test_queue_handler_writes_in_order(logger):
+    stream = StringIO()
+    handler = logs.QueueHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+    for i in range(100):
+        logger.info('%d', i)
+    handler.close()
+
+    assert stream.getvalue().splitlines() == [str(i) for i in range(100)]
+
+
+def test_queue_handler_drops_instead_of_blocking(logger):
+    stream = BlockingStream()
+    handler = logs.QueueHandler(stream, queue_size=5)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+    # the writer thread is stuck on the first batch, the logging thread is not
+    for i in range(50):
+        logger.info('%d', i)
+    assert handler.dropped >= 40
+
+    stream.unblocked.set()
+    handler.close()
+
+    assert len(stream.lines) == 50 - handler.dropped + 1
+    assert 'dropped {} log records'.format(handler.dropped) in stream.lines[-1]
+
+
+GEVENT_STALLED_STREAM = textwrap.dedent("""
+    from gevent import monkey
+    monkey.patch_all()
+
+    import gevent, logging, time
+    from container_support import logs
+
+    original_sleep = monkey.get_original('time', 'sleep')
+
+    class StalledStream(object):
+        def write(self, data):
+            original_sleep(2)
+
+        def flush(self):
+            pass
+
+    handler = logs.QueueHandler(StalledStream())
+    logger = logging.getLogger('stalled')
+    logger.addHandler(handler)
+
+    ticks = []
+    def tick():
+        for _ in range(20):
+            ticks.append(time.time())
+            gevent.sleep(0.05)
+
+    ticker = gevent.spawn(tick)
+    gevent.sleep(0.1)
+    logger.warning('stalls the stream')
+    ticker.join()
+    print(max(b - a for a, b in zip(ticks, ticks[1:])))
+""")
+
+
+def test_queue_handler_does_not_block_gevent_workers():
+    pytest.importorskip('gevent')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, '-c', GEVENT_STALLED_STREAM], env=env)
+    # the greenlets keep running while the writer thread is stuck in the stream
+    assert float(output.decode('utf-8').split()[-1]) < 0.5
+
+
+def test_install_json(logger):
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    stream = StringIO()
+    try:
+        root.handlers[:] = [logging.NullHandler()]
+        assert logs.install(stream=stream) is None
+
+        handler = logs.install(logging.DEBUG, logs.JSON, stream=stream, force=True)
+        assert root.handlers == [handler]
+        assert root.level == logging.DEBUG
+        logging.getLogger('test_install').debug('installed')
+        handler.close()
+    finally:
+        root.handlers[:] = saved[0]
+        root.setLevel(saved[1])
+
+    assert json.loads(stream.getvalue())['message'] == 'installed'
+
+
+def test_shutdown():
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    stream = StringIO()
+    try:
+        handler = logs.install(stream=stream, force=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logging.getLogger('test_shutdown').info('before')
+        logs.shutdown()
+        assert stream.getvalue() == 'before\n'
+        assert handler._pid is None
+
+        # the handler keeps working after a shutdown
+        logging.getLogger('test_shutdown').info('after')
+        handler.close()
+    finally:
+        root.handlers[:] = saved[0]
+        root.setLevel(saved[1])
+
+    assert stream.getvalue() == 'before\nafter\n'
+
+
+def test_install_unsupported_format():
+    with pytest.raises(ValueError):
+        logs.install(log_format='xml')
+
+
+def test_request_log_rate_limit(logger):
+    now = [0.0]
+    request_log = logs.RequestLog(logger, max_per_second=2, clock=lambda: now[0])
+
+    assert [request_log.should_log() for _ in range(4)] == [True, True, False, False]
+    now[0] += 0.5
+    assert [request_log.should_log() for _ in range(2)] == [True, False]
+    assert request_log.suppressed == 3
+
+
+def test_request_log_sampling(logger):
+    stream = StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logs.JsonFormatter())
+    logger.addHandler(handler)
+
+    assert not any(logs.RequestLog(logger, sample_rate=0.000001).log('id', 'never') for _ in range(100))
+    assert logs.RequestLog(logger).log('id-1', 'logged', status=200)
+
+    entry = json.loads(stream.getvalue())
+    assert entry['request_id'] == 'id-1'
+    assert entry['status'] == 200
+
+
+def test_request_log_from_env(monkeypatch, logger):
+    monkeypatch.delenv(logs.REQUEST_LOG_SAMPLE_RATE_ENV, raising=False)
+    assert logs.RequestLog.from_env(logger) is None
+
+    monkeypatch.setenv(logs.REQUEST_LOG_SAMPLE_RATE_ENV, '0.5')
+    monkeypatch.setenv(logs.REQUEST_LOG_MAX_PER_SECOND_ENV, '100')
+    request_log = logs.RequestLog.from_env(logger)
+    assert request_log.sample_rate == 0.5
+    assert request_log.max_per_second == 100
@@ -0,0 +1,173 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import itertools
+import json
+import socket
+
+import pytest
+from mock import patch
+
+from container_support import metrics
+from container_support.metrics import Metric, MetricsAgent
+
+STAT = 'cpu  {} 0 {} {} {} 0 0 0 0 0\ncpu0 1 2 3 4 5 6 7 8 9 10\n'
+MEMINFO = 'MemTotal:       1000 kB\nMemFree:         100 kB\nMemAvailable:    250 kB\n'
+DISKSTATS = '   7       0 loop0 1 0 100 0 0 0 0 0 0 0 0\n 259       0 nvme0n1 10 0 {} 0 20 0 {} 0 0 0 0\n'
+NET_DEV = ('Inter-|   Receive                                                |  Transmit\n'
+           ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets\n'
+           '    lo: 999 1 0 0 0 0 0 0 999 1 0 0 0 0 0 0\n'
+           '  eth0: {} 10 0 0 0 0 0 0 {} 10 0 0 0 0 0 0\n')
+
+
+@pytest.fixture()
+def proc(tmpdir):
+    tmpdir.mkdir('net')
+    _write_proc(tmpdir, user=100, system=100, idle=800, iowait=0, sectors_read=0, sectors_written=0, recv=0, sent=0)
+    tmpdir.join('mounts').write('/dev/root / ext4 rw 0 0\ntmpfs /dev/shm tmpfs rw 0 0\n')
+    return tmpdir
+
+
+def _write_proc(root, user, system, idle, iowait, sectors_read, sectors_written, recv, sent):
+    root.join('stat').write(STAT.format(user, system, idle, iowait))
+    root.join('meminfo').write(MEMINFO)
+    root.join('diskstats').write(DISKSTATS.format(sectors_read, sectors_written))
+    root.join('net', 'dev').write(NET_DEV.format(recv, sent))
+
+
+def test_cpu_collector(proc):
+    collector = metrics.CpuCollector(str(proc))
+    _write_proc(proc, user=250, system=100, idle=900, iowait=50, sectors_read=0, sectors_written=0, recv=0, sent=0)
+
+    assert collector.collect() == [Metric('cpu_utilization', 50.0, 'Percent', {}),
+                                   Metric('cpu_iowait', 16.67, 'Percent', {})]
+    # no time elapsed
+    assert collector.collect() == []
+
+
+def test_memory_collector(proc):
+    assert metrics.MemoryCollector(str(proc)).collect() == [Metric('mem_used', 750 * 1024, 'Bytes', {}),
+                                                            Metric('mem_used_percent', 75.0, 'Percent', {})]
+
+
+def test_disk_collector(proc):
+    disk, = metrics.DiskCollector(str(proc)).collect()
+    assert disk.name == 'disk_used_percent'
+    assert disk.dimensions == {'path': '/'}
+    assert 0 < disk.value <= 100
+
+
+def test_rate_collectors(proc):
+    with patch('container_support.metrics.time.time', return_value=100.0) as now:
+        diskio = metrics.DiskIOCollector(str(proc))
+        network = metrics.NetworkCollector(str(proc))
+        _write_proc(proc, user=100, system=100, idle=800, iowait=0, sectors_read=2048, sectors_written=4096,
+                    recv=1000, sent=500)
+        now.return_value = 102.0
+
+        assert diskio.collect() == [Metric('diskio_read_bytes', 512 * 1024, 'Bytes/Second', {'device': 'nvme0n1'}),
+                                    Metric('diskio_write_bytes', 1024 * 1024, 'Bytes/Second', {'device': 'nvme0n1'})]
+        assert network.collect() == [Metric('net_bytes_recv', 500, 'Bytes/Second', {'interface': 'eth0'}),
+                                     Metric('net_bytes_sent', 250, 'Bytes/Second', {'interface': 'eth0'})]
+
+
+def test_format_statsd():
+    lines = metrics.format_statsd([Metric('cpu_utilization', 12.5, 'Percent', {}),
+                                   Metric('disk_used_percent', 40, 'Percent', {'path': '/'})],
+                                  prefix='sagemaker', dimensions={'host': 'algo-1'})
+    assert lines == ['sagemaker.cpu_utilization:12.5|g|#host:algo-1',
+                     'sagemaker.disk_used_percent:40|g|#host:algo-1,path:/']
+
+
+def test_format_emf():
+    documents = metrics.format_emf([Metric('cpu_utilization', 12.5, 'Percent', {}),
+                                    Metric('mem_used', 10, 'Bytes', {}),
+                                    Metric('disk_used_percent', 40, 'Percent', {'path': '/'})],
+                                   namespace='Test', dimensions={'host': 'algo-1'}, timestamp=1.5)
+
+    first, second = [json.loads(d) for d in documents]
+    assert first == {'_aws': {'Timestamp': 1500,
+                              'CloudWatchMetrics': [{'Namespace': 'Test', 'Dimensions': [['host']],
+                                                     'Metrics': [{'Name': 'cpu_utilization', 'Unit': 'Percent'},
+                                                                 {'Name': 'mem_used', 'Unit': 'Bytes'}]}]},
+                     'host': 'algo-1', 'cpu_utilization': 12.5, 'mem_used': 10}
+    assert second['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['host', 'path']]
+    assert second['path'] == '/' and second['disk_used_percent'] == 40
+
+
+@pytest.fixture()
+def listener():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(('127.0.0.1', 0))
+    s.settimeout(5)
+    yield s
+    s.close()
+
+
+@pytest.mark.parametrize('metrics_format', ['emf', 'statsd'])
+def test_agent_udp(proc, listener, metrics_format):
+    agent = MetricsAgent('udp://127.0.0.1:{}'.format(listener.getsockname()[1]), metrics_format=metrics_format,
+                         dimensions={'host': 'algo-1'}, collectors=[metrics.MemoryCollector(str(proc))])
+    agent.tick()
+    data = listener.recv(65536).decode('utf-8')
+
+    if metrics_format == 'emf':
+        assert json.loads(data)['mem_used_percent'] == 75.0
+    else:
+        assert data.split('\n') == ['sagemaker.container.mem_used:768000|g|#host:algo-1',
+                                    'sagemaker.container.mem_used_percent:75.0|g|#host:algo-1']
+    agent.stop()
+
+
+def test_udp_sink_packs_datagrams(listener):
+    sink = metrics.UdpSink('127.0.0.1', listener.getsockname()[1], pack=True)
+    sink.send(['x' * 1000, 'y' * 400, 'z' * 100])
+    sink.close()
+
+    assert listener.recv(65536) == b'x' * 1000 + b'\n' + b'y' * 400
+    assert listener.recv(65536) == b'z' * 100
+
+
+def test_agent_file_and_overhead(proc, tmpdir):
+    path = tmpdir.join('metrics.jsonl')
+    agent = MetricsAgent('file://' + str(path), interval=60, collectors=metrics.default_collectors(60, str(proc)))
+    agent.tick()
+    collected = agent.tick()
+
+    assert 'agent_overhead' in [m.name for m in collected]
+    assert agent.last_overhead < agent.max_overhead
+    assert len(path.readlines()) > 2
+
+
+def test_agent_overhead_is_bounded(proc, tmpdir):
+    agent = MetricsAgent('file://' + str(tmpdir.join('metrics')), interval=10, max_overhead=0.01,
+                         collectors=[metrics.MemoryCollector(str(proc))])
+    with patch('container_support.metrics.time.time', side_effect=itertools.chain([100.0], itertools.repeat(100.5))):
+        agent.tick()
+    assert agent.interval == 20
+
+
+def test_agent_from_env():
+    with patch.dict('os.environ', {'SAGEMAKER_METRICS_FORMAT': 'StatsD', 'SAGEMAKER_METRICS_INTERVAL': '5',
+                                   'CURRENT_HOST': 'algo-1', 'JOB_NAME': 'job'}):
+        agent = MetricsAgent.from_env()
+    assert agent.metrics_format == 'statsd'
+    assert agent.interval == 5
+    assert agent.dimensions == {'host': 'algo-1', 'job': 'job'}
+    assert agent.sink.address == ('127.0.0.1', 8125)
+
+
+def test_invalid_destination():
+    with pytest.raises(ValueError):
+        MetricsAgent('tcp://localhost:1')
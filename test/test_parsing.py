@@ -0,0 +1,115 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+
+import pytest
+
+from container_support import parsing
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture()
+def csv_files(tmpdir):
+    first = tmpdir.join('a.csv')
+    first.write('\n'.join('{},{},{}'.format(i, i * 2, i * 0.5) for i in range(100)) + '\n')
+    second = tmpdir.join('b.csv')
+    second.write('100,200,50\r\n\r\n101,202,50.5')
+    return [str(first), str(second)]
+
+
+def test_chunk_ranges(tmpdir):
+    path = tmpdir.join('data')
+    path.write_binary(b'aaaa\nbb\ncccccc\nd')
+
+    assert parsing.chunk_ranges(str(path), chunk_size=3) == [(0, 5), (5, 8), (8, 15), (15, 16)]
+    assert parsing.chunk_ranges(str(path), chunk_size=100) == [(0, 16)]
+    assert parsing.chunk_ranges(str(path), chunk_size=3, skip_header=True) == [(5, 8), (8, 15), (15, 16)]
+
+
+def test_chunk_ranges_empty_file(tmpdir):
+    path = tmpdir.join('empty')
+    path.write_binary(b'')
+    assert parsing.chunk_ranges(str(path)) == []
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_load_csv(csv_files, workers):
+    data = parsing.load_csv(csv_files, workers=workers, chunk_size=64)
+
+    expected = np.array([[i, i * 2, i * 0.5] for i in range(102)], dtype='float32')
+    assert data.dtype == np.float32
+    np.testing.assert_array_equal(data, expected)
+
+
+def test_load_csv_header_and_delimiter(tmpdir):
+    path = tmpdir.join('data.tsv')
+    path.write('a\tb\n1\t2\n3\t4\n')
+
+    data = parsing.load_csv([str(path)], delimiter='\t', dtype='float64', skip_header=True)
+    np.testing.assert_array_equal(data, [[1, 2], [3, 4]])
+    assert data.dtype == np.float64
+
+
+def test_load_csv_invalid(tmpdir):
+    path = tmpdir.join('data.csv')
+    path.write('1,2\n3,x\n')
+
+    with pytest.raises(ValueError):
+        parsing.load_csv([str(path)], workers=1)
+
+
+def test_load_csv_cache(csv_files, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    data = parsing.load_csv(csv_files, workers=1, cache_dir=cache_dir)
+
+    cached = parsing.load_csv(csv_files, workers=1, cache_dir=cache_dir)
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, data)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # different options and modified inputs are different entries
+    parsing.load_csv(csv_files, dtype='float64', workers=1, cache_dir=cache_dir)
+    with open(csv_files[1], 'a') as f:
+        f.write('\n1,2,3\n')
+    assert len(parsing.load_csv(csv_files, workers=1, cache_dir=cache_dir)) == 103
+    assert len(os.listdir(cache_dir)) == 3
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_load_libsvm(tmpdir, workers):
+    path = tmpdir.join('data.libsvm')
+    path.write('1 1:0.5 3:2\n0\n# comment\n-1 2:1.5 # trailing comment\n' * 10)
+
+    labels, indptr, indices, values = parsing.load_libsvm([str(path)], zero_based=False, workers=workers,
+                                                          chunk_size=16)
+
+    np.testing.assert_array_equal(labels, [1, 0, -1] * 10)
+    np.testing.assert_array_equal(indptr, [0] + [x + 3 * i for i in range(10) for x in (2, 2, 3)])
+    np.testing.assert_array_equal(indices, [0, 2, 1] * 10)
+    np.testing.assert_array_equal(values, [0.5, 2, 1.5] * 10)
+
+
+def test_load_libsvm_cache(tmpdir):
+    path = tmpdir.join('data.libsvm')
+    path.write('1 0:1 4:2\n0 2:3\n')
+    cache_dir = str(tmpdir.join('cache'))
+
+    result = parsing.load_libsvm([str(path)], workers=1, cache_dir=cache_dir)
+    cached = parsing.load_libsvm([str(path)], workers=1, cache_dir=cache_dir)
+
+    for array, expected in zip(cached, result):
+        assert isinstance(array, np.memmap)
+        np.testing.assert_array_equal(array, expected)
@@ -0,0 +1,134 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+from container_support import pipe
+
+
+def _recordio(payloads, cflags=None):
+    out = b''
+    for i, payload in enumerate(payloads):
+        cflag = cflags[i] if cflags else 0
+        out += struct.pack('<II', 0xced7230a, (cflag << 29) | len(payload))
+        out += payload + b'\0' * (-len(payload) % 4)
+    return out
+
+
+def _tfrecord(payloads):
+    return b''.join(struct.pack('<QI', len(p), 0) + p + b'\0' * 4 for p in payloads)
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 1000])
+def test_split_lines(size):
+    data = b'first\nsecond record\n\nlast'
+    records = [r.tobytes() for r in pipe.split_lines(_chunks(data, size))]
+    assert records == [b'first', b'second record', b'', b'last']
+
+
+def test_split_lines_are_views():
+    records = list(pipe.split_lines([b'a\nb\n']))
+    assert all(isinstance(r, memoryview) for r in records)
+
+
+@pytest.mark.parametrize('size', [1, 5, 13, 1000])
+def test_split_recordio(size):
+    payloads = [b'abc', b'', b'defgh', b'x' * 100]
+    records = [r.tobytes() for r in pipe.split_recordio(_chunks(_recordio(payloads), size))]
+    assert records == payloads
+
+
+def test_split_recordio_multipart():
+    data = _recordio([b'one', b'ab', b'cd', b'ef', b'two'], cflags=[0, 1, 2, 3, 0])
+    records = [r.tobytes() for r in pipe.split_recordio([data])]
+    assert records == [b'one', b'abcdef', b'two']
+
+
+def test_split_recordio_invalid_magic():
+    with pytest.raises(ValueError):
+        list(pipe.split_recordio([b'\0' * 16]))
+
+
+@pytest.mark.parametrize('size', [1, 11, 1000])
+def test_split_tfrecord(size):
+    payloads = [b'example one', b'', b'y' * 50]
+    records = [r.tobytes() for r in pipe.split_tfrecord(_chunks(_tfrecord(payloads), size))]
+    assert records == payloads
+
+
+def test_split_tfrecord_truncated():
+    with pytest.raises(ValueError):
+        list(pipe.split_tfrecord([_tfrecord([b'abc'])[:-2]]))
+
+
+def test_read_records_unsupported_format(tmpdir):
+    with pytest.raises(ValueError):
+        pipe.read_records(str(tmpdir.join('x')), 'parquet')
+
+
+def test_read_records_missing_file(tmpdir):
+    with pytest.raises(IOError):
+        list(pipe.read_records(str(tmpdir.join('missing'))))
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="requires named pipes")
+def test_read_records_named_pipe(tmpdir):
+    path = str(tmpdir.join('train_0'))
+    os.mkfifo(path)
+    lines = [('record %d' % i).encode() for i in range(10000)]
+
+    def write():
+        with open(path, 'wb') as f:
+            for line in lines:
+                f.write(line + b'\n')
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    records = [r.tobytes() for r in pipe.read_records(path, buffer_size=4096, prefetch=2)]
+    writer.join()
+
+    assert records == lines
+
+
+def test_read_records_stop_early(tmpdir):
+    path = tmpdir.join('train_0')
+    path.write_binary(b'a\n' * 100000)
+
+    records = pipe.read_records(str(path), buffer_size=16, prefetch=1)
+    assert next(records).tobytes() == b'a'
+    records.close()
+
+
+@pytest.mark.parametrize('split, encode', [(pipe.split_lines, lambda records: b'\n'.join(records)),
+                                           (pipe.split_recordio, _recordio),
+                                           (pipe.split_tfrecord, _tfrecord)])
+def test_split_record_much_larger_than_buffer(split, encode):
+    # copying the partial record on every read would move ~32GB here
+    large = os.urandom(8 * 1024 * 1024).replace(b'\n', b' ')
+    payloads = [b'before', large, b'after']
+
+    start = time.time()
+    records = [r.tobytes() for r in split(_chunks(encode(payloads), 1024))]
+
+    assert records == payloads
+    assert time.time() - start < 2
@@ -0,0 +1,167 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import threading
+import time
+
+import pytest
+
+from container_support import pipeline
+from container_support.serving import Server, Transformer, UnsupportedContentTypeError
+
+
+def _staged(delay=0.0):
+    def input_fn(data, content_type):
+        if content_type != 'text/csv':
+            raise UnsupportedContentTypeError(content_type)
+        return [int(v) for v in data.split(',')]
+
+    def predict_fn(values):
+        time.sleep(delay)
+        return sum(values)
+
+    def output_fn(prediction, accept):
+        return str(prediction), accept
+
+    return Transformer.from_stages(input_fn, predict_fn, output_fn)
+
+
+def test_transformer_from_stages():
+    transformer = _staged()
+    assert transformer.transform('1,2,3', 'text/csv', 'text/csv') == ('6', 'text/csv')
+    assert len(transformer.stages) == 3
+    assert Transformer().stages is None
+
+
+def test_pipeline_transform():
+    p = pipeline.Pipeline(_staged(), workers=(1, 1, 1))
+    try:
+        assert p.transform('1,2,3', 'text/csv', 'application/json') == ('6', 'application/json')
+        with pytest.raises(UnsupportedContentTypeError):
+            p.transform('1,2,3', 'text/plain', 'text/csv')
+    finally:
+        p.close()
+
+
+def test_pipeline_invalid_workers():
+    with pytest.raises(ValueError):
+        pipeline.Pipeline(_staged(), workers=(1, 0, 1))
+
+
+class ReversingTransformer(Transformer):
+    def transform(self, data, input_content_type, output_content_type):
+        return data[::-1], output_content_type
+
+
+class FrameworkTransformer(object):
+    # framework transformers only need a transform method
+    def transform(self, data, input_content_type, output_content_type):
+        return data.upper(), output_content_type
+
+
+@pytest.mark.parametrize('transformer, result', [
+    (Transformer(lambda data, content_type, accept: (data * 2, accept)), 'abcabc'),
+    (ReversingTransformer(), 'cba'),
+    (FrameworkTransformer(), 'ABC'),
+])
+def test_pipeline_wraps_transform(transformer, result):
+    p = pipeline.Pipeline(transformer, workers=(2, 1, 2), report_interval=0)
+    try:
+        assert not p.staged
+        assert p.stages[0].workers == 5
+        assert p.transform('abc', 'text/plain', 'text/csv') == (result, 'text/csv')
+        assert list(p.stats()) == ['transform']
+        assert p.report()['transform']['calls'] == 1
+    finally:
+        p.close()
+
+
+def test_pipeline_reports_once_per_interval():
+    now = [0.0]
+    p = pipeline.Pipeline(_staged(), workers=(1, 1, 1), report_interval=10, clock=lambda: now[0])
+    reports = []
+    p.report = lambda: reports.append(now[0])
+    try:
+        now[0] = 10.0
+        threads = [threading.Thread(target=p.transform, args=('1', 'text/csv', 'text/csv')) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert reports == [10.0]
+    finally:
+        p.close()
+
+
+def test_pipeline_overlaps_requests():
+    # predictions sleep, so concurrent requests overlap in the predict stage when it has 2 threads
+    p = pipeline.Pipeline(_staged(delay=0.2), workers=(1, 2, 1), report_interval=0)
+    results = []
+
+    def invoke():
+        results.append(p.transform('1,2', 'text/csv', 'text/csv'))
+
+    try:
+        start = time.time()
+        threads = [threading.Thread(target=invoke) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert time.time() - start < 0.35
+        assert results == [('3', 'text/csv')] * 2
+    finally:
+        p.close()
+
+
+def test_pipeline_stats():
+    now = [0.0]
+    p = pipeline.Pipeline(_staged(delay=0.05), workers=(1, 1, 1), report_interval=10, clock=lambda: now[0])
+    try:
+        p.transform('1', 'text/csv', 'text/csv')
+        now[0] = 1.0
+        stats = p.stats()
+        assert stats['predict']['calls'] == 1
+        assert 0.04 < stats['predict']['busy_seconds'] < 0.5
+        assert stats['predict']['utilization'] == pytest.approx(stats['predict']['busy_seconds'], abs=1e-3)
+        assert stats['input']['utilization'] < stats['predict']['utilization']
+
+        now[0] = 10.0
+        p.transform('1', 'text/csv', 'text/csv')
+        # reported and reset
+        assert p.stats()['predict']['calls'] == 0
+    finally:
+        p.close()
+
+
+def test_parse_workers():
+    assert pipeline.parse_workers('2,1,4') == (2, 1, 4)
+    with pytest.raises(ValueError):
+        pipeline.parse_workers('2,1')
+
+
+def test_server_with_pipeline():
+    p = pipeline.Pipeline(_staged(), workers=(1, 1, 1))
+    server = Server("test", p)
+    server.app.testing = True
+    try:
+        result = server.app.test_client().post("/invocations", data='4,5',
+                                               headers={"Content-Type": "text/csv", "Accept": "text/csv"})
+        assert result.status_code == 200
+        assert result.data == b'9'
+
+        result = server.app.test_client().post("/invocations", data='4,5', headers={"Content-Type": "text/plain"})
+        assert result.status_code == 415
+    finally:
+        p.close()
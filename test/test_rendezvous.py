@@ -0,0 +1,119 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import multiprocessing
+import socket
+import time
+
+import pytest
+from mock import patch
+
+from container_support import rendezvous
+from container_support.rendezvous import Rendezvous, RendezvousError
+
+HOSTS = ['127.0.0.1', '127.0.0.2', '127.0.0.3']
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _join(hosts, host, port, delay, results):
+    time.sleep(delay)
+    with Rendezvous(hosts, host, port=port, timeout=30) as r:
+        metadata = r.join({'rank': r.rank, 'port': 9000 + r.rank})
+        r.barrier()
+        results.put((host, metadata, r.join_times))
+
+
+def test_resolve_hosts():
+    assert rendezvous.resolve_hosts(['localhost', '127.0.0.2']) == {'localhost': '127.0.0.1',
+                                                                    '127.0.0.2': '127.0.0.2'}
+
+
+@patch('container_support.retrying.time.sleep')
+def test_resolve_hosts_retries(sleep):
+    with patch('socket.gethostbyname', side_effect=[socket.gaierror(), socket.gaierror(), '10.0.0.1']):
+        assert rendezvous.resolve_hosts(['algo-1']) == {'algo-1': '10.0.0.1'}
+    assert sleep.call_count == 2
+
+
+def test_join_single_host():
+    with Rendezvous(['algo-1'], 'algo-1') as r:
+        assert r.join({'port': 1}) == {'algo-1': {'port': 1}}
+        assert r.is_leader
+        assert list(r.join_times) == ['algo-1']
+        r.barrier()
+
+
+def test_join_local_processes():
+    port = _free_port()
+    results = multiprocessing.Queue()
+    # the workers start before the leader and must wait for it
+    processes = [multiprocessing.Process(target=_join, args=(HOSTS, host, port, delay, results))
+                 for host, delay in zip(HOSTS, [0.5, 0, 0.2])]
+    for p in processes:
+        p.start()
+    outputs = [results.get(timeout=30) for _ in HOSTS]
+    for p in processes:
+        p.join()
+
+    expected = {host: {'rank': rank, 'port': 9000 + rank} for rank, host in enumerate(HOSTS)}
+    for host, metadata, join_times in outputs:
+        assert metadata == expected
+        assert sorted(join_times) == HOSTS
+    assert all(p.exitcode == 0 for p in processes)
+
+
+def test_join_timeout():
+    r = Rendezvous(HOSTS[:2], HOSTS[0], port=_free_port(), timeout=0.5)
+    with pytest.raises(RendezvousError) as e:
+        r.join()
+    assert '127.0.0.2' in str(e.value)
+
+
+def _invalid_connection(port, data):
+    for _ in range(100):
+        try:
+            client = socket.create_connection(('127.0.0.1', port))
+            break
+        except socket.error:
+            time.sleep(0.05)
+    else:
+        raise AssertionError('the leader is not listening')
+    client.sendall(data)
+    client.close()
+
+
+def test_join_ignores_invalid_connections():
+    port = _free_port()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_join, args=(HOSTS[:2], host, port, delay, results))
+                 for host, delay in zip(HOSTS[:2], [0, 2])]
+    for p in processes:
+        p.start()
+    # connections closing early or sending garbage before the second host joins
+    for data in (b'', b'\x00\x00\x00\x05garbage', b'\xff\xff\xff\xff', b'\x00\x00\x00\x02[]'):
+        _invalid_connection(port, data)
+    outputs = [results.get(timeout=30) for _ in HOSTS[:2]]
+    for p in processes:
+        p.join()
+
+    assert all(metadata == {HOSTS[0]: {'rank': 0, 'port': 9000}, HOSTS[1]: {'rank': 1, 'port': 9001}}
+               for _, metadata, _ in outputs)
+    assert all(p.exitcode == 0 for p in processes)
@@ -0,0 +1,205 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import sys
+
+import pytest
+from mock import MagicMock, patch
+
+from container_support.retrying import Attempt, CircuitBreaker, CircuitOpenError, Retrying, RetryBudget, \
+    RetryError, retry
+
+
+class Flaky(object):
+    def __init__(self, failures, result='ok'):
+        self.failures = failures
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError('attempt {}'.format(self.calls))
+        return self.result
+
+
+def test_call_retries():
+    sleep = MagicMock()
+    flaky = Flaky(2)
+
+    assert Retrying(stop_max_attempt_number=3, wait_fixed=20, sleep=sleep).call(flaky) == 'ok'
+    assert flaky.calls == 3
+    assert [c[0][0] for c in sleep.call_args_list] == [0.02, 0.02]
+
+
+def test_call_stops():
+    with pytest.raises(IOError):
+        Retrying(stop_max_attempt_number=2, sleep=MagicMock()).call(Flaky(5))
+
+
+def test_call_retry_on_result():
+    retrying = Retrying(stop_max_attempt_number=2, retry_on_result=lambda r: r is None, sleep=MagicMock())
+    with pytest.raises(RetryError):
+        retrying.call(lambda: None)
+
+
+@patch('container_support.retrying.time.sleep')
+def test_call_default_sleep(sleep):
+    Retrying(stop_max_attempt_number=2, wait_fixed=10).call(Flaky(1))
+    sleep.assert_called_once_with(0.01)
+
+
+def test_next_delay():
+    retrying = Retrying(stop_max_attempt_number=3, wait_exponential_multiplier=100)
+    flaky = Flaky(10)
+
+    attempts = []
+    for number in (1, 2):
+        try:
+            flaky()
+        except IOError:
+            attempts.append(Attempt(sys.exc_info(), number, True))
+    assert retrying.next_delay(attempts[0], 0) == 0.2
+    assert retrying.next_delay(attempts[1], 0) == 0.4
+
+
+def test_retry_builds_retrying_once():
+    with patch('container_support.retrying.Retrying') as retrying:
+        @retry(stop_max_attempt_number=2)
+        def f():
+            pass
+
+        f()
+        f()
+
+    retrying.assert_called_once_with(stop_max_attempt_number=2)
+    assert retrying.return_value.call.call_count == 2
+
+
+def test_retry_without_arguments():
+    flaky = Flaky(1)
+
+    @retry
+    def f():
+        return flaky()
+
+    with patch('container_support.retrying.time.sleep'):
+        assert f() == 'ok'
+    assert f.__name__ == 'f'
+
+
+def test_full_jitter():
+    sleep = MagicMock()
+    retrying = Retrying(stop_max_attempt_number=4, wait_exponential_multiplier=100, wait_jitter='full', sleep=sleep)
+    with patch('container_support.retrying.random.uniform', side_effect=lambda a, b: b / 2) as uniform:
+        retrying.call(Flaky(3))
+
+    assert [c[0] for c in uniform.call_args_list] == [(0, 200), (0, 400), (0, 800)]
+    assert [c[0][0] for c in sleep.call_args_list] == [0.1, 0.2, 0.4]
+
+
+def test_decorrelated_jitter():
+    sleep = MagicMock()
+    retrying = Retrying(stop_max_attempt_number=5, wait_exponential_multiplier=100, wait_exponential_max=1000,
+                        wait_jitter='decorrelated', sleep=sleep)
+    with patch('container_support.retrying.random.uniform', side_effect=lambda a, b: b) as uniform:
+        retrying.call(Flaky(4))
+
+    # between the first wait and 3 times the previous sleep
+    assert [c[0] for c in uniform.call_args_list] == [(200, 600), (200, 1800), (200, 3000), (200, 3000)]
+    assert [c[0][0] for c in sleep.call_args_list] == [0.6, 1.0, 1.0, 1.0]
+
+
+def test_invalid_jitter():
+    with pytest.raises(ValueError):
+        Retrying(wait_jitter='random')
+
+
+def test_metrics():
+    retrying = Retrying(stop_max_attempt_number=2, wait_fixed=100, sleep=MagicMock())
+    retrying.call(Flaky(1))
+    with pytest.raises(IOError):
+        retrying.call(Flaky(2))
+
+    assert retrying.metrics.snapshot() == {'attempts': 4, 'retries': 2, 'failures': 1, 'budget_exhausted': 0,
+                                           'rejected': 0, 'sleep_seconds': 0.2}
+    assert retrying.metrics.attempts == 4
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_budget(shared):
+    with patch('container_support.retrying.time.time', return_value=100.0) as now:
+        budget = RetryBudget(capacity=2, refill_per_second=0.5, shared=shared)
+        assert budget.acquire() and budget.acquire()
+        assert not budget.acquire()
+
+        now.return_value = 102.0
+        assert budget.tokens == 1
+        assert budget.acquire()
+        assert not budget.acquire()
+
+        now.return_value = 1000.0
+        assert budget.tokens == 2
+
+
+def test_budget_limits_retries():
+    budget = RetryBudget(capacity=1, refill_per_second=0)
+    first = Retrying(stop_max_attempt_number=5, wait_fixed=0, budget=budget)
+    second = Retrying(stop_max_attempt_number=5, wait_fixed=0, budget=budget)
+
+    assert first.call(Flaky(1)) == 'ok'
+    flaky = Flaky(1)
+    with pytest.raises(IOError):
+        second.call(flaky)
+    assert flaky.calls == 1
+    assert second.metrics.budget_exhausted == 1
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    with patch('container_support.retrying.time.time', return_value=100.0) as now:
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+        now.return_value = 110.0
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # a single trial attempt
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        now.return_value = 120.0
+        assert breaker.allow()
+        breaker.record(True)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow()
+
+
+def test_circuit_breaker_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    retrying = Retrying(stop_max_attempt_number=5, wait_fixed=0, circuit_breaker=breaker)
+    flaky = Flaky(10)
+
+    with pytest.raises(CircuitOpenError):
+        retrying.call(flaky)
+    assert flaky.calls == 2
+
+    with pytest.raises(CircuitOpenError):
+        retrying.call(flaky)
+    assert flaky.calls == 2
+    assert retrying.metrics.rejected == 2
@@ -0,0 +1,111 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import asyncio
+import inspect
+
+import pytest
+from mock import MagicMock
+
+from container_support.retrying import CircuitBreaker, Retrying, retry
+
+
+def run(coroutine):
+    return asyncio.get_event_loop_policy().new_event_loop().run_until_complete(coroutine)
+
+
+def test_retry_coroutine_function():
+    calls = []
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    @retry(stop_max_attempt_number=3, wait_fixed=50, async_sleep=fake_sleep)
+    async def fetch(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise IOError('not yet')
+        return value
+
+    assert inspect.iscoroutinefunction(fetch)
+    assert run(fetch(7)) == 7
+    assert calls == [7, 7, 7]
+    assert sleeps == [0.05, 0.05]
+
+
+def test_call_async_does_not_block_the_loop():
+    ticks = []
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise IOError()
+        return 'ok'
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        sleep = MagicMock()
+        result, _ = await asyncio.gather(
+            Retrying(stop_max_attempt_number=3, wait_fixed=30, sleep=sleep).call_async(flaky), ticker())
+        assert not sleep.called
+        return result
+
+    assert run(main()) == 'ok'
+    assert len(ticks) == 5
+
+
+def test_call_async_stops():
+    async def failing():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        run(Retrying(stop_max_attempt_number=2, wait_fixed=0).call_async(failing))
+
+
+def test_call_async_does_not_retry_cancellation():
+    calls = []
+
+    async def cancelled():
+        calls.append(1)
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        run(Retrying(stop_max_attempt_number=3, wait_fixed=0).call_async(cancelled))
+    assert calls == [1]
+
+
+def test_cancelled_trial_does_not_stick_circuit_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record(False)
+    retrying = Retrying(stop_max_attempt_number=1, circuit_breaker=breaker)
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def succeeding():
+        return 'ok'
+
+    with pytest.raises(asyncio.CancelledError):
+        run(retrying.call_async(cancelled))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # another trial is allowed, and closes the circuit
+    assert run(retrying.call_async(succeeding)) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
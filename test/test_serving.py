@@ -11,11 +11,18 @@
 #  express or implied. See the License for the specific language governing 
 #  permissions and limitations under the License.
 
+import io
+import os
 import pytest
 import json
 import signal
-from mock import patch
-from container_support.serving import (Server,
+import socket
+from flask import Response
+from mock import MagicMock, patch
+from werkzeug.test import Client
+from container_support.serving import (MAX_CONTENT_LENGTH,
+                                       RawWsgiApp,
+                                       Server,
                                        Transformer,
                                        UnsupportedContentTypeError,
                                        UnsupportedAcceptTypeError,
@@ -140,6 +147,7 @@ def test_download_user_module_already_exists(env, os_path_exists):
     os_path_exists.return_value = True
     Server._download_user_module_internal(env)
     env.download_user_module.assert_not_called()
+    env.precompile_user_module.assert_called_with()
 
 
 @patch('os.path')
@@ -201,3 +209,151 @@ def _unsupported_accept_transform(data, input_content_type, output_content_type)
 def _unsupported_input_shape_transform(data, input_content_type, output_content_type):
     raise UnsupportedInputShapeError(3)
 
+
+
+def test_invoke_request_log():
+    request_log = MagicMock()
+    server = Server("test", Transformer(), request_log)
+    server.app.testing = True
+
+    server.app.test_client().post("/invocations", data=JSON_DATA,
+                                  headers={"Content-Type": JSON_CONTENT_TYPE, "X-Request-Id": "request-1"})
+
+    args, kwargs = request_log.log.call_args
+    assert args[0] == "request-1"
+    assert kwargs['status'] == 200
+    assert kwargs['content_type'] == JSON_CONTENT_TYPE
+
+
+def _clients(transformer):
+    server = Server("test", transformer)
+    server.app.testing = True
+    return server.app.test_client(), Client(RawWsgiApp(server), Response)
+
+
+@pytest.mark.parametrize("headers", [{"ContentType": JSON_CONTENT_TYPE, "Accept": JSON_CONTENT_TYPE},
+                                     {"Content-Type": "text/csv", "Accept": "text/csv"},
+                                     {"ContentType": "text/csv", "Content-Type": JSON_CONTENT_TYPE},
+                                     {"Content-Type": "application/octet-stream"},
+                                     {}])
+def test_raw_wsgi_app_invoke_matches_flask(headers):
+    seen = []
+
+    def transform(data, content_type, accept):
+        seen.append((data, content_type, accept))
+        return data, accept
+
+    flask_client, raw_client = _clients(Transformer(transform))
+    flask_result = flask_client.post("/invocations", data=JSON_DATA, headers=headers)
+    raw_result = raw_client.post("/invocations", data=JSON_DATA, headers=headers)
+
+    assert seen[0] == seen[1]
+    assert raw_result.status_code == flask_result.status_code == 200
+    assert raw_result.data == flask_result.data
+    assert raw_result.content_type == flask_result.content_type
+
+
+@pytest.mark.parametrize("error, status", [(UnsupportedContentTypeError("text/plain"), 415),
+                                           (UnsupportedAcceptTypeError("text/plain"), 406),
+                                           (UnsupportedInputShapeError(2), 412),
+                                           (Exception("error"), 500)])
+def test_raw_wsgi_app_invoke_error(error, status):
+    def f(*args):
+        raise error
+
+    flask_client, raw_client = _clients(Transformer(f))
+    flask_result = flask_client.post("/invocations", data='{}')
+    raw_result = raw_client.post("/invocations", data='{}')
+
+    assert raw_result.status_code == flask_result.status_code == status
+    assert raw_result.data == flask_result.data
+
+
+def test_raw_wsgi_app_routes():
+    _, client = _clients(Transformer())
+
+    assert client.get("/ping").status_code == 200
+    assert client.get("/ping").data == b''
+    assert client.post("/ping").status_code == 405
+    assert client.get("/invocations").status_code == 405
+    assert client.get("/models").status_code == 404
+
+
+def test_wsgi_module():
+    server = Server("test", Transformer())
+    with patch('container_support.serving.Server.from_env', return_value=server):
+        from container_support import wsgi
+
+    assert wsgi.app is server.app
+    assert wsgi.raw_app.server is server
+
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_not_found_and_body_limit(raw):
+    flask_client, raw_client = _clients(Transformer())
+    client = raw_client if raw else flask_client
+
+    result = client.get("/models")
+    assert result.status_code == 404
+    assert result.data == b'{}'
+    assert result.headers['Content-Type'].startswith('application/json')
+
+    result = client.get("/invocations")
+    assert result.status_code == 405
+    assert result.data == b''
+    assert 'POST' in result.headers['Allow']
+
+    too_large = b'1' * (MAX_CONTENT_LENGTH + 1)
+    assert client.post("/invocations", data=too_large).status_code == 413
+    assert client.post("/invocations", data=too_large[:-1]).status_code == 200
+
+
+def test_raw_wsgi_app_body_limit_without_content_length():
+    server = Server("test", Transformer())
+    app = RawWsgiApp(server)
+    statuses = []
+
+    for size in (MAX_CONTENT_LENGTH, MAX_CONTENT_LENGTH + 1):
+        environ = {'PATH_INFO': '/invocations', 'REQUEST_METHOD': 'POST', 'wsgi.input': io.BytesIO(b'1' * size),
+                   'CONTENT_TYPE': 'application/octet-stream'}
+        app(environ, lambda status, headers: statuses.append(status))
+
+    assert statuses == ['200 OK', '413 REQUEST ENTITY TOO LARGE']
+
+
+def test_post_fork_reuse_port():
+    from container_support import gunicorn_config
+
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    address = probe.getsockname()
+    probe.close()
+
+    workers = [MagicMock(sockets=[MagicMock()], cfg=MagicMock(backlog=16, reuse_port=False)) for _ in range(2)]
+    with patch.dict(os.environ, {'SAGEMAKER_MODEL_SERVER_REUSE_PORT': 'true'}), \
+            patch.object(gunicorn_config, 'REUSE_PORT_ADDRESS', address):
+        for worker in workers:
+            inherited = worker.sockets[0]
+            gunicorn_config.post_fork(MagicMock(), worker)
+            inherited.sock.close.assert_called_with()
+
+    try:
+        # both workers listen on the same port
+        assert [w.sockets[0].sock.getsockname() for w in workers] == [address, address]
+        client = socket.create_connection(address)
+        client.close()
+    finally:
+        for worker in workers:
+            worker.sockets[0].sock.close()
+
+
+@pytest.mark.parametrize("max_workers, cmd_args, reuse_port", [(2, '', True),
+                                                                (4, '', False),
+                                                                (2, '--max-requests 1000', False)])
+def test_reuse_port_refused_when_workers_restart(max_workers, cmd_args, reuse_port):
+    env = MagicMock(model_server_reuse_port=True, model_server_min_workers=2, model_server_max_workers=max_workers)
+    with patch.dict(os.environ, {'SAGEMAKER_MODEL_SERVER_REUSE_PORT': 'true', 'GUNICORN_CMD_ARGS': cmd_args}):
+        assert Server._reuse_port(env) == reuse_port
+        assert os.environ['SAGEMAKER_MODEL_SERVER_REUSE_PORT'] == str(reuse_port).lower()
+
+    assert not Server._reuse_port(MagicMock(model_server_reuse_port=False))
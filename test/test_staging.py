@@ -0,0 +1,119 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import collections
+import os
+
+import pytest
+from mock import patch
+
+from container_support import staging
+from container_support.staging import Stager
+
+
+def _channel(root, files):
+    for name, data in files.items():
+        path = root.join(name)
+        path.dirpath().ensure(dir=True)
+        path.write_binary(data)
+    return str(root)
+
+
+def test_stage(tmpdir):
+    source = _channel(tmpdir.join('train'), {'a.csv': b'1' * 100, 'part/b.csv': b'2' * 10})
+    target = tmpdir.join('scratch')
+
+    report, = Stager({'train': source}, str(target), workers=2).run()
+
+    assert report.staged and not report.reused
+    assert report.path == str(target.join('train'))
+    assert report.total_bytes == 110
+    assert target.join('train', 'a.csv').read_binary() == b'1' * 100
+    assert target.join('train', 'part', 'b.csv').read_binary() == b'2' * 10
+    assert (report.epoch_seconds_saved is not None) == hasattr(os, 'posix_fadvise')
+    assert 'staged channel train' in str(report)
+    # no temporary directories are left behind
+    assert sorted(os.listdir(str(target))) == ['train', 'train.json']
+
+
+def test_stage_reuses_unchanged_channel(tmpdir):
+    source = _channel(tmpdir.join('train'), {'a.csv': b'1' * 100})
+    target = str(tmpdir.join('scratch'))
+    Stager({'train': source}, target).run()
+
+    report, = Stager({'train': source}, target).run()
+    assert report.reused
+
+    tmpdir.join('train', 'c.csv').write_binary(b'3')
+    report, = Stager({'train': source}, target).run()
+    assert not report.reused
+    assert tmpdir.join('scratch', 'train', 'c.csv').check()
+
+
+def test_stage_restages_channel_modified_in_place(tmpdir):
+    source = _channel(tmpdir.join('train'), {'a.csv': b'1' * 100})
+    target = str(tmpdir.join('scratch'))
+    Stager({'train': source}, target).run()
+
+    path = tmpdir.join('train', 'a.csv')
+    path.write_binary(b'2' * 100)
+    os.utime(str(path), (0, 0))
+    report, = Stager({'train': source}, target).run()
+    assert not report.reused
+    assert tmpdir.join('scratch', 'train', 'a.csv').read_binary() == b'2' * 100
+
+
+def test_stage_estimates_time_saved_against_source(tmpdir):
+    source = _channel(tmpdir.join('train'), {'a.csv': b'1' * 100})
+    with patch('container_support.staging._estimate_read_seconds', side_effect=[5.0, 1.5]) as estimate:
+        report, = Stager({'train': source}, str(tmpdir.join('scratch'))).run()
+
+    assert report.epoch_seconds_saved == 3.5
+    assert estimate.call_args_list[0][0][0] == source
+    assert estimate.call_args_list[1][1] == {'evict': True}
+
+
+def test_stage_budget(tmpdir):
+    first = _channel(tmpdir.join('train'), {'a.csv': b'1' * 100})
+    second = _channel(tmpdir.join('test'), {'a.csv': b'1' * 100})
+    third = _channel(tmpdir.join('validation'), {'a.csv': b'1' * 50})
+
+    channel_dirs = collections.OrderedDict([('train', first), ('test', second), ('validation', third)])
+
+    reports = Stager(channel_dirs, str(tmpdir.join('scratch')), max_bytes=160).run()
+
+    assert [r.staged for r in reports] == [True, False, True]
+    assert 'not staged' in str(reports[1])
+
+
+def test_stage_in_background(tmpdir):
+    source = _channel(tmpdir.join('train'), {'a.csv': b'1'})
+    callback = []
+    stager = Stager({'train': source}, str(tmpdir.join('scratch')), callback=callback.append).start()
+
+    reports = stager.wait()
+    assert reports[0].staged
+    assert callback == [reports]
+
+
+def test_stage_failure_cleans_up(tmpdir):
+    source = _channel(tmpdir.join('train'), {'a.csv': b'1'})
+    with patch('container_support.staging.shutil.copyfileobj', side_effect=IOError('disk full')):
+        with pytest.raises(IOError):
+            Stager({'train': source}, str(tmpdir.join('scratch'))).run()
+    assert os.listdir(str(tmpdir.join('scratch'))) == []
+
+
+def test_free_bytes(tmpdir):
+    assert 0 < staging._free_bytes(str(tmpdir), 0.1) < staging._free_bytes(str(tmpdir))
@@ -0,0 +1,95 @@
+#  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  or in the "license" file accompanying this file. This file is distributed
+#  on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#  express or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+
+import io
+import json
+import time
+
+import pytest
+
+from container_support import telemetry
+from container_support.telemetry import InstrumentedFile
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    telemetry._channels.clear()
+    yield
+    telemetry.finish()
+
+
+def test_instrumented_file():
+    stats = telemetry.channel('train')
+    f = InstrumentedFile(io.BytesIO(b'a,1\nb,2\nc,3\n'), stats)
+
+    assert f.read(2) == b'a,'
+    assert f.readline() == b'1\n'
+    assert list(f) == [b'b,2\n', b'c,3\n']
+    buffer = bytearray(4)
+    assert f.readinto(buffer) == 0
+    assert stats.snapshot()[:2] == (12, 3)
+    assert telemetry.channel('train') is stats
+
+
+def test_instrument_records():
+    def slow_records():
+        for record in [b'abc', b'de']:
+            time.sleep(0.05)
+            yield record
+
+    stats = telemetry.channel('train')
+    assert list(telemetry.instrument_records(slow_records(), stats)) == [b'abc', b'de']
+
+    size, records, seconds = stats.snapshot()
+    assert (size, records) == (5, 2)
+    assert seconds >= 0.1
+
+
+def test_session(tmpdir):
+    session = telemetry.start(str(tmpdir), interval=0.05, name='process-1')
+    assert telemetry.active() is session
+    stats = telemetry.channel('train')
+    stats.add(1024, 10, 0.01)
+    time.sleep(0.2)
+
+    summary = telemetry.finish()
+    assert telemetry.active() is None
+
+    with open(str(tmpdir.join('telemetry', 'process-1.jsonl'))) as f:
+        samples = [json.loads(line) for line in f]
+    assert len(samples) >= 2
+    assert all(set(s) == {'t', 'cpu', 'rss', 'channels'} for s in samples)
+    assert sum(s['channels']['train']['records_per_second'] for s in samples) > 0
+
+    with open(str(tmpdir.join('telemetry', 'process-1-summary.json'))) as f:
+        assert json.load(f) == summary
+    assert summary['channels']['train']['bytes'] == 1024
+    assert summary['channels']['train']['records'] == 10
+    assert summary['channels']['train']['bytes_per_second'] == 102400
+    assert 0 < summary['channels']['train']['blocked_fraction'] < 0.1
+    assert summary['peak_rss'] > 0
+
+
+def test_start_resets_counters(tmpdir):
+    telemetry.channel('train').add(1, 1, 0)
+    telemetry.start(str(tmpdir), interval=10)
+    assert telemetry.summarize(1)['channels'] == {}
+
+
+def test_finish_without_session():
+    assert telemetry.finish() is None
+
+
+def test_resident_bytes():
+    assert telemetry.resident_bytes() > 1024 * 1024
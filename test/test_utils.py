@@ -11,10 +11,18 @@
 #  express or implied. See the License for the specific language governing 
 #  permissions and limitations under the License.
 
+import io
+import os
+import sys
+import tarfile
+
 import pytest
-from mock import patch, call
+from botocore.exceptions import ClientError
+from mock import patch, call, MagicMock
 
 import container_support as cs
+from container_support.cache import ArtifactCache, cache_key
+from container_support import utils
 
 
 def test_parse_s3_url_invalid():
@@ -30,16 +38,385 @@ def test_parse_s3_url_no_key():
     assert ("bucket", "") == cs.parse_s3_url("s3://bucket/")
 
 
-def test_download_s3():
-    with patch('boto3.resource') as patched:
-        assert cs.download_s3_resource("s3://bucket/key", "target") == "target"
-        assert [call('s3'),
-                call().Bucket('bucket'),
-                call().Bucket().download_file('key', 'target')] == patched.mock_calls
+@patch('container_support.utils.s3_client')
+def test_download_s3(s3_client):
+    assert cs.download_s3_resource("s3://bucket/key", "target") == "target"
+
+    args, kwargs = s3_client().download_file.call_args
+    assert args == ('bucket', 'key', 'target')
+    assert isinstance(kwargs['Callback'], utils.TransferProgress)
+
+
+@patch('container_support.utils.s3_client')
+def test_download_s3_transfer_config(s3_client):
+    callback = MagicMock()
+    cs.download_s3_resource("s3://bucket/key", "target", max_concurrency=32, chunk_size=1024, callback=callback)
+
+    kwargs = s3_client().download_file.call_args[1]
+    assert kwargs['Config'].max_concurrency == 32
+    assert kwargs['Config'].multipart_chunksize == 1024
+    assert kwargs['Callback'] is callback
+
+
+def test_download_file_url(tmpdir):
+    source = tmpdir.join('source.bin')
+    source.write_binary(b'x' * 1000)
+    target = str(tmpdir.join('target.bin'))
+    callback = MagicMock()
+
+    cs.download_s3_resource('file://' + str(source), target, chunk_size=300, callback=callback)
+
+    with open(target, 'rb') as f:
+        assert f.read() == b'x' * 1000
+    assert [call(300), call(300), call(300), call(100)] == callback.mock_calls
+
+
+@patch('boto3.session.Session')
+def test_s3_client_is_shared(session):
+    utils._s3_clients.clear()
+    with patch.dict('os.environ', {'SAGEMAKER_S3_ENDPOINT_URL': 'http://localhost:9000',
+                                   'SAGEMAKER_S3_MAX_CONCURRENCY': '20'}):
+        assert utils.s3_client() is utils.s3_client()
+
+    assert session.call_count == 1
+    args, kwargs = session().client.call_args
+    assert args == ('s3',)
+    assert kwargs['endpoint_url'] == 'http://localhost:9000'
+    assert kwargs['config'].max_pool_connections == 20
+    utils._s3_clients.clear()
+
+
+@patch('boto3.session.Session')
+def test_s3_client_pool_sized_for_concurrency(session):
+    utils._s3_clients.clear()
+    with patch.dict('os.environ', {'SAGEMAKER_S3_MAX_CONCURRENCY': '20'}):
+        utils.s3_client()
+        utils.s3_client(64)
+        utils.s3_client(64)
+
+    pools = [c[1]['config'].max_pool_connections for c in session().client.call_args_list]
+    assert pools == [20, 64]
+    utils._s3_clients.clear()
+
+
+def test_local_path():
+    assert utils._local_path('file:///data/x') == '/data/x'
+    assert utils._local_path('file://data/x') == 'data/x'
+
+
+def test_transfer_progress():
+    progress = utils.TransferProgress('s3://bucket/key', interval=3600)
+    progress(utils.MB)
+    progress(utils.MB)
+
+    assert progress.bytes == 2 * utils.MB
+    assert progress.throughput > 0
+
+
+def test_untar_directory(tmpdir):
+    archive = _write_archive(tmpdir.join('code.tar.gz'), {'a/b.py': b'x = 1'})
+
+    cs.untar_directory(archive, str(tmpdir.join('out')))
+
+    assert tmpdir.join('out', 'a', 'b.py').read_binary() == b'x = 1'
+
+
+def test_compile_directory(tmpdir):
+    tmpdir.join('a.py').write('x = 1\n')
+    tmpdir.mkdir('pkg').join('b.py').write('y = 2\n')
+    tmpdir.join('data.txt').write('not python')
+
+    files, compile_time = cs.compile_directory(str(tmpdir), workers=2)
+
+    assert files == 2
+    assert compile_time >= 0
+    if sys.version_info >= (3,):
+        assert os.listdir(str(tmpdir.join('__pycache__')))[0].startswith('a.')
+        assert os.listdir(str(tmpdir.join('pkg', '__pycache__')))[0].startswith('b.')
+
+
+def test_compile_directory_syntax_error(tmpdir):
+    tmpdir.join('good.py').write('x = 1\n')
+    tmpdir.join('bad.py').write('def (:\n')
+
+    assert cs.compile_directory(str(tmpdir), workers=1)[0] == 1
+
+
+def test_download_and_extract(tmpdir):
+    archive = _write_archive(tmpdir.join('code.tar.gz'), {'script.py': b'print(1)', 'lib/util.py': b'x = 1'})
+    target = tmpdir.join('code')
+    callback = MagicMock()
+
+    cs.download_and_extract('file://' + archive, str(target), callback=callback)
+
+    assert target.join('script.py').read_binary() == b'print(1)'
+    assert target.join('lib', 'util.py').read_binary() == b'x = 1'
+    assert sum(c[1][0] for c in callback.mock_calls) == os.path.getsize(archive)
+
+
+@patch('container_support.utils.s3_client')
+def test_download_and_extract_s3(s3_client, tmpdir):
+    archive = _write_archive(tmpdir.join('code.tar.gz'), {'script.py': b'print(1)'})
+    s3_client().get_object.return_value = {'Body': open(archive, 'rb')}
+
+    cs.download_and_extract('s3://bucket/code.tar.gz', str(tmpdir.join('code')))
+
+    s3_client().get_object.assert_called_with(Bucket='bucket', Key='code.tar.gz')
+    assert tmpdir.join('code', 'script.py').read_binary() == b'print(1)'
+
+
+@pytest.mark.parametrize('name', ['../evil.py', '/tmp/evil.py', 'a/../../evil.py'])
+def test_download_and_extract_path_traversal(name, tmpdir):
+    archive = _write_archive(tmpdir.join('code.tar.gz'), {name: b'evil'})
+
+    with pytest.raises(Exception):
+        cs.download_and_extract('file://' + archive, str(tmpdir.join('code')))
+
+    assert not tmpdir.join('evil.py').exists()
+
+
+def test_download_and_extract_symlink_escape(tmpdir):
+    path = str(tmpdir.join('code.tar.gz'))
+    with tarfile.open(path, 'w:gz') as t:
+        link = tarfile.TarInfo('link')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '../..'
+        t.addfile(link)
+
+    with pytest.raises(Exception):
+        cs.download_and_extract('file://' + path, str(tmpdir.join('code')))
+
+
+def _write_archive(path, files):
+    with tarfile.open(str(path), 'w:gz') as t:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_download_s3_resource_cached(tmpdir):
+    source = tmpdir.join('source.bin')
+    source.write_binary(b'data')
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+    url = 'file://' + str(source)
+
+    cs.download_s3_resource(url, str(tmpdir.join('first')), cache=cache)
+    with patch('container_support.utils._download_file') as download:
+        cs.download_s3_resource(url, str(tmpdir.join('second')), cache=cache)
+
+    download.assert_not_called()
+    assert tmpdir.join('second').read_binary() == b'data'
+
+
+def test_download_s3_resource_changed(tmpdir):
+    source = tmpdir.join('source.bin')
+    source.write_binary(b'data')
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+    url = 'file://' + str(source)
+
+    cs.download_s3_resource(url, str(tmpdir.join('first')), cache=cache)
+    source.write_binary(b'new data')
+    cs.download_s3_resource(url, str(tmpdir.join('second')), cache=cache)
+
+    assert tmpdir.join('second').read_binary() == b'new data'
+
+
+@patch('container_support.utils.s3_client')
+def test_download_s3_resource_cache_revalidates_with_etag(s3_client, tmpdir):
+    s3_client().head_object.return_value = {'ETag': '"abc"'}
+    s3_client().download_file.side_effect = lambda bucket, key, target, **kwargs: open(target, 'w').close()
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+
+    cs.download_s3_resource('s3://bucket/key', str(tmpdir.join('first')), cache=cache)
+    cs.download_s3_resource('s3://bucket/key', str(tmpdir.join('second')), cache=cache)
+
+    s3_client().head_object.assert_called_with(Bucket='bucket', Key='key')
+    assert s3_client().download_file.call_count == 1
+
+
+def _precondition_failed():
+    return ClientError({'Error': {'Code': 'PreconditionFailed', 'Message': 'At least one of the pre-conditions '
+                                                                          'you specified did not hold'}}, 'GetObject')
+
+
+@patch('container_support.utils.s3_client')
+def test_download_s3_resource_object_replaced_after_head(s3_client, tmpdir):
+    # the object is replaced between the HEAD and the GET of the first download
+    s3_client().head_object.side_effect = [{'ETag': '"v1"'}, {'ETag': '"v2"'}]
+
+    def download_file(bucket, key, target, ExtraArgs, **kwargs):
+        if ExtraArgs['IfMatch'] != '"v2"':
+            raise _precondition_failed()
+        with open(target, 'wb') as f:
+            f.write(b'v2')
+
+    s3_client().download_file.side_effect = download_file
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+
+    cs.download_s3_resource('s3://bucket/key', str(tmpdir.join('model')), cache=cache)
+
+    assert tmpdir.join('model').read_binary() == b'v2'
+    assert cache.get(cache_key('s3://bucket/key', '"v2"', 'file')) is not None
+    assert cache.get(cache_key('s3://bucket/key', '"v1"', 'file')) is None
+
+
+@patch('container_support.utils.s3_client')
+def test_download_and_extract_fetches_the_cached_version(s3_client, tmpdir):
+    archive = _write_archive(tmpdir.join('code.tar.gz'), {'script.py': b'print(1)'})
+    s3_client().head_object.return_value = {'ETag': '"v1"'}
+    s3_client().get_object.side_effect = lambda **kwargs: {'Body': open(archive, 'rb')}
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+
+    cs.download_and_extract('s3://bucket/code.tar.gz', str(tmpdir.join('code')), cache=cache)
+
+    s3_client().get_object.assert_called_with(Bucket='bucket', Key='code.tar.gz', IfMatch='"v1"')
+    assert tmpdir.join('code', 'script.py').read_binary() == b'print(1)'
+
+    s3_client().get_object.side_effect = _precondition_failed()
+    with pytest.raises(ClientError):
+        # replaced again between every HEAD and GET
+        cs.download_and_extract('s3://bucket/code.tar.gz', str(tmpdir.join('code')),
+                                cache=ArtifactCache(str(tmpdir.join('other-cache'))))
+
+
+@patch('container_support.utils.object_version')
+def test_download_and_extract_cached_without_revalidation(object_version, tmpdir):
+    archive = _write_archive(tmpdir.join('code.tar.gz'), {'script.py': b'print(1)'})
+    object_version.return_value = 'v1'
+    cache = ArtifactCache(str(tmpdir.join('cache')), revalidate=False)
+    url = 'file://' + archive
+
+    cs.download_and_extract(url, str(tmpdir.join('first')), cache=cache)
+    with patch('container_support.utils._stream_extract') as stream_extract:
+        cs.download_and_extract(url, str(tmpdir.join('second')), cache=cache)
+
+    stream_extract.assert_not_called()
+    assert object_version.call_count == 1
+    assert tmpdir.join('second', 'script.py').read_binary() == b'print(1)'
+
+
+def test_sync_s3_prefix_local(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.bin').write_binary(b'a')
+    source.mkdir('shards').join('b.bin').write_binary(b'bb')
+    target = tmpdir.join('target')
+    url = 'file://' + str(source)
+
+    assert cs.sync_s3_prefix(url, str(target), max_workers=2) == \
+        {'downloaded': 2, 'unchanged': 0, 'deleted': 0, 'bytes': 3}
+    assert target.join('shards', 'b.bin').read_binary() == b'bb'
+
+    source.join('a.bin').write_binary(b'changed')
+    assert cs.sync_s3_prefix(url, str(target)) == {'downloaded': 1, 'unchanged': 1, 'deleted': 0, 'bytes': 7}
+    assert target.join('a.bin').read_binary() == b'changed'
+
+
+def test_sync_s3_prefix_restores_missing_files(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.bin').write_binary(b'a')
+    target = tmpdir.join('target')
+    url = 'file://' + str(source)
+
+    cs.sync_s3_prefix(url, str(target))
+    target.join('a.bin').remove()
+
+    assert cs.sync_s3_prefix(url, str(target))['downloaded'] == 1
+    assert target.join('a.bin').read_binary() == b'a'
+
+
+def test_sync_s3_prefix_delete(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.bin').write_binary(b'a')
+    source.join('b.bin').write_binary(b'b')
+    target = tmpdir.join('target')
+    url = 'file://' + str(source)
+
+    cs.sync_s3_prefix(url, str(target))
+    source.join('b.bin').remove()
+
+    assert cs.sync_s3_prefix(url, str(target), delete=True)['deleted'] == 1
+    assert not target.join('b.bin').exists()
+    assert target.join('a.bin').exists()
+
+
+@patch('container_support.utils.s3_client')
+def test_sync_s3_prefix_s3(s3_client, tmpdir):
+    s3_client().get_paginator().paginate.return_value = [
+        {'Contents': [{'Key': 'model/', 'Size': 0, 'ETag': '"0"'},
+                      {'Key': 'model/vocab.txt', 'Size': 3, 'ETag': '"1"'}]},
+        {'Contents': [{'Key': 'model/shards/0.bin', 'Size': 4, 'ETag': '"2"'}]}]
+    s3_client().download_file.side_effect = lambda bucket, key, target, **kwargs: open(target, 'w').close()
+
+    result = cs.sync_s3_prefix('s3://bucket/model', str(tmpdir))
+
+    s3_client().get_paginator().paginate.assert_called_with(Bucket='bucket', Prefix='model/')
+    downloaded = sorted(c[1][1] for c in s3_client().download_file.mock_calls)
+    assert downloaded == ['model/shards/0.bin', 'model/vocab.txt']
+    assert result['downloaded'] == 2
+    assert tmpdir.join('shards', '0.bin').exists()
+
+
+def test_sync_s3_prefix_object_named_like_the_manifest(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('.sagemaker-sync-manifest.json').write_binary(b'object')
+    source.join('a.bin').write_binary(b'a')
+    target = tmpdir.join('target')
+    url = 'file://' + str(source)
+
+    assert cs.sync_s3_prefix(url, str(target))['downloaded'] == 2
+    assert cs.sync_s3_prefix(url, str(target))['downloaded'] == 0
+    assert target.join('.sagemaker-sync-manifest.json').read_binary() == b'object'
+
+
+def test_sync_s3_prefix_moves_manifest_out_of_target(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.bin').write_binary(b'a')
+    target = tmpdir.join('target')
+    url = 'file://' + str(source)
+    cs.sync_s3_prefix(url, str(target))
+    tmpdir.join('.target.sagemaker-sync-manifest.json').move(target.join('.sagemaker-sync-manifest.json'))
+
+    assert cs.sync_s3_prefix(url, str(target))['unchanged'] == 1
+    assert os.listdir(str(target)) == ['a.bin']
+
+
+def test_sync_s3_prefix_retries(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.bin').write_binary(b'a')
+    download_file = utils._download_file
+    failures = []
+
+    def flaky(url, target, *args):
+        if not failures:
+            failures.append(url)
+            raise IOError('connection reset')
+        return download_file(url, target, *args)
+
+    with patch('container_support.utils._download_file', side_effect=flaky):
+        cs.sync_s3_prefix('file://' + str(source), str(tmpdir.join('target')))
+
+    assert len(failures) == 1
+    assert tmpdir.join('target', 'a.bin').read_binary() == b'a'
+
+
+def test_sync_s3_prefix_failure_keeps_progress(tmpdir):
+    source = tmpdir.mkdir('source')
+    source.join('a.bin').write_binary(b'a')
+    source.join('b.bin').write_binary(b'b')
+    target = tmpdir.join('target')
+    url = 'file://' + str(source)
+    download_file = utils._download_file
+
+    def fail_b(source_url, path, *args):
+        if source_url.endswith('b.bin'):
+            raise IOError('access denied')
+        return download_file(source_url, path, *args)
 
+    with patch('container_support.utils._download_file', side_effect=fail_b), pytest.raises(IOError):
+        cs.sync_s3_prefix(url, str(target), max_attempts=1)
 
-def test_untar_directory():
-    with patch('container_support.utils.open', create=True) as mocked_open, patch('tarfile.open') as mocked_tarfile:
-        cs.untar_directory('a/b/c', 'd/e/f')
-        assert call('a/b/c', 'rb') in mocked_open.mock_calls
-        assert call().__enter__().extractall(path='d/e/f') in mocked_tarfile.mock_calls
+    assert os.listdir(str(target)) == ['a.bin']
+    assert tmpdir.join('.target.sagemaker-sync-manifest.json').check()
+    assert cs.sync_s3_prefix(url, str(target))['downloaded'] == 1